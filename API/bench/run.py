@@ -0,0 +1,371 @@
+# Load and latency benchmark for the Green Spaces Accessibility API
+# Replays a fixed, seeded request mix against a running API (seeded with API/bench/seed.py) at a
+# given concurrency, first one endpoint at a time and then all of them interleaved. Reports
+# throughput, p50/p95/p99 latency and DB time (from pg_stat_statements) per endpoint, writes
+# the results as JSON and can compare them against an earlier run to flag regressions.
+#
+# Usage: python -m API.bench.run --url http://localhost:8000 --requests 500 --concurrency 16
+#        python -m API.bench.run --compare bench_results/baseline.json
+
+# importing necessary libraries
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+import numpy as np
+import psycopg
+
+# Same as DEFAULT_BBOX in ETL/synthetic.py (south, west, north, east)
+DEFAULT_BBOX = (38.72, -9.16, 38.74, -9.14)
+
+# Number of fixed locations most requests are drawn from (repeat visitors, shared links)
+HOTSPOTS = 200
+
+# A result is flagged when p95 latency grows, or throughput drops, by more than this share
+DEFAULT_THRESHOLD = 0.10
+
+DB_TIME_QUERY = """
+    SELECT COALESCE(SUM(calls), 0), COALESCE(SUM(total_exec_time), 0)
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND query NOT LIKE '%pg_stat_statements%';
+"""
+
+
+class Workload:
+    """
+    Deterministic source of request locations: most come from a fixed set of
+    hotspots (so result caches see realistic repeats), the rest are uniform.
+    """
+
+    def __init__(self, bbox, seed):
+        self.bbox = bbox
+        self.rng = random.Random(seed)
+        self.hotspots = [self._uniform() for _ in range(HOTSPOTS)]
+
+    def _uniform(self):
+        south, west, north, east = self.bbox
+        return round(self.rng.uniform(south, north), 6), round(self.rng.uniform(west, east), 6)
+
+    def point(self):
+        return self.rng.choice(self.hotspots) if self.rng.random() < 0.7 else self._uniform()
+
+    def feedback(self):
+        lat, lon = self.point()
+        return {
+            "lat": lat,
+            "lon": lon,
+            "liked": self.rng.random() < 0.7,
+            "accessibility_score": round(self.rng.uniform(0, 100), 2),
+            "proximity_score": round(self.rng.uniform(0, 100), 2),
+            "quantity_score": round(self.rng.uniform(0, 100), 2),
+            "area_score": round(self.rng.uniform(0, 100), 2),
+            "diversity_score": round(self.rng.uniform(0, 100), 2),
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+        }
+
+
+# Request builders, one per benchmarked endpoint: workload -> (method, path, httpx kwargs)
+def _green_area(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/green-area", {"params": {"lat": lat, "lon": lon}}
+
+
+def _green_area_buffer(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/green-area-buffer", {"params": {"lat": lat, "lon": lon, "buffer_m": w.rng.choice([300, 500, 1000])}}
+
+
+def _green_area_buffer_geojson(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/green-area-buffer", {"params": {"lat": lat, "lon": lon, "buffer_m": 500, "format": "geojson"}}
+
+
+def _nearest(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/green-areas/nearest", {"params": {"lat": lat, "lon": lon, "k": w.rng.choice([5, 10, 20])}}
+
+
+def _score(mode, detail):
+    def build(w):
+        lat, lon = w.point()
+        params = {"lat": lat, "lon": lon, "mode": mode, "geometry_detail": detail}
+        return "GET", "/api/v1/accessibility/accessibility-score", {"params": params}
+    return build
+
+
+def _score_batch(w):
+    points = [dict(zip(("lat", "lon"), w.point())) for _ in range(100)]
+    return "POST", "/api/v1/accessibility/accessibility-score/batch", {"json": {"points": points}}
+
+
+def _heatmap(w):
+    lat, lon = w.point()
+    params = {"south": lat - 0.005, "west": lon - 0.005, "north": lat + 0.005, "east": lon + 0.005}
+    return "GET", "/api/v1/accessibility/heatmap", {"params": params}
+
+
+def _route(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/routing/to-nearest-park", {"params": {"lat": lat, "lon": lon}}
+
+
+def _isochrone(w):
+    lat, lon = w.point()
+    return "GET", "/api/v1/routing/isochrone", {"params": {"lat": lat, "lon": lon, "minutes": [5, 10]}}
+
+
+def _feedback(w):
+    return "POST", "/api/v1/feedback/", {"json": w.feedback()}
+
+
+def _feedback_bulk(w):
+    return "POST", "/api/v1/feedback/bulk", {"json": [w.feedback() for _ in range(50)]}
+
+
+def _tile(w):
+    lat, lon = w.point()
+    z = w.rng.choice([13, 14, 15, 16])
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n)
+    return "GET", f"/api/v1/tiles/{z}/{x}/{y}.mvt", {}
+
+
+ENDPOINTS = {
+    "spatial.green_area": _green_area,
+    "spatial.green_area_buffer": _green_area_buffer,
+    "spatial.green_area_buffer_geojson": _green_area_buffer_geojson,
+    "spatial.nearest": _nearest,
+    "accessibility.score_live": _score("live", "medium"),
+    "accessibility.score_grid": _score("grid", "none"),
+    "accessibility.score_network": _score("network", "low"),
+    "accessibility.batch": _score_batch,
+    "accessibility.heatmap": _heatmap,
+    "routing.to_nearest_park": _route,
+    "routing.isochrone": _isochrone,
+    "feedback.post": _feedback,
+    "feedback.bulk": _feedback_bulk,
+    "tiles.tile": _tile,
+}
+
+# Request mixes (relative weights per endpoint)
+MIXES = {
+    "default": {
+        "spatial.green_area": 25,
+        "spatial.green_area_buffer": 10,
+        "spatial.green_area_buffer_geojson": 2,
+        "spatial.nearest": 8,
+        "accessibility.score_live": 12,
+        "accessibility.score_grid": 10,
+        "accessibility.score_network": 5,
+        "accessibility.batch": 1,
+        "accessibility.heatmap": 3,
+        "routing.to_nearest_park": 8,
+        "routing.isochrone": 2,
+        "feedback.post": 6,
+        "feedback.bulk": 1,
+        "tiles.tile": 7,
+    },
+    "map": {
+        "tiles.tile": 60,
+        "accessibility.heatmap": 15,
+        "spatial.green_area": 15,
+        "accessibility.score_grid": 10,
+    },
+    "campaign": {
+        "feedback.post": 60,
+        "feedback.bulk": 5,
+        "accessibility.score_live": 20,
+        "routing.to_nearest_park": 15,
+    },
+}
+
+
+class DbTime:
+    """
+    Execution time and calls of all statements in the benchmark database,
+    read from pg_stat_statements before and after each phase.
+    """
+
+    def __init__(self, database_url):
+        self.conn = psycopg.connect(database_url, autocommit=True)
+
+    def snapshot(self):
+        return self.conn.execute(DB_TIME_QUERY).fetchone()
+
+    def close(self):
+        self.conn.close()
+
+
+def summarize(samples, wall_s, db=None):
+    """
+    Throughput and latency percentiles of (latency_s, ok) samples.
+    """
+    latencies = np.array([s[0] for s in samples]) * 1000
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not s[1]),
+        "throughput_rps": round(len(samples) / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": round(float(latencies.mean()), 2) if len(latencies) else None,
+    }
+    for q in (50, 95, 99):
+        summary[f"p{q}_ms"] = round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+    if db is not None:
+        summary["db_calls"] = int(db[0])
+        summary["db_time_ms"] = round(float(db[1]), 2)
+    return summary
+
+
+async def replay(client, requests, concurrency):
+    """
+    Sends `requests` (name, method, path, kwargs) with `concurrency` workers.
+    Returns {name: [(latency_s, ok)]} and the wall time.
+    """
+    samples = {}
+    pending = iter(requests)
+
+    async def worker():
+        for name, method, path, kwargs in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.setdefault(name, []).append((time.perf_counter() - start, ok))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+async def run_phase(client, workload, weights, n_requests, concurrency, warmup, db):
+    names = list(weights)
+    picks = workload.rng.choices(names, weights=[weights[n] for n in names], k=warmup + n_requests)
+    requests = [(name, *ENDPOINTS[name](workload)) for name in picks]
+
+    await replay(client, requests[:warmup], concurrency)
+    before = db.snapshot() if db else None
+    samples, wall_s = await replay(client, requests[warmup:], concurrency)
+    after = db.snapshot() if db else None
+    db_delta = (after[0] - before[0], after[1] - before[1]) if db else None
+    return samples, wall_s, db_delta
+
+
+async def benchmark(args):
+    workload = Workload(DEFAULT_BBOX, args.seed)
+    weights = MIXES[args.mix]
+    db = DbTime(args.database_url) if args.database_url else None
+    results = {"isolated": {}, "mix": {}}
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        try:
+            # One endpoint at a time: DB time can only be attributed this way
+            if not args.skip_isolated:
+                for name in weights:
+                    samples, wall_s, db_delta = await run_phase(
+                        client, workload, {name: 1}, args.requests, args.concurrency, args.warmup, db
+                    )
+                    results["isolated"][name] = summarize(samples.get(name, []), wall_s, db_delta)
+                    print_row(name, results["isolated"][name])
+
+            # All endpoints interleaved by weight, like real traffic
+            samples, wall_s, db_delta = await run_phase(
+                client, workload, weights, args.requests * len(weights), args.concurrency, args.warmup, db
+            )
+            results["mix"]["overall"] = summarize([s for v in samples.values() for s in v], wall_s, db_delta)
+            results["mix"]["endpoints"] = {name: summarize(v, wall_s) for name, v in sorted(samples.items())}
+            print_row(f"mix:{args.mix}", results["mix"]["overall"])
+        finally:
+            if db:
+                db.close()
+    return results
+
+
+def print_row(name, s):
+    db = f"  db {s['db_time_ms']:>9.1f} ms" if "db_time_ms" in s else ""
+    print(f"{name:<36} {s['throughput_rps'] or 0:>8.1f} req/s  p50 {s['p50_ms'] or 0:>7.1f}  "
+          f"p95 {s['p95_ms'] or 0:>7.1f}  p99 {s['p99_ms'] or 0:>7.1f} ms  errors {s['errors']}{db}")
+
+
+def compare(results, baseline, threshold):
+    """
+    Lists the endpoints whose p95 latency grew, or throughput dropped, by
+    more than `threshold` compared with `baseline`.
+    """
+    current = dict(results["isolated"], **{"mix:overall": results["mix"].get("overall")})
+    previous = dict(baseline.get("isolated", {}), **{"mix:overall": baseline.get("mix", {}).get("overall")})
+    regressions = []
+    for name, now in current.items():
+        before = previous.get(name)
+        if not now or not before:
+            continue
+        if before.get("p95_ms") and now.get("p95_ms") and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms")
+        if before.get("throughput_rps") and now.get("throughput_rps") and now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {now['throughput_rps']} req/s")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a running API seeded with API/bench/seed.py")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the request sequence")
+    parser.add_argument("--skip-isolated", action="store_true", help="only run the interleaved mix")
+    parser.add_argument("--output", help="results file (default bench_results/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    # DB time is read from the same database the API uses; unset it to skip
+    args.database_url = os.environ.get("DATABASE_URL")
+
+    started = datetime.now(timezone.utc)
+    results = asyncio.run(benchmark(args))
+    results["meta"] = {
+        "started_at": started.isoformat(),
+        "revision": git_revision(),
+        "url": args.url,
+        "mix": args.mix,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+    }
+
+    output = args.output or os.path.join("bench_results", started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Benchmark database seeding for the Green Spaces Accessibility API
+# Loads a fixed synthetic city (ETL/synthetic.py) into the database at DATABASE_URL through the
+# regular ETL transform and load steps, so every benchmark run sees exactly the same data.
+# Point it at a local PostGIS/pgRouting instance, never at production: the tables are truncated.
+#
+# Usage: python -m API.bench.seed --schema
+
+# importing necessary libraries
+import argparse
+import os
+import sys
+from sqlalchemy import create_engine, text
+
+# The ETL is not a package: make `synthetic` and `src.pipeline` importable like `python ETL/main.py` does
+ETL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ETL")
+sys.path.insert(0, ETL_DIR)
+
+import synthetic  # noqa: E402
+import src.pipeline as p  # noqa: E402
+import src.helpers as h  # noqa: E402
+
+SCHEMA_PATH = os.path.join(ETL_DIR, "sql", "schema.sql")
+TARGET_TABLES = ["types", "green_areas", "ways", "vertices", "park_vertices"]
+GRID_TABLES = ["accessibility_grid_meta", "accessibility_grid"]
+
+
+def seed(database_url, seed, n_areas, spacing_m, apply_schema):
+    engine = create_engine(database_url)
+
+    if apply_schema:
+        with open(SCHEMA_PATH) as f:
+            schema = f.read()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(schema)
+        h.info("SEED: Applied ETL/sql/schema.sql")
+
+    # Per-statement DB time for the benchmark (needs shared_preload_libraries = 'pg_stat_statements')
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_stat_statements;"))
+    except Exception as e:
+        h.info(f"SEED: pg_stat_statements unavailable, DB time will not be reported ({e})")
+
+    green_areas_data, routing_data = synthetic.generate_city(
+        synthetic.DEFAULT_BBOX, n_areas=n_areas, spacing_m=spacing_m, seed=seed
+    )
+    dfs = list(p.transform_green_areas_data(green_areas_data))
+    dfs.extend(p.transform_routing_data(routing_data))
+    dfs[3], park_vertices_df = p.transform_nearest_park_data(*dfs[1:4])
+    dfs.append(park_vertices_df)
+
+    p.truncate_tables(engine, TARGET_TABLES + GRID_TABLES + ["feedback"])
+    for df, table in zip(dfs, TARGET_TABLES):
+        p.load_data(engine, df, table)
+
+    meta_df, grid_gdf = p.build_score_grid(types_df=dfs[0], ga_gdf=dfs[1], bbox=synthetic.DEFAULT_BBOX)
+    p.load_data(engine, meta_df, GRID_TABLES[0])
+    p.load_data(engine, grid_gdf, GRID_TABLES[1])
+    p.publish_dataset_version(engine)
+    engine.dispose()
+    h.done(f"SEED: Loaded {len(dfs[1])} green areas, {len(dfs[2])} ways and {len(grid_gdf)} grid cells")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the fixed benchmark dataset into DATABASE_URL")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic city")
+    parser.add_argument("--areas", type=int, default=200, help="number of generated green areas")
+    parser.add_argument("--spacing", type=float, default=100, help="street grid spacing in metres")
+    parser.add_argument("--schema", action="store_true", help="(re)create the schema first")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        parser.error("DATABASE_URL environment variable not found")
+    seed(database_url, args.seed, args.areas, args.spacing, args.schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# In-process result cache for the Green Spaces Accessibility API
+# Spatial and scoring endpoints are cached on a snapped coordinate plus their other parameters.
+# Entries belong to a dataset version and are dropped when the ETL publishes a new one, except the
+# entries with known bounds outside the areas an incremental ETL run changed.
+
+# importing necessary libraries
+import functools
+import math
+import os
+import time
+from collections import OrderedDict
+from API.dataset import dataset_changes, dataset_version
+from API.responses import encode_json, encoded_json_response
+
+# Cache settings, overridable from the environment
+CACHE_PRECISION = int(os.environ.get("GSA_CACHE_PRECISION", 4))                # decimals kept when snapping lat/lon (4 ~ 11 m)
+CACHE_MAX_ENTRIES = int(os.environ.get("GSA_CACHE_MAX_ENTRIES", 10000))
+CACHE_MAX_BYTES = int(os.environ.get("GSA_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # approximate, from the size of each encoded entry
+CACHE_TTL = float(os.environ.get("GSA_CACHE_TTL", 600))                          # seconds
+# Added to the search radius of a cached point result when checking it against changed areas,
+# covers e.g. the route to the nearest park (longer routes can stay stale until the TTL)
+CACHE_CHANGE_MARGIN_M = float(os.environ.get("GSA_CACHE_CHANGE_MARGIN_M", 1000))
+
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    LRU cache bounded by entry count and approximate memory, with a TTL and
+    hit/miss counters. The cache holds the entries of one dataset version and
+    only advance() moves it to another one, keeping the entries whose bounds lie
+    outside the changed areas. get() and set() for any other version (e.g. a
+    request that started before the move) miss and store nothing.
+    """
+
+    # Returned by get() when there is no valid entry (None is a cacheable value)
+    MISSING = _MISSING
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Size of a value; values are stored encoded (bytes), so their length by default
+        self.sizeof = sizeof or len
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.carried_over = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, bounds)
+
+    def get(self, key, version):
+        entry = self._entries.get(key) if version == self.version else None
+        if entry is None or entry[2] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, version, value, bounds=None):
+        """
+        `bounds` ((west, south, east, north), layers) is the area and the dataset
+        layers (None for all) the value depends on; entries without bounds are
+        dropped on any dataset change. Values computed for a version other than
+        the cache's are dropped.
+        """
+        if version != self.version:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl, bounds)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def advance(self, version):
+        """
+        Moves the cache to `version`, dropping only the entries that may depend
+        on what changed since the cached version (everything when that is unknown).
+        """
+        if version == self.version:
+            return
+        previous = self.version
+        changes = await dataset_changes(previous, version) if self._entries else None
+        if self.version != previous:
+            # Another request moved the cache while the changes were read
+            return
+        if changes is None:
+            self.clear()
+        else:
+            stale = [key for key, entry in self._entries.items() if _touched(entry[3], changes)]
+            for key in stale:
+                self._drop(key)
+            self.carried_over += len(self._entries)
+        self.version = version
+
+    def _drop(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "carried_over": self.carried_over,
+        }
+
+
+def _touched(bounds, changes):
+    # True when an entry may depend on one of the changed (layer, bbox) areas
+    if bounds is None:
+        return True
+    (west, south, east, north), layers = bounds
+    return any(
+        (layers is None or layer in layers)
+        and box[0] <= east and west <= box[2] and box[1] <= north and south <= box[3]
+        for layer, box in changes
+    )
+
+
+def point_bounds(lat: float, lon: float, radius_m: float):
+    """
+    (west, south, east, north) box around a point, `radius_m` metres each way.
+    """
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+    return (lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+
+
+# Shared cache used by the routers
+result_cache = ResultCache()
+
+
+def snap(value: float) -> float:
+    """
+    Rounds a coordinate to CACHE_PRECISION decimals.
+    """
+    return round(value, CACHE_PRECISION)
+
+
+def cached(func=None, *, radius=None):
+    """
+    Caches an async endpoint taking `lat` and `lon`. The coordinates are snapped
+    before the call so every request in the same snapped cell gets the same answer.
+    The content is encoded to JSON once, cached as bytes and sent as-is on hits.
+
+    `radius(**kwargs)` is how far from the point (metres) the result can depend
+    on the data, or None when unbounded; results with a radius survive dataset
+    updates that change nothing within radius + CACHE_CHANGE_MARGIN_M.
+    """
+    if func is None:
+        return functools.partial(cached, radius=radius)
+
+    @functools.wraps(func)
+    async def wrapper(lat: float, lon: float, **kwargs):
+        lat, lon = snap(lat), snap(lon)
+        version = await dataset_version()
+        await result_cache.advance(version)
+        key = (func.__name__, lat, lon, tuple(sorted(kwargs.items())))
+        body = result_cache.get(key, version)
+        if body is _MISSING:
+            body = encode_json(await func(lat=lat, lon=lon, **kwargs))
+            reach = radius(**kwargs) if radius else None
+            bounds = (point_bounds(lat, lon, reach + CACHE_CHANGE_MARGIN_M), None) if reach is not None else None
+            result_cache.set(key, version, body, bounds)
+        return encoded_json_response(body)
+    return wrapper
@@ -0,0 +1,114 @@
+# Dataset version tracking for the Green Spaces Accessibility API
+# The ETL writes a new version to the `dataset_version` table every time it publishes data;
+# anything cached in the API is tied to that version and dropped when it changes. Incremental
+# ETL runs also record the areas they touched (`dataset_changes`), so caches can keep the rest.
+
+# importing necessary libraries
+import asyncio
+import os
+import time
+from API.db import fetch_all, fetch_one
+
+# Seconds between two checks of the published dataset version
+VERSION_CHECK_INTERVAL = float(os.environ.get("GSA_VERSION_CHECK_INTERVAL", 30))
+
+# Incremental runs followed back when looking for what changed since a cached version
+MAX_CHANGE_CHAIN = 20
+
+VERSION_QUERY = """
+    SELECT version
+    FROM dataset_version
+    WHERE id = 1;
+"""
+
+CHANGES_QUERY = """
+    SELECT previous_version, layer, ST_XMin(bbox), ST_YMin(bbox), ST_XMax(bbox), ST_YMax(bbox)
+    FROM dataset_changes
+    WHERE version = %(version)s;
+"""
+
+_version = None
+_checked_at = float("-inf")
+
+
+async def dataset_version():
+    """
+    Returns the version published by the last ETL run (None if there is none yet).
+    The database is asked at most once every VERSION_CHECK_INTERVAL seconds.
+    """
+    global _version, _checked_at
+    now = time.monotonic()
+    if now - _checked_at >= VERSION_CHECK_INTERVAL:
+        _checked_at = now
+        row = await fetch_one(VERSION_QUERY)
+        _version = row[0] if row else None
+    return _version
+
+
+async def dataset_changes(old, new):
+    """
+    Areas changed between two dataset versions, as (layer, (west, south, east, north))
+    pairs, following the incremental ETL runs from `new` back to `old`. Returns
+    None when they are unknown: a full reload in between, or more than
+    MAX_CHANGE_CHAIN runs apart.
+    """
+    if old is None or new is None:
+        return None
+    changes = []
+    version = new
+    for _ in range(MAX_CHANGE_CHAIN):
+        if version == old:
+            return changes
+        rows = await fetch_all(CHANGES_QUERY, {"version": version})
+        if not rows:
+            return None
+        version = rows[0][0]
+        # A run that changed nothing has a single row without bbox
+        changes += [(layer, tuple(box)) for _, layer, *box in rows if box[0] is not None]
+    return changes if version == old else None
+
+
+class VersionedResource:
+    """
+    Something built from the database once and rebuilt when the dataset version
+    changes (e.g. the in-memory routing graph). The first call loads it; after a
+    version change the old value keeps being served while the new one is built in
+    the background, then it is swapped in atomically.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = None
+        self._version = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._reload_task = None
+
+    async def _load(self, version):
+        value = await self._loader()
+        self._value, self._version, self._loaded = value, version, True
+        return value
+
+    async def _reload(self, version):
+        try:
+            await self._load(version)
+        finally:
+            self._reload_task = None
+
+    async def get(self):
+        version = await dataset_version()
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    return await self._load(version)
+        elif version != self._version and self._reload_task is None:
+            self._reload_task = asyncio.create_task(self._reload(version))
+        return self._value
+
+    async def get_versioned(self):
+        """
+        Like get(), with the dataset version the returned value was built from
+        (the previous one while a reload is in progress).
+        """
+        value = await self.get()
+        return value, self._version
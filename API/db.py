@@ -1,25 +1,135 @@
 # Database connection module for the Green Spaces Accessibility API
 
 import os
-import psycopg
+import time
+from contextlib import asynccontextmanager
+from psycopg import AsyncCursor
+from psycopg_pool import AsyncConnectionPool
+from API.metrics import record, record_query
 
 # Load the full connection URL from environment variable
 #DATABASE_URL = os.environ.get("DATABASE_URL")
 
-def get_connection():
+# Pool sizing and recycling, overridable from the environment
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300))          # seconds before an idle connection is closed
+POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 3600)) # seconds before a connection is recycled
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))             # seconds to wait for a free connection
+
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_ITERSIZE = int(os.environ.get("DB_STREAM_ITERSIZE", 500))
+
+# Shared pool, created and closed by the app lifespan in API/main.py
+_pool = None
+
+
+class TimedCursor(AsyncCursor):
     """
-    Returns a new connection to the Postgres database using the
-    DATABASE_URL environment variable.
+    Cursor reporting every executed query to API/metrics.py (request `db`
+    time, per-endpoint counters and the slow-query log).
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(query, params, time.perf_counter() - start)
+
+
+async def open_pool():
     """
+    Creates the shared async connection pool using the DATABASE_URL
+    environment variable. Called once when the app starts.
+    """
+    global _pool
     database_url = os.environ.get("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL environment variable not found")
 
-    # Connect using psycopg (psycopg3)
     # sslmode is already included in the URL, so no need to pass separately
     try:
-        conn = psycopg.connect(database_url)
-        return conn
+        _pool = AsyncConnectionPool(
+            database_url,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            max_idle=POOL_MAX_IDLE,
+            max_lifetime=POOL_MAX_LIFETIME,
+            timeout=POOL_TIMEOUT,
+            # Health check: connections are tested before being handed out
+            check=AsyncConnectionPool.check_connection,
+            kwargs={"cursor_factory": TimedCursor},
+            open=False,
+        )
+        await _pool.open(wait=True)
     except Exception as e:
         # Optional: wrap with a clear error for Render logs
-        raise RuntimeError(f"Failed to connect to DB: {e}") from e
\ No newline at end of file
+        _pool = None
+        raise RuntimeError(f"Failed to connect to DB: {e}") from e
+    return _pool
+
+
+async def close_pool():
+    """
+    Closes the shared connection pool. Called once when the app shuts down.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def get_connection():
+    """
+    Borrows an async connection from the shared pool. Use it as an async
+    context manager: the connection is returned to the pool (committed,
+    or rolled back on error) when the block exits. The wait for a free
+    connection is timed as the `db_connect` phase of the request.
+    """
+    if _pool is None:
+        raise RuntimeError("Connection pool is not open")
+    start = time.perf_counter()
+    async with _pool.connection() as conn:
+        record("db_connect", time.perf_counter() - start)
+        yield conn
+
+
+async def fetch_one(query, params=None):
+    """
+    Runs a read query on a pooled connection and returns the first row.
+    Safe to call concurrently from any router.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            return await cur.fetchone()
+
+
+async def fetch_all(query, params=None):
+    """
+    Runs a read query on a pooled connection and returns all rows.
+    Safe to call concurrently from any router.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            return await cur.fetchall()
+
+
+async def stream_column(query, params=None):
+    """
+    Yields the first column of every row from a server-side cursor, so large
+    results are never held in memory at once. The pooled connection is kept
+    until the iteration ends.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor(name="gsa_stream") as cur:
+            cur.itersize = STREAM_ITERSIZE
+            # Server-side cursors don't go through TimedCursor
+            start = time.perf_counter()
+            await cur.execute(query, params)
+            record_query(query, params, time.perf_counter() - start)
+            async for row in cur:
+                yield row[0]
@@ -0,0 +1,218 @@
+# Write-behind feedback ingestion for the Green Spaces Accessibility API
+# Feedback is acknowledged as soon as it is queued in memory; a background task writes the queue
+# to the database in batches with COPY, so a burst of submissions costs a few transactions instead
+# of one connection and one commit per thumbs-up.
+
+# importing necessary libraries
+import asyncio
+import logging
+import os
+from collections import deque
+from API.db import get_connection
+
+# Ingestion settings, overridable from the environment
+FEEDBACK_QUEUE_SIZE = int(os.environ.get("GSA_FEEDBACK_QUEUE_SIZE", 10000))         # rows held in memory at most
+FEEDBACK_BATCH_SIZE = int(os.environ.get("GSA_FEEDBACK_BATCH_SIZE", 500))           # flush as soon as this many rows are queued
+FEEDBACK_FLUSH_INTERVAL = float(os.environ.get("GSA_FEEDBACK_FLUSH_INTERVAL", 1.0))  # seconds, flush at least this often
+FEEDBACK_ENQUEUE_TIMEOUT = float(os.environ.get("GSA_FEEDBACK_ENQUEUE_TIMEOUT", 0.5))  # seconds to wait for room before giving up
+FEEDBACK_DURABILITY = os.environ.get("GSA_FEEDBACK_DURABILITY", "ack")              # "ack" (on enqueue) or "commit"
+
+# Order of the values in a queued row
+FEEDBACK_COLUMNS = (
+    "uuid",
+    "lat",
+    "lon",
+    "liked",
+    "accessibility_score",
+    "proximity_score",
+    "quantity_score",
+    "area_score",
+    "diversity_score",
+    "timestamp",
+)
+
+CREATE_STAGING_QUERY = """
+    CREATE TEMP TABLE feedback_incoming (
+        uuid UUID,
+        lat FLOAT,
+        lon FLOAT,
+        liked BOOLEAN,
+        accessibility_score FLOAT,
+        proximity_score FLOAT,
+        quantity_score FLOAT,
+        area_score FLOAT,
+        diversity_score FLOAT,
+        timestamp TIMESTAMP
+    ) ON COMMIT DROP;
+"""
+
+COPY_QUERY = f"COPY feedback_incoming ({', '.join(FEEDBACK_COLUMNS)}) FROM STDIN"
+
+# Retried batches and client-supplied ids make the same uuid show up twice; the first one wins
+MERGE_QUERY = f"""
+    INSERT INTO feedback ({', '.join(FEEDBACK_COLUMNS)})
+    SELECT {', '.join(FEEDBACK_COLUMNS)}
+    FROM feedback_incoming
+    ON CONFLICT (uuid) DO NOTHING;
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """
+    Raised when there is no room in the queue within the enqueue timeout.
+    """
+
+
+class FeedbackWriter:
+    """
+    Bounded in-memory queue of feedback rows with a background flush task.
+    Rows are written when FEEDBACK_BATCH_SIZE are waiting or every
+    FEEDBACK_FLUSH_INTERVAL seconds, whichever comes first.
+    """
+
+    def __init__(self, max_rows=FEEDBACK_QUEUE_SIZE, batch_size=FEEDBACK_BATCH_SIZE,
+                 flush_interval=FEEDBACK_FLUSH_INTERVAL, enqueue_timeout=FEEDBACK_ENQUEUE_TIMEOUT):
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self._entries = deque()  # (rows, future or None), one per submit() call
+        self._pending = 0        # rows in _entries
+        self._room = asyncio.Condition()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops the background task and writes whatever is still queued.
+        """
+        if self._task is not None:
+            # Let a flush in progress finish rather than cancelling it halfway through
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        while self._entries:
+            if not await self.flush():
+                logger.error("Dropping %d queued feedback rows on shutdown", self._pending)
+                break
+
+    async def submit(self, rows, wait_for_commit=False):
+        """
+        Queues feedback rows (tuples in FEEDBACK_COLUMNS order). All rows of a
+        call are queued together or not at all. Raises QueueFullError when the
+        queue has no room for them within the enqueue timeout. With
+        `wait_for_commit`, returns only once the rows are committed.
+        """
+        if len(rows) > self.max_rows:
+            raise QueueFullError(f"At most {self.max_rows} rows can be queued at once")
+        future = asyncio.get_running_loop().create_future() if wait_for_commit else None
+
+        async with self._room:
+            try:
+                await asyncio.wait_for(
+                    self._room.wait_for(lambda: self._pending + len(rows) <= self.max_rows),
+                    self.enqueue_timeout,
+                )
+            except asyncio.TimeoutError:
+                raise QueueFullError("Feedback queue is full") from None
+            self._entries.append((rows, future))
+            self._pending += len(rows)
+
+        if self._pending >= self.batch_size:
+            self._wake.set()
+        if future is not None:
+            await future
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """
+        Writes every queued row in one transaction: COPY into a temporary
+        table, then INSERT ... ON CONFLICT into feedback. Returns False if the
+        write failed; rows acknowledged on enqueue are then queued again for the
+        next flush, as long as they fit in `max_rows` (the rest are dropped and
+        counted), while callers waiting for the commit get the error.
+        """
+        async with self._flush_lock:
+            if not self._entries:
+                return True
+            async with self._room:
+                entries = list(self._entries)
+                self._entries.clear()
+                self._pending = 0
+                self._room.notify_all()
+
+            rows = [row for batch, _ in entries for row in batch]
+            try:
+                async with get_connection() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(CREATE_STAGING_QUERY)
+                        async with cur.copy(COPY_QUERY) as copy:
+                            for row in rows:
+                                await copy.write_row(row)
+                        await cur.execute(MERGE_QUERY)
+                    await conn.commit()
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.exception("Failed to write %d feedback rows", len(rows))
+                retry = []
+                for batch, future in entries:
+                    if future is None:
+                        retry.append((batch, None))
+                    elif not future.done():
+                        future.set_exception(e)
+                async with self._room:
+                    # Same bound as submit(): rows queued during the flush keep their place,
+                    # the oldest failed batches take the room left and the rest are dropped
+                    room = self.max_rows - self._pending
+                    kept = []
+                    for batch, future in retry:
+                        if len(batch) > room:
+                            break
+                        kept.append((batch, future))
+                        room -= len(batch)
+                    dropped = sum(len(batch) for batch, _ in retry[len(kept):])
+                    self._entries.extendleft(reversed(kept))
+                    self._pending += sum(len(batch) for batch, _ in kept)
+                if dropped:
+                    self.dropped += dropped
+                    logger.error("Dropping %d feedback rows, no room left in the queue to retry them", dropped)
+                return False
+
+            self.written += len(rows)
+            for _, future in entries:
+                if future is not None and not future.done():
+                    future.set_result(None)
+            return True
+
+    def stats(self):
+        return {
+            "queued": self._pending,
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
+
+
+# Shared writer, started and stopped by the app lifespan in API/main.py
+feedback_writer = FeedbackWriter()
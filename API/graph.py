@@ -0,0 +1,338 @@
+# In-memory routing graph for the Green Spaces Accessibility API
+# The `ways`/`vertices` tables are loaded once into a compact CSR adjacency (NumPy arrays)
+# and shortest paths are computed in-process with A*, instead of pgr_dijkstra rebuilding
+# the whole graph on every request. The graph is rebuilt when the dataset version changes.
+
+# importing necessary libraries
+import asyncio
+import heapq
+import json
+import math
+import numpy as np
+from API.dataset import VersionedResource
+from API.db import get_connection
+
+# Spherical mercator radius used by EPSG:3857
+EARTH_RADIUS_M = 6378137.0
+
+VERTICES_QUERY = """
+    SELECT id, ST_X(geometry), ST_Y(geometry), park_distance_m, park_id, pred_edge
+    FROM vertices
+    ORDER BY id;
+"""
+
+PARKS_QUERY = """
+    SELECT g.id, g.name, g.area_m2, t.type
+    FROM green_areas g
+    LEFT JOIN types t
+        ON g.type_id = t.id
+    ORDER BY g.id;
+"""
+
+PARK_VERTICES_QUERY = """
+    SELECT park_id, vertex_id, offset_m
+    FROM park_vertices;
+"""
+
+WAYS_QUERY = """
+    SELECT id, source, target, cost, reverse_cost, length_m, ST_AsGeoJSON(geometry)
+    FROM ways
+    ORDER BY id;
+"""
+
+
+def _undirected_cost(cost, reverse_cost):
+    # Undirected like pgr_dijkstra(directed := false): cheapest valid direction
+    valid = [c for c in (cost, reverse_cost) if c is not None and c >= 0]
+    return min(valid) if valid else math.inf
+
+
+class RoutingGraph:
+    """
+    Undirected walking graph stored as CSR arrays.
+
+    Vertices are addressed by their position in the arrays (`index` maps
+    vertices.id to it). For every vertex, `indptr[v]:indptr[v + 1]` slices
+    `neighbors`, `weights` and `edges` (the position of the way in the edge arrays).
+    Edge geometries are kept as one flat coordinate array plus offsets.
+
+    When the ETL precomputed the walk to the nearest park, `park_id` and
+    `pred_edge` (edge position, -1 if none) hold it per vertex. Parks are kept as
+    arrays (`park_ids`, `park_areas`, `park_types`, `park_names`) together with
+    their access points (`access_park`, `access_vertex`, `access_offset`).
+    """
+
+    def __init__(self, vertex_ids, vertex_lonlat, edge_ids, sources, targets, costs, lengths, coords, coord_offsets,
+                 park_id=None, pred_edge=None, parks=(), park_access=()):
+        self.vertex_ids = vertex_ids
+        self.vertex_lonlat = vertex_lonlat
+        self.index = {int(vid): i for i, vid in enumerate(vertex_ids)}
+        self.edge_ids = edge_ids
+        self.sources = sources
+        self.targets = targets
+        self.lengths = lengths
+        self.coords = coords
+        self.coord_offsets = coord_offsets
+        self.park_id = park_id if park_id is not None else np.full(len(vertex_ids), -1, dtype=np.int64)
+        self.pred_edge = pred_edge if pred_edge is not None else np.full(len(vertex_ids), -1, dtype=np.int64)
+
+        self.park_ids = np.array([p[0] for p in parks], dtype=np.int64)
+        self.park_names = {p[0]: p[1] for p in parks}
+        self.park_areas = np.array([p[2] or 0.0 for p in parks], dtype=np.float64)
+        self.park_types = [p[3] for p in parks]
+        park_position = {pid: i for i, pid in enumerate(self.park_ids.tolist())}
+        park_access = [a for a in park_access if a[0] in park_position and a[1] in self.index]
+        self.access_park = np.array([park_position[a[0]] for a in park_access], dtype=np.int64)
+        self.access_vertex = np.array([self.index[a[1]] for a in park_access], dtype=np.int64)
+        self.access_offset = np.array([a[2] or 0.0 for a in park_access], dtype=np.float64)
+        # (park id, vertex position) of every access point: where a precomputed walk must end
+        self._access_points = {(a[0], self.index[a[1]]) for a in park_access}
+
+        # Both directions of every way, sorted by origin vertex
+        origin = np.concatenate([sources, targets])
+        order = np.argsort(origin, kind="stable")
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(origin, minlength=len(vertex_ids)))])
+        self.neighbors = np.concatenate([targets, sources])[order]
+        self.weights = np.concatenate([costs, costs])[order]
+        self.edges = np.concatenate([np.arange(len(edge_ids))] * 2)[order]
+
+        # EPSG:3857 positions for the A* heuristic. It is scaled by the smallest
+        # cost / straight-line ratio of any way so it never overestimates.
+        lon = np.radians(vertex_lonlat[:, 0])
+        lat = np.radians(vertex_lonlat[:, 1])
+        self.xy = np.column_stack([
+            EARTH_RADIUS_M * lon,
+            EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + lat / 2)),
+        ])
+        chord = np.hypot(*(self.xy[sources] - self.xy[targets]).T)
+        usable = (chord > 0) & np.isfinite(costs)
+        ratio = costs[usable] / chord[usable]
+        self.heuristic_scale = float(min(1.0, ratio.min())) if len(ratio) else 0.0
+
+        # Plain lists are much faster than NumPy scalars inside the search loop
+        self._indptr = self.indptr.tolist()
+        self._neighbors = self.neighbors.tolist()
+        self._weights = self.weights.tolist()
+        self._edges = self.edges.tolist()
+        self._xy = self.xy.tolist()
+        self._sources = sources.tolist()
+        self._targets = targets.tolist()
+        self._pred_edge = self.pred_edge.tolist()
+
+    @classmethod
+    def from_rows(cls, vertex_rows, way_rows, park_rows=(), park_vertex_rows=()):
+        vertex_ids = np.array([r[0] for r in vertex_rows], dtype=np.int64)
+        vertex_lonlat = np.array([(r[1], r[2]) for r in vertex_rows], dtype=np.float64).reshape(-1, 2)
+        position = {vid: i for i, vid in enumerate(vertex_ids.tolist())}
+
+        # Skip ways whose end points are missing from `vertices`
+        way_rows = [r for r in way_rows if r[1] in position and r[2] in position]
+        geometries = [json.loads(r[6])["coordinates"] for r in way_rows]
+        coord_offsets = np.concatenate([[0], np.cumsum([len(g) for g in geometries])]).astype(np.int64)
+        coords = np.array([pt for g in geometries for pt in g], dtype=np.float64).reshape(-1, 2)
+
+        costs = np.array([_undirected_cost(r[3], r[4]) for r in way_rows], dtype=np.float64)
+        edge_ids = np.array([r[0] for r in way_rows], dtype=np.int64)
+        edge_position = {eid: i for i, eid in enumerate(edge_ids.tolist())}
+
+        # Precomputed nearest park walk; only usable when every step is known
+        park_id = np.array([-1 if r[4] is None else r[4] for r in vertex_rows], dtype=np.int64)
+        pred_edge = np.array(
+            [-1 if r[5] is None else edge_position.get(r[5], -1) for r in vertex_rows], dtype=np.int64
+        )
+
+        return cls(
+            vertex_ids,
+            vertex_lonlat,
+            edge_ids,
+            np.array([position[r[1]] for r in way_rows], dtype=np.int64),
+            np.array([position[r[2]] for r in way_rows], dtype=np.int64),
+            costs,
+            np.array([r[5] or 0.0 for r in way_rows], dtype=np.float64),
+            coords,
+            coord_offsets,
+            park_id,
+            pred_edge,
+            park_rows,
+            park_vertex_rows,
+        )
+
+    def nearest_park_path(self, start):
+        """
+        Walks the precomputed predecessors from a vertex position to its nearest
+        park, in O(path length). Returns (park id, steps) or None when the ETL
+        didn't precompute a walk for this vertex, or when the walk doesn't end on
+        one of the park's access points (e.g. its next edge is missing from `ways`).
+        """
+        park = int(self.park_id[start])
+        if park < 0:
+            return None
+        steps = []
+        v = start
+        for _ in range(len(self._pred_edge)):
+            e = self._pred_edge[v]
+            if e < 0:
+                return (park, steps) if (park, v) in self._access_points else None
+            # Leaving v along e: reversed if v is the way's target
+            steps.append((e, self._sources[e] != v))
+            v = self._targets[e] if self._sources[e] == v else self._sources[e]
+        return None
+
+    def shortest_path(self, start, end):
+        """
+        A* search between two vertex positions. Returns the list of
+        (edge position, reversed) steps, [] when start == end, or None if
+        `end` can't be reached.
+        """
+        if start == end:
+            return []
+        indptr, neighbors, weights, edges, xy = self._indptr, self._neighbors, self._weights, self._edges, self._xy
+        scale = self.heuristic_scale
+        ex, ey = xy[end]
+
+        def h(v):
+            x, y = xy[v]
+            return scale * math.hypot(x - ex, y - ey)
+
+        dist = {start: 0.0}
+        came_from = {}  # vertex -> (previous vertex, edge position)
+        heap = [(h(start), 0.0, start)]
+        while heap:
+            _, d, v = heapq.heappop(heap)
+            if v == end:
+                break
+            if d > dist[v]:
+                continue
+            for k in range(indptr[v], indptr[v + 1]):
+                u = neighbors[k]
+                nd = d + weights[k]
+                if nd < dist.get(u, math.inf):
+                    dist[u] = nd
+                    came_from[u] = (v, edges[k])
+                    heapq.heappush(heap, (nd + h(u), nd, u))
+        else:
+            return None
+
+        steps = []
+        v = end
+        while v != start:
+            prev, e = came_from[v]
+            steps.append((e, self._sources[e] != prev))
+            v = prev
+        steps.reverse()
+        return steps
+
+    def bounded_distances(self, start, limit):
+        """
+        Dijkstra from a vertex position that stops at `limit`. Returns a dict of
+        vertex position -> network distance for every vertex within the limit,
+        so several thresholds can be answered from one search.
+        """
+        indptr, neighbors, weights = self._indptr, self._neighbors, self._weights
+        dist = {start: 0.0}
+        settled = {}
+        heap = [(0.0, start)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if v in settled:
+                continue
+            settled[v] = d
+            for k in range(indptr[v], indptr[v + 1]):
+                u = neighbors[k]
+                nd = d + weights[k]
+                if nd <= limit and nd < dist.get(u, math.inf):
+                    dist[u] = nd
+                    heapq.heappush(heap, (nd, u))
+        return settled
+
+    def parks_within(self, start, limit):
+        """
+        Parks whose access points are reachable within `limit` metres of network
+        distance from a vertex position, found with a single bounded search.
+        Returns (park positions, network distances), distances including the
+        access point's offset to the park.
+        """
+        reached = self.bounded_distances(start, limit)
+        dist = np.full(len(self.vertex_ids), np.inf)
+        dist[list(reached)] = list(reached.values())
+
+        access_dist = dist[self.access_vertex] + self.access_offset
+        park_dist = np.full(len(self.park_ids), np.inf)
+        np.minimum.at(park_dist, self.access_park, access_dist)
+        parks = np.nonzero(park_dist <= limit)[0]
+        return parks, park_dist[parks]
+
+    def path_coordinates(self, steps):
+        """
+        Joins the geometries of the path edges into one [lon, lat] coordinate list.
+        """
+        line = []
+        for e, reverse in steps:
+            part = self.coords[self.coord_offsets[e]:self.coord_offsets[e + 1]]
+            if reverse:
+                part = part[::-1]
+            part = part.tolist()
+            line.extend(part[1:] if line else part)
+        return line
+
+    def route(self, start_id, end_id):
+        """
+        Walking route between two vertices (vertices.id) in the same shape the
+        pgRouting query returned: GeoJSON geometry, total length and status.
+        """
+        start, end = self.index.get(start_id), self.index.get(end_id)
+        steps = None if start is None or end is None else self.shortest_path(start, end)
+
+        if not steps:
+            # No path: straight line between the two vertices, like the SQL fallback
+            line = [
+                self.vertex_lonlat[i].tolist()
+                for i in (start, end) if i is not None
+            ]
+            return {"type": "LineString", "coordinates": line}, 0.0, "DISCONNECTED"
+
+        distance = float(sum(self.lengths[e] for e, _ in steps))
+        return {"type": "LineString", "coordinates": self.path_coordinates(steps)}, distance, "CONNECTED"
+
+    def route_to_nearest_park(self, start_id):
+        """
+        Walking route from a vertex (vertices.id) to the network-nearest park using
+        the predecessors precomputed by the ETL. Returns (geometry, distance,
+        status, park name), or None if there is no precomputed walk.
+        """
+        start = self.index.get(start_id)
+        walk = None if start is None else self.nearest_park_path(start)
+        if walk is None:
+            return None
+
+        park, steps = walk
+        name = self.park_names.get(park)
+        if not steps:
+            # Already at the park's access point
+            point = self.vertex_lonlat[start].tolist()
+            return {"type": "LineString", "coordinates": [point, point]}, 0.0, "CONNECTED", name
+
+        distance = float(sum(self.lengths[e] for e, _ in steps))
+        return {"type": "LineString", "coordinates": self.path_coordinates(steps)}, distance, "CONNECTED", name
+
+
+async def load_routing_graph():
+    """
+    Reads `vertices`, `ways`, the parks and their access points and builds the
+    graph off the event loop.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(VERTICES_QUERY)
+            vertex_rows = await cur.fetchall()
+            await cur.execute(WAYS_QUERY)
+            way_rows = await cur.fetchall()
+            await cur.execute(PARKS_QUERY)
+            park_rows = await cur.fetchall()
+            await cur.execute(PARK_VERTICES_QUERY)
+            park_vertex_rows = await cur.fetchall()
+    return await asyncio.to_thread(RoutingGraph.from_rows, vertex_rows, way_rows, park_rows, park_vertex_rows)
+
+
+# Shared graph, loaded at startup and rebuilt when the dataset version changes
+routing_graph = VersionedResource(load_routing_graph)
@@ -0,0 +1,149 @@
+# Precomputed accessibility grid lookups for the Green Spaces Accessibility API
+# The ETL scores a regular EPSG:3857 grid over the city (see ETL/src/pipeline/grid.py);
+# this module maps a coordinate to its cell(s) so a score costs one primary key lookup.
+
+# importing necessary libraries
+import math
+from API.dataset import dataset_version
+from API.db import fetch_one, fetch_all
+
+# Spherical mercator radius used by EPSG:3857
+EARTH_RADIUS_M = 6378137.0
+
+GRID_META_QUERY = """
+    SELECT origin_x, origin_y, cell_m, n_rows, n_cols, buffer_m
+    FROM accessibility_grid_meta
+    WHERE id = 1;
+"""
+
+GRID_CELLS_QUERY = """
+    SELECT
+        row_idx,
+        col_idx,
+        accessibility_score,
+        proximity_score,
+        quantity_score,
+        area_score,
+        diversity_score,
+        parks_found
+    FROM accessibility_grid
+    WHERE (row_idx, col_idx) IN (SELECT * FROM unnest(%s::int[], %s::int[]));
+"""
+
+# Grid metadata, reloaded when the dataset version changes
+_meta = None
+_meta_version = None
+_meta_loaded = False
+
+
+def to_web_mercator(lat: float, lon: float):
+    """
+    Projects a WGS84 coordinate to EPSG:3857 metres.
+    """
+    x = EARTH_RADIUS_M * math.radians(lon)
+    y = EARTH_RADIUS_M * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    return x, y
+
+
+async def grid_meta():
+    """
+    Returns the grid metadata as a dict, or None if the ETL hasn't built a grid.
+    """
+    global _meta, _meta_version, _meta_loaded
+    version = await dataset_version()
+    if not _meta_loaded or version != _meta_version:
+        row = await fetch_one(GRID_META_QUERY)
+        _meta_version = version
+        _meta_loaded = True
+        _meta = dict(zip(("origin_x", "origin_y", "cell_m", "n_rows", "n_cols", "buffer_m"), row)) if row else None
+    return _meta
+
+
+def _scores(row):
+    return {
+        "accessibility_score": row[2],
+        "proximity": row[3],
+        "quantity": row[4],
+        "area": row[5],
+        "diversity": row[6],
+        "parks_found": row[7],
+    }
+
+
+async def grid_score(lat: float, lon: float, interpolate: bool = False):
+    """
+    Score of the grid cell containing the point, or a bilinear interpolation of
+    the four surrounding cell centres. Returns None outside the grid.
+    """
+    meta = await grid_meta()
+    if meta is None:
+        return None
+
+    x, y = to_web_mercator(lat, lon)
+    fx = (x - meta["origin_x"]) / meta["cell_m"]
+    fy = (y - meta["origin_y"]) / meta["cell_m"]
+    if not (0 <= fx < meta["n_cols"] and 0 <= fy < meta["n_rows"]):
+        return None
+
+    if not interpolate:
+        cells = {(math.floor(fy), math.floor(fx)): 1.0}
+    else:
+        # Cell centres sit at +0.5, so shift before picking the 4 neighbours
+        cx, cy = fx - 0.5, fy - 0.5
+        c0, r0 = math.floor(cx), math.floor(cy)
+        tx, ty = cx - c0, cy - r0
+        cells = {
+            (r0, c0): (1 - tx) * (1 - ty),
+            (r0, c0 + 1): tx * (1 - ty),
+            (r0 + 1, c0): (1 - tx) * ty,
+            (r0 + 1, c0 + 1): tx * ty,
+        }
+
+    rows = await fetch_all(GRID_CELLS_QUERY, ([r for r, _ in cells], [c for _, c in cells]))
+    if not rows:
+        return None
+
+    # Cells past the grid edge are missing, so renormalise the weights that remain
+    weights = [cells[(r[0], r[1])] for r in rows]
+    total_weight = sum(weights) or 1.0
+    blended = {
+        key: sum(w * _scores(r)[key] for w, r in zip(weights, rows)) / total_weight
+        for key in ("accessibility_score", "proximity", "quantity", "area", "diversity")
+    }
+    nearest = max(zip(weights, rows), key=lambda wr: wr[0])[1]
+
+    return {
+        "accessibility_score": round(blended["accessibility_score"], 2),
+        "scores": {
+            "proximity": round(blended["proximity"], 2),
+            "quantity": round(blended["quantity"], 2),
+            "area": round(blended["area"], 2),
+            "diversity": round(blended["diversity"], 2),
+        },
+        "parks_found": nearest[7],
+        "buffer_m": meta["buffer_m"],
+    }
+
+
+async def grid_heatmap(south: float, west: float, north: float, east: float, limit: int):
+    """
+    Grid cells inside a bounding box as a GeoJSON FeatureCollection of cell centres.
+    """
+    query = """
+        SELECT ST_X(geometry), ST_Y(geometry), accessibility_score
+        FROM accessibility_grid
+        WHERE geometry && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
+        LIMIT %s;
+    """
+    rows = await fetch_all(query, (west, south, east, north, limit))
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [r[0], r[1]]},
+                "properties": {"accessibility_score": round(r[2], 2)},
+            }
+            for r in rows
+        ],
+    }
@@ -2,13 +2,34 @@
 # This file initializes the FastAPI application and includes the spatial router.
 
 # Importing necessary libraries
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from API.routers import accessibility, feedback, routing, spatial
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from API.cache import result_cache
+from API.db import open_pool, close_pool
+from API.feedback_queue import feedback_writer
+from API.graph import routing_graph
+from API.metrics import render, timing_middleware
+from API.spatial_index import green_area_index
+from API.routers import accessibility, feedback, routing, spatial, tiles
 from fastapi.middleware.cors import CORSMiddleware
 
 
+# Opening the shared connection pool (and loading the routing graph and green area index) on startup and closing it on shutdown.
+# Queued feedback is written out before the pool closes.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pool()
+    await routing_graph.get()
+    await green_area_index.get()
+    feedback_writer.start()
+    yield
+    await feedback_writer.stop()
+    await close_pool()
+
+
 # Creating the FastAPI app
-app = FastAPI(title="Green Spaces Accessibility API")
+app = FastAPI(title="Green Spaces Accessibility API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 origins = [
     "https://aumgupta.github.io",
@@ -24,15 +45,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-request phase timings (Server-Timing header) and endpoint metrics
+app.middleware("http")(timing_middleware)
+
 # Root endpoint
 @app.get("/")
-def root():
+async def root():
     return {"message": "API is running"}
 
+# Result cache statistics (hits, misses, size, dataset version)
+@app.get("/cache-stats")
+async def cache_stats():
+    return result_cache.stats()
+
+# Prometheus metrics: request latency histograms, phase times, DB counters, cache and feedback queue
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    cache = result_cache.stats()
+    queue = feedback_writer.stats()
+    return PlainTextResponse(render({
+        "gsa_cache_hits_total": ("counter", "Result cache hits.", cache["hits"]),
+        "gsa_cache_misses_total": ("counter", "Result cache misses.", cache["misses"]),
+        "gsa_cache_evictions_total": ("counter", "Result cache evictions.", cache["evictions"]),
+        "gsa_cache_carried_over_total": ("counter", "Result cache entries kept across dataset updates.", cache["carried_over"]),
+        "gsa_cache_bytes": ("gauge", "Approximate size of the result cache.", cache["bytes"]),
+        "gsa_feedback_queued": ("gauge", "Feedback rows waiting to be written.", queue["queued"]),
+        "gsa_feedback_written_total": ("counter", "Feedback rows written.", queue["written"]),
+        "gsa_feedback_dropped_total": ("counter", "Feedback rows dropped after a failed write, for lack of room in the queue.", queue["dropped"]),
+    }), media_type="text/plain; version=0.0.4")
+
 # Conetion with the spatial router
 app.include_router(spatial.router, prefix="/api/v1")
 app.include_router(accessibility.router, prefix="/api/v1")
 app.include_router(routing.router, prefix="/api/v1")
-app.include_router(feedback.router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(feedback.router, prefix="/api/v1")
+app.include_router(tiles.router, prefix="/api/v1")
\ No newline at end of file
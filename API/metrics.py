@@ -0,0 +1,184 @@
+# Request timing and metrics for the Green Spaces Accessibility API
+# Routers time their phases (DB, routing, scoring, serialization...) with `timed()`; the middleware
+# adds the per-request breakdown as a Server-Timing header and keeps per-endpoint latency
+# histograms and DB counters, exposed in Prometheus text format at /metrics.
+
+# importing necessary libraries
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Queries slower than this (milliseconds) are logged with their SQL and parameters; 0 disables the log
+SLOW_QUERY_MS = float(os.environ.get("GSA_SLOW_QUERY_MS", 0))
+
+# Latency histogram buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Queries run outside a request (startup loads, feedback flushes) are counted under this route
+BACKGROUND = "background"
+
+slow_query_logger = logging.getLogger("API.slow_query")
+
+# Phase timings of the request being handled: {"phases": {phase: seconds}, "queries": n}
+_request = ContextVar("gsa_request_timings", default=None)
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Process-wide metrics (single event loop, so no locking is needed)
+_latency = defaultdict(_Histogram)      # (method, route, status) -> histogram
+_phase_seconds = defaultdict(float)     # (route, phase) -> seconds
+_db_queries = defaultdict(int)          # route -> queries
+_db_seconds = defaultdict(float)        # route -> seconds
+_slow_queries = 0
+
+
+def record(phase: str, seconds: float):
+    """
+    Adds `seconds` to a phase of the current request (no-op outside a request).
+    """
+    timings = _request.get()
+    if timings is not None:
+        timings["phases"][phase] = timings["phases"].get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    """
+    Times a block (awaits included) as `phase` of the current request:
+
+        with timed("routing"):
+            path = await asyncio.to_thread(graph.route, start, end)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def record_query(query, params, seconds: float):
+    """
+    Counts one executed query as `db` time of the current request (or of the
+    background) and logs it when slower than GSA_SLOW_QUERY_MS.
+    """
+    global _slow_queries
+    timings = _request.get()
+    if timings is not None:
+        timings["queries"] += 1
+        record("db", seconds)
+    else:
+        _db_queries[BACKGROUND] += 1
+        _db_seconds[BACKGROUND] += seconds
+
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_queries += 1
+        sql = " ".join(str(query).split())
+        slow_query_logger.warning("Slow query (%.1f ms): %s -- params: %.500r", seconds * 1000, sql, params)
+
+
+def route_label(scope) -> str:
+    """
+    Path template of the matched route, so the label set stays bounded
+    (unmatched paths share one label).
+    """
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+async def timing_middleware(request, call_next):
+    """
+    Collects the phase timings of every request, reports them in the
+    Server-Timing header and adds them to the endpoint metrics.
+    """
+    timings = {"phases": {}, "queries": 0}
+    token = _request.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    except Exception:
+        status = 500
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _request.reset(token)
+        route = route_label(request.scope)
+        _latency[(request.method, route, str(status))].observe(elapsed)
+        for phase, seconds in timings["phases"].items():
+            _phase_seconds[(route, phase)] += seconds
+        _db_queries[route] += timings["queries"]
+        _db_seconds[route] += timings["phases"].get("db", 0.0)
+
+    entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings["phases"].items()]
+    if timings["queries"]:
+        entries.append(f'queries;desc="{timings["queries"]} queries"')
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels.items()) + "}"
+
+
+def render(extra=None) -> str:
+    """
+    All metrics in Prometheus text format. `extra` adds single values owned
+    by other modules as {name: (type, help, value)}.
+    """
+    lines = [
+        "# HELP gsa_http_request_duration_seconds Request latency by endpoint.",
+        "# TYPE gsa_http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), h in sorted(_latency.items()):
+        for bound, count in zip(BUCKETS, h.buckets):
+            lines.append(f"gsa_http_request_duration_seconds_bucket{_labels(method=method, route=route, status=status, le=bound)} {count}")
+        lines.append(f"gsa_http_request_duration_seconds_bucket{_labels(method=method, route=route, status=status, le='+Inf')} {h.count}")
+        lines.append(f"gsa_http_request_duration_seconds_sum{_labels(method=method, route=route, status=status)} {h.sum}")
+        lines.append(f"gsa_http_request_duration_seconds_count{_labels(method=method, route=route, status=status)} {h.count}")
+
+    lines += [
+        "# HELP gsa_http_phase_seconds_total Time spent in each request phase by endpoint.",
+        "# TYPE gsa_http_phase_seconds_total counter",
+    ]
+    for (route, phase), seconds in sorted(_phase_seconds.items()):
+        lines.append(f"gsa_http_phase_seconds_total{_labels(route=route, phase=phase)} {seconds}")
+
+    lines += [
+        "# HELP gsa_db_queries_total Queries executed by endpoint.",
+        "# TYPE gsa_db_queries_total counter",
+    ]
+    for route, count in sorted(_db_queries.items()):
+        lines.append(f"gsa_db_queries_total{_labels(route=route)} {count}")
+
+    lines += [
+        "# HELP gsa_db_query_seconds_total Query execution time by endpoint.",
+        "# TYPE gsa_db_query_seconds_total counter",
+    ]
+    for route, seconds in sorted(_db_seconds.items()):
+        lines.append(f"gsa_db_query_seconds_total{_labels(route=route)} {seconds}")
+
+    lines += [
+        "# HELP gsa_db_slow_queries_total Queries slower than GSA_SLOW_QUERY_MS.",
+        "# TYPE gsa_db_slow_queries_total counter",
+        f"gsa_db_slow_queries_total {_slow_queries}",
+    ]
+
+    for name, (metric_type, help_text, value) in (extra or {}).items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+# JSON response helpers for the Green Spaces Accessibility API
+# Responses are encoded with orjson, and GeoJSON built by PostGIS is embedded as-is
+# (orjson.Fragment) instead of being parsed into Python objects and re-encoded.
+
+# importing necessary libraries
+import orjson
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from API.metrics import timed
+
+
+def geojson(text):
+    """
+    Wraps GeoJSON text from the database so it is written into the response
+    without being parsed. Returns None for a NULL geometry.
+    """
+    return orjson.Fragment(text) if text else None
+
+
+def json_response(content, status_code: int = 200):
+    """
+    Encodes `content` with orjson directly, skipping FastAPI's jsonable_encoder
+    pass (which would not understand GeoJSON fragments anyway).
+    """
+    with timed("serialize"):
+        return ORJSONResponse(content, status_code=status_code)
+
+
+def encode_json(content) -> bytes:
+    """
+    Encodes `content` to JSON bytes the way json_response does, for values
+    that are kept encoded (e.g. in the result cache).
+    """
+    with timed("serialize"):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def encoded_json_response(body: bytes, status_code: int = 200):
+    """
+    Sends JSON already encoded by encode_json as-is.
+    """
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+async def _stream(rows, opening: bytes, separator: bytes, closing: bytes):
+    yield opening
+    first = True
+    async for row in rows:
+        if not first:
+            yield separator
+        first = False
+        yield row.encode() if isinstance(row, str) else row
+    yield closing
+
+
+def stream_feature_collection(features):
+    """
+    Streams JSON features (text, one per item of the async iterator) as a
+    GeoJSON FeatureCollection.
+    """
+    return StreamingResponse(
+        _stream(features, b'{"type":"FeatureCollection","features":[', b",", b"]}"),
+        media_type="application/geo+json",
+    )
+
+
+def stream_json_array(items):
+    """
+    Streams JSON values (text, one per item of the async iterator) as a JSON array.
+    """
+    return StreamingResponse(_stream(items, b"[", b",", b"]"), media_type="application/json")
+
+
+def stream_ndjson(items):
+    """
+    Streams JSON values (text, one per item of the async iterator) as newline-delimited JSON.
+    """
+    return StreamingResponse(_stream(items, b"", b"\n", b"\n"), media_type="application/x-ndjson")
@@ -2,39 +2,98 @@
 # This module defines endpoints related to calculating the accessibility score of green spaces based on various factors.
 
 # importing necessary libraries
-import json
-from fastapi import APIRouter
+import asyncio
+from typing import List, Literal
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+from API.cache import cached
 from API.db import get_connection
-import math
-from collections import Counter
+from API.graph import routing_graph
+from API.grid import grid_heatmap, grid_meta, grid_score
+from API.metrics import timed
+from API.responses import geojson, json_response
+from API.scoring import encode_types, point_scores, score_points
 
-from API.routers.routing import route_to_nearest_park
-from API.routers.spatial import get_green_areas_buffer
+from API.routers.routing import START_VERTEX_QUERY, find_route_to_nearest_park
 
-INSIDE_THRESHOLD = 10
+# Maximum number of points accepted by the batch endpoint
+MAX_BATCH_POINTS = 10000
+
+# Maximum number of grid cells returned by the heatmap endpoint
+MAX_HEATMAP_CELLS = 50000
+
+# Parks smaller than this (m2) are ignored by the score
+MIN_PARK_AREA_M2 = 300
+
+# Park geometry returned for each `geometry_detail` (simplified versions are built by the ETL)
+GEOMETRY_COLUMNS = {
+    "full": "geometry",
+    "medium": "geometry_medium",
+    "low": "geometry_low",
+}
+
+# Maximum number of decimals in returned coordinates (ST_AsGeoJSON default)
+MAX_PRECISION = 9
 
 # Creating the router for accessibility endpoints
 router = APIRouter(prefix="/accessibility", tags=["Accessibility"])
 
+
+def score_radius(buffer_m: float = 500, mode: str = "live", **_):
+    # Network scores walk to parks anywhere on the graph, so any change can affect them
+    return None if mode == "network" else buffer_m
+
+
 # Endpoint to calculate the accessibility score for a given point
 @router.get("/accessibility-score")
-def accessibility_score(lat: float, lon: float, buffer_m: float = 500):
+@cached(radius=score_radius)
+async def accessibility_score(
+    lat: float,
+    lon: float,
+    buffer_m: float = 500,
+    mode: Literal["live", "grid", "network"] = "live",
+    interpolate: bool = False,
+    geometry_detail: Literal["full", "medium", "low", "none"] = "full",
+    precision: int = Query(MAX_PRECISION, ge=0, le=MAX_PRECISION),
+    include_route: bool = False,
+):
     """
     Green Accessibility Score based on:
     - Proximity
     - Quantity
     - Area
     - Diversity
+
+    `mode=grid` reads the score from the grid precomputed by the ETL (nearest
+    cell, or bilinear when `interpolate=true`). It falls back to live scoring
+    outside the grid or when `buffer_m` differs from the grid buffer.
+
+    `mode=network` measures proximity and picks candidate parks by walking
+    distance on the routing network instead of straight-line distance.
+
+    `geometry_detail` picks the full or a simplified park geometry (or none)
+    and `precision` caps the number of decimals of its coordinates.
+
+    `include_route=true` adds the walking route to the nearest park
+    (`nearest_park_route`, live mode only), on the same connection.
     """
 
-    conn = get_connection()
-    cur = conn.cursor()
+    if mode == "grid":
+        meta = await grid_meta()
+        if meta is not None and meta["buffer_m"] == buffer_m:
+            result = await grid_score(lat, lon, interpolate)
+            if result is not None:
+                return {**result, "mode": "grid"}
+
+    if mode == "network":
+        return await network_accessibility_score(lat, lon, buffer_m, geometry_detail, precision)
 
     # Spatial query
-    query = """
+    query = f"""
             WITH user_point AS (
             SELECT ST_Transform(
-                ST_SetSRID(ST_Point(%s, %s), 4326),
+                ST_SetSRID(ST_Point(%(lon)s, %(lat)s), 4326),
                 3857
             ) AS geom
         )
@@ -43,104 +102,235 @@ def accessibility_score(lat: float, lon: float, buffer_m: float = 500):
             g.id,
             g.name,
             t.type,
-            ST_Area(ST_Transform(g.geometry, 3857)) AS area_m2,
-            ST_Distance(
-                ST_Transform(g.geometry, 3857),
-                u.geom
-            ) AS distance_m,
-            ST_AsGeoJSON(g.geometry) AS geometry
+            g.area_m2,
+            ST_Distance(g.geom_3857, u.geom) AS distance_m,
+            {geojson_column(geometry_detail, "g")} AS geometry
         FROM green_areas g
         JOIN types t
             ON g.type_id = t.id
         CROSS JOIN user_point u
-        WHERE ST_DWithin(
-                ST_Transform(g.geometry, 3857),
-                u.geom,
-                %s
-            )
-        AND ST_Area(ST_Transform(g.geometry, 3857)) > 300;
+        WHERE ST_DWithin(g.geom_3857, u.geom, %(buffer_m)s)
+        AND g.area_m2 > %(min_area)s;
     """
 
-    cur.execute(query, (lon, lat, buffer_m))
-    parks = cur.fetchall()
-
-    cur.close()
-    conn.close()
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, {
+                "lon": lon,
+                "lat": lat,
+                "buffer_m": buffer_m,
+                "min_area": MIN_PARK_AREA_M2,
+                "precision": precision,
+            })
+            parks = await cur.fetchall()
+            nearest_park_route = None
+            if parks and include_route:
+                try:
+                    nearest_park_route = await find_route_to_nearest_park(cur, lat, lon)
+                except HTTPException:
+                    # No route is not an error for the score
+                    pass
 
     # If no parks found, return 0 score
     if len(parks) == 0:
-        return {
-            "accessibility_score": 0.0,
-            "scores": {
-                "proximity": 0.0,
-                "quantity": 0.0,
-                "area": 0.0,
-                "diversity": 0.0
-            },
-            "parks_found": 0
-        }
-
-    # Proximity score: based on distance to nearest park, with a decay function
-    nearest_distance = min(park[4] for park in parks)
-
-    if nearest_distance <= INSIDE_THRESHOLD:
-        proximity_score = 10
-
-    else:
-        proximity_total = 0
-        for park in parks:
-            distance = park[4]
-            contribution = 1 - (distance / buffer_m)
-
-            if contribution < 0:
-                contribution = 0
-
-            proximity_total += contribution
-
-        proximity_score = (proximity_total / len(parks)) * 10
-    # Quantity score: based on number of parks found
-    n_parks = len(parks)
-    quantity_score = (1 - math.exp(-n_parks / 5)) * 10
-
-    # Area score: based on total area of parks found
-    total_area = sum(park[3] for park in parks)  # area_m2
-    area_score = min(1, total_area / 50000) * 10
-
-    # Diversity score: based on variety of park types
-    types = [park[2] for park in parks if park[2] is not None]
-
-    if len(types) <= 1:
-        diversity_score = 0
-    else:
-        counts = Counter(types)
-        total = sum(counts.values())
-
-        H = 0
-        for c in counts.values():
-            p = c / total
-            H -= p * math.log(p)
-
-        diversity_score = (H / math.log(len(counts))) * 10
-
-    # Final accessibility score: weighted average of all components
-    accessibility = (
-        0.4 * proximity_score +
-        0.3 * area_score +
-        0.2 * quantity_score +
-        0.1 * diversity_score
-    )
-    #im_in_a_park = get_green_areas_buffer(lat, lon, buffer_m=0)
-    nearest_park_route = route_to_nearest_park(lat, lon)
-    return {
-        "accessibility_score": round(accessibility, 2),
-        #"nearest_park_route": nearest_park_route,
+        return no_parks_score()
+
+    # Sub-scores and weighted total from the shared NumPy kernels
+    with timed("scoring"):
+        scores = score_points(
+            1,
+            np.zeros(len(parks), dtype=np.int64),
+            [p[4] for p in parks],  # distance_m
+            [p[3] for p in parks],  # area_m2
+            encode_types([p[2] for p in parks]),
+            buffer_m,
+        )
+        result = point_scores(scores, 0)
+
+    response = {
+        "accessibility_score": result["accessibility_score"],
         "scores": {
-            "proximity": round(proximity_score, 2),
-            "quantity": round(quantity_score, 2),
-            "area": round(area_score, 2),
-            "diversity": round(diversity_score, 2),
-            "parks": [{"id": p[0], "name": p[1],"type": p[2], "area": p[3], "distance": p[4], "geometry": json.loads(p[5])} for p in parks],
+            **result["scores"],
+            "parks": [{"id": p[0], "name": p[1],"type": p[2], "area": p[3], "distance": p[4], "geometry": geojson(p[5])} for p in parks],
         },
-        "parks_found": n_parks,
+        "parks_found": result["parks_found"],
         "buffer_m": buffer_m
-    }
\ No newline at end of file
+    }
+    if include_route:
+        response["nearest_park_route"] = nearest_park_route
+    return response
+
+
+def geojson_column(geometry_detail: str, alias: str) -> str:
+    """
+    SQL expression for the park geometry at the requested detail, as GeoJSON
+    text with a `%(precision)s` placeholder for the coordinate precision.
+    """
+    if geometry_detail == "none":
+        return "NULL::text"
+    return f"ST_AsGeoJSON({alias}.{GEOMETRY_COLUMNS[geometry_detail]}, %(precision)s)"
+
+
+def no_parks_score():
+    """
+    Response returned when no park is found around the point.
+    """
+    return {
+        "accessibility_score": 0.0,
+        "scores": {
+            "proximity": 0.0,
+            "quantity": 0.0,
+            "area": 0.0,
+            "diversity": 0.0
+        },
+        "parks_found": 0
+    }
+
+
+async def network_accessibility_score(lat: float, lon: float, buffer_m: float,
+                                      geometry_detail: str = "full", precision: int = MAX_PRECISION):
+    """
+    Accessibility score where proximity and the candidate parks come from the
+    walking network: one search bounded by `buffer_m` from the user's nearest
+    vertex reaches every park access point at once (no route per park).
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            # IMPORTANT: PostGIS expects (lon, lat)
+            await cur.execute(START_VERTEX_QUERY, (lon, lat))
+            start = await cur.fetchone()
+            graph = await routing_graph.get()
+            position = graph.index.get(start[0]) if start else None
+            if position is None:
+                return no_parks_score()
+
+            with timed("routing"):
+                parks, distances = await asyncio.to_thread(graph.parks_within, position, buffer_m)
+            keep = graph.park_areas[parks] > MIN_PARK_AREA_M2
+            parks, distances = parks[keep], distances[keep]
+            if len(parks) == 0:
+                return no_parks_score()
+
+            park_ids = graph.park_ids[parks].tolist()
+            await cur.execute(
+                f"SELECT g.id, {geojson_column(geometry_detail, 'g')} FROM green_areas g WHERE g.id = ANY(%(ids)s);",
+                {"precision": precision, "ids": park_ids},
+            )
+            geometries = dict(await cur.fetchall())
+
+    types = [graph.park_types[p] for p in parks]
+    with timed("scoring"):
+        scores = score_points(
+            1,
+            np.zeros(len(parks), dtype=np.int64),
+            distances,
+            graph.park_areas[parks],
+            encode_types(types),
+            buffer_m,
+        )
+        result = point_scores(scores, 0)
+
+    return {
+        "accessibility_score": result["accessibility_score"],
+        "scores": {
+            **result["scores"],
+            "parks": [
+                {
+                    "id": pid,
+                    "name": graph.park_names.get(pid),
+                    "type": ptype,
+                    "area": float(graph.park_areas[p]),
+                    "distance": float(d),
+                    "geometry": geojson(geometries.get(pid)),
+                }
+                for pid, p, ptype, d in zip(park_ids, parks, types, distances)
+            ],
+        },
+        "parks_found": result["parks_found"],
+        "buffer_m": buffer_m,
+        "mode": "network"
+    }
+
+
+# Endpoint to get the precomputed accessibility grid inside a bounding box (heatmap)
+@router.get("/heatmap")
+async def accessibility_heatmap(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    limit: int = Query(MAX_HEATMAP_CELLS, gt=0, le=MAX_HEATMAP_CELLS),
+):
+    return json_response(await grid_heatmap(south, west, north, east, limit))
+
+
+# Set-based query: candidate parks for every point of a batch in one round trip
+BATCH_QUERY = """
+    WITH user_points AS (
+        SELECT
+            p.idx - 1 AS idx,
+            ST_Transform(ST_SetSRID(ST_Point(p.lon, p.lat), 4326), 3857) AS geom
+        FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS p(lon, lat, idx)
+    )
+
+    SELECT
+        u.idx,
+        c.area_m2,
+        c.distance_m,
+        c.type
+    FROM user_points u
+    CROSS JOIN LATERAL (
+        SELECT
+            g.area_m2,
+            ST_Distance(g.geom_3857, u.geom) AS distance_m,
+            t.type
+        FROM green_areas g
+        JOIN types t
+            ON g.type_id = t.id
+        WHERE ST_DWithin(g.geom_3857, u.geom, %s)
+        AND g.area_m2 > %s
+    ) c;
+"""
+
+# Defining the data model for batch scoring
+class Point(BaseModel):
+    lat: float
+    lon: float
+
+class BatchScoreRequest(BaseModel):
+    points: List[Point] = Field(..., min_length=1, max_length=MAX_BATCH_POINTS)
+    buffer_m: float = Field(500, gt=0)
+
+# Endpoint to calculate the accessibility score for many points at once
+@router.post("/accessibility-score/batch")
+async def accessibility_score_batch(request: BatchScoreRequest):
+    """
+    Green Accessibility Score for a batch of points, returned in input order.
+    Candidate parks for all points are fetched in a single query and scored
+    with the vectorized kernels (no park geometries or routes are returned).
+    """
+    lons = [p.lon for p in request.points]
+    lats = [p.lat for p in request.points]
+
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(BATCH_QUERY, (lons, lats, request.buffer_m, MIN_PARK_AREA_M2))
+            rows = await cur.fetchall()
+
+    with timed("scoring"):
+        scores = score_points(
+            len(request.points),
+            [r[0] for r in rows],
+            [r[2] for r in rows],  # distance_m
+            [r[1] for r in rows],  # area_m2
+            encode_types([r[3] for r in rows]),
+            request.buffer_m,
+        )
+
+    return json_response({
+        "buffer_m": request.buffer_m,
+        "results": [
+            {"lat": p.lat, "lon": p.lon, **point_scores(scores, i)}
+            for i, p in enumerate(request.points)
+        ],
+    })
\ No newline at end of file
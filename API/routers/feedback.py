@@ -1,65 +1,93 @@
 # This file defines the API endpoints for handling user feedback on park accessibility and quality.
 # It allows users to submit feedback on their experience with green spaces, including their location,
 # whether they liked the park, and their scores for various accessibility factors.
+# Submissions are queued and written in batches by API/feedback_queue.py.
 
 # importing necessary libraries
-from fastapi import APIRouter
-from API.db import get_connection
+from typing import Annotated, List, Literal, Optional
+from uuid import UUID, uuid4
+from fastapi import APIRouter, Body, HTTPException
 from pydantic import BaseModel
 from datetime import datetime
+from API.feedback_queue import FEEDBACK_DURABILITY, QueueFullError, feedback_writer
+from API.responses import json_response
+
+# Maximum number of feedback items accepted by the bulk endpoint
+MAX_BULK_FEEDBACK = 1000
 
 # Creating the router for feedback endpoints
 router = APIRouter(prefix="/feedback", tags=["Feedback"])
 
-# Defining the data model for feedback submission   
+# Defining the data model for feedback submission
 class FeedbackRequest(BaseModel):
+    id: Optional[UUID] = None  # client-supplied id, makes retries idempotent
     lat: float
     lon: float
     liked: bool
-    accessibility_score: float 
-    proximity_score: float 
-    quantity_score: float 
-    area_score: float 
+    accessibility_score: float
+    proximity_score: float
+    quantity_score: float
+    area_score: float
     diversity_score: float
     timestamp: datetime
 
-# Endpoint to submit feedback on park accessibility and quality
-@router.post("/")
-def post_feedback(feedback: FeedbackRequest):
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    query = """
-            INSERT INTO feedback ( 
-                lat, 
-                lon, 
-                liked, 
-                accessibility_score, 
-                proximity_score, 
-                quantity_score, 
-                area_score, 
-                diversity_score,
-                timestamp) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) 
-                RETURNING id;
-        """
-    cursor.execute(query, (
-        feedback.lat, 
-        feedback.lon, 
-        feedback.liked, 
-        feedback.accessibility_score, 
-        feedback.proximity_score,
-        feedback.quantity_score,
-        feedback.area_score,
-        feedback.diversity_score,
-        feedback.timestamp
-    ))
+async def submit_feedback(items, durability):
+    """
+    Queues feedback items and returns their ids. Answers 503 when the queue
+    stays full (or, in `commit` mode, when the write fails) so clients back off.
+    """
+    durability = durability or FEEDBACK_DURABILITY
+    ids = [item.id or uuid4() for item in items]
+    rows = [
+        (
+            feedback_id,
+            item.lat,
+            item.lon,
+            item.liked,
+            item.accessibility_score,
+            item.proximity_score,
+            item.quantity_score,
+            item.area_score,
+            item.diversity_score,
+            item.timestamp,
+        )
+        for feedback_id, item in zip(ids, items)
+    ]
+    try:
+        await feedback_writer.submit(rows, wait_for_commit=durability == "commit")
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception:
+        raise HTTPException(status_code=503, detail="Feedback could not be stored", headers={"Retry-After": "1"})
+    return [str(feedback_id) for feedback_id in ids], durability
 
-    new_id = cursor.fetchone()[0]
-    conn.commit()
 
-    cursor.close()
-    conn.close()
+# Endpoint to submit feedback on park accessibility and quality
+@router.post("/")
+async def post_feedback(feedback: FeedbackRequest, durability: Optional[Literal["ack", "commit"]] = None):
+    """
+    Submits one feedback item. With `durability=ack` (the default, see
+    GSA_FEEDBACK_DURABILITY) the answer is sent once the item is queued;
+    with `commit` it waits until the item is stored.
+    """
+    ids, durability = await submit_feedback([feedback], durability)
+    if durability == "commit":
+        return {"message": "Feedback submitted successfully", "id": ids[0]}
+    return json_response({"message": "Feedback accepted", "id": ids[0]}, status_code=202)
 
-    return {"message": "Feedback submitted successfully", "id": new_id}
 
+# Endpoint to submit many feedback items at once
+@router.post("/bulk")
+async def post_feedback_bulk(
+    feedback: Annotated[List[FeedbackRequest], Body(min_length=1, max_length=MAX_BULK_FEEDBACK)],
+    durability: Optional[Literal["ack", "commit"]] = None,
+):
+    """
+    Submits an array of feedback items, queued (and stored) all together.
+    Ids are returned in input order.
+    """
+    ids, durability = await submit_feedback(feedback, durability)
+    if durability == "commit":
+        return {"message": "Feedback submitted successfully", "ids": ids}
+    return json_response({"message": "Feedback accepted", "ids": ids}, status_code=202)
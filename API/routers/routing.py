@@ -1,28 +1,25 @@
 # Routing router for the Green Spaces Accessibility API
 # This module defines endpoints related to routing, such as finding the closest park and calculating walking distance 
-# to it using pgRouting. 
+# to it on the in-memory routing graph. 
 
 # importing necessary libraries
-from fastapi import APIRouter, HTTPException
-from API.db import get_connection
-import json
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException, Query
+from API.cache import result_cache
+from API.dataset import dataset_version
+from API.db import fetch_all, fetch_one, get_connection
+from API.graph import routing_graph
+from API.metrics import timed
+from API.responses import encode_json, encoded_json_response, geojson
 
 # Creating the router for routing endpoints
 router = APIRouter(prefix="/routing", tags=["Routing"])
 
 
-# Endpoint to calculate the route to the nearest park
-@router.get("/to-nearest-park")
-def route_to_nearest_park(lat: float, lon: float):
-    """
-    Computes a walking route from the user location
-    to the nearest green area using pgRouting.
-    """
-
-    conn = get_connection()
-    cur = conn.cursor()
-
-    query = """
+# Start and end vertices for a walk from a point to the nearest green area (PostGIS expects lon, lat).
+# The path itself is computed in-process on the routing graph (see API/graph.py).
+NODES_QUERY = """
         WITH user_loc AS (
             SELECT ST_SetSRID(ST_Point(%s, %s), 4326) AS geom
         ),
@@ -31,65 +28,172 @@ def route_to_nearest_park(lat: float, lon: float):
             FROM green_areas 
             ORDER BY geometry <-> (SELECT geom FROM user_loc) 
             LIMIT 1
-        ),
-        nodes AS (
-            SELECT 
-                (SELECT v.id FROM vertices v 
-                    ORDER BY v.geometry <-> (SELECT geom FROM user_loc) 
-                    LIMIT 1) as start_id,
-
-                (SELECT v.id FROM vertices v 
-                    ORDER BY v.geometry <-> ST_Centroid((SELECT geometry FROM nearest_park)) 
-                    LIMIT 1) as end_id
-        ),
-        route_calc AS (
-            SELECT path.seq, w.geometry, w.length_m
-            FROM pgr_dijkstra(
-                'SELECT id, source, target, cost, reverse_cost FROM ways',
-                (SELECT start_id FROM nodes), 
-                (SELECT end_id FROM nodes), 
-                directed := false
-            ) AS path
-            JOIN ways AS w ON path.edge = w.id
         )
         SELECT 
-            COALESCE(
-                (SELECT ST_AsGeoJSON(ST_LineMerge(ST_Union(geometry))) FROM route_calc),
-                ST_AsGeoJSON(ST_MakeLine(
-                    (SELECT geometry FROM vertices WHERE id = (SELECT start_id FROM nodes)),
-                    (SELECT geometry FROM vertices WHERE id = (SELECT end_id FROM nodes))
-                ))
-            ) as route_geojson,
-            COALESCE((SELECT SUM(length_m) FROM route_calc), 0) as total_distance_m,
-            CASE 
-                WHEN (SELECT COUNT(*) FROM route_calc) > 0 THEN 'CONNECTED' 
-                ELSE 'DISCONNECTED' 
-            END as status,
-            (SELECT name FROM nearest_park) as destination_park
-        LIMIT 1;
+            (SELECT v.id FROM vertices v 
+                ORDER BY v.geometry <-> (SELECT geom FROM user_loc) 
+                LIMIT 1) as start_id,
+
+            (SELECT v.id FROM vertices v 
+                ORDER BY v.geometry <-> ST_Centroid((SELECT geometry FROM nearest_park)) 
+                LIMIT 1) as end_id,
+
+            (SELECT name FROM nearest_park) as destination_park;
     """
 
-    # IMPORTANT: PostGIS expects (lon, lat)
-    cur.execute(query, (lon, lat))
-    result = cur.fetchone()
 
-    cur.close()
-    conn.close()
+async def find_route_to_nearest_park(cur, lat: float, lon: float):
+    """
+    Finds the route's end points on an already borrowed cursor, so callers
+    that hold a connection (e.g. accessibility scoring) don't need a second
+    one, then searches the in-memory routing graph.
+    """
+    # IMPORTANT: PostGIS expects (lon, lat)
+    await cur.execute(NODES_QUERY, (lon, lat))
+    result = await cur.fetchone()
 
-    if result is None:
+    if result is None or result[0] is None or result[1] is None:
         raise HTTPException(status_code=404, detail="No route found")
 
-    # Convert GeoJSON string from Postgres into Python dict
-    route_geometry = json.loads(result[0])
+    graph = await routing_graph.get()
+
+    # Precomputed walk to the network-nearest park (O(path length)), else a graph search
+    # to the park closest in straight line
+    with timed("routing"):
+        precomputed = graph.route_to_nearest_park(result[0])
+        if precomputed is not None:
+            route_geometry, distance_m, status, destination_park = precomputed
+        else:
+            route_geometry, distance_m, status = await asyncio.to_thread(graph.route, result[0], result[1])
+            destination_park = result[2]
 
     return {
         "type": "Feature",
         "geometry": route_geometry,
         "properties": {
-            "distance_m": round(result[1], 2),
-            "status": result[2],
-            "destination_park": result[3]
+            "distance_m": round(distance_m, 2),
+            "status": status,
+            "destination_park": destination_park
         }
     }
 
 
+# Endpoint to calculate the route to the nearest park
+@router.get("/to-nearest-park")
+async def route_to_nearest_park(lat: float, lon: float):
+    """
+    Computes a walking route from the user location
+    to the nearest green area.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            return await find_route_to_nearest_park(cur, lat, lon)
+
+
+# Nearest network vertex to a point (PostGIS expects lon, lat)
+START_VERTEX_QUERY = """
+    SELECT v.id
+    FROM vertices v
+    ORDER BY v.geometry <-> ST_SetSRID(ST_Point(%s, %s), 4326)
+    LIMIT 1;
+"""
+
+# Polygon around the vertices reached in each band, and the green area inside it.
+# All bands are built by one query: the reached vertices are sent once with their
+# distance and each band keeps those within its limit.
+ISOCHRONE_BANDS_QUERY = """
+    WITH reached AS (
+        SELECT * FROM unnest(%s::int[], %s::float8[]) AS r(id, distance)
+    ),
+    limits AS (
+        SELECT * FROM unnest(%s::int[], %s::float8[]) AS l(minutes, distance)
+    ),
+    bands AS (
+        SELECT l.minutes, ST_ConcaveHull(ST_Collect(v.geometry), %s) AS geom
+        FROM limits l
+        JOIN reached r ON r.distance <= l.distance
+        JOIN vertices v ON v.id = r.id
+        GROUP BY l.minutes
+    )
+    SELECT
+        b.minutes,
+        ST_AsGeoJSON(b.geom),
+        COUNT(g.id),
+        COALESCE(SUM(ST_Area(ST_Intersection(g.geom_3857, ST_Transform(b.geom, 3857)))), 0)
+    FROM bands b
+    LEFT JOIN green_areas g
+        ON ST_Intersects(g.geometry, b.geom)
+    GROUP BY b.minutes, b.geom;
+"""
+
+
+# Endpoint to get walking isochrones (reachable areas) around a point
+@router.get("/isochrone")
+async def isochrone(
+    lat: float,
+    lon: float,
+    minutes: List[int] = Query([5, 10, 15]),
+    speed_kmh: float = Query(4.8, gt=0),
+    concavity: float = Query(0.3, ge=0, le=1),
+):
+    """
+    Areas reachable on foot within each of `minutes`, computed with one
+    distance-bounded search on the routing graph that stops at the largest
+    threshold. Each band is the (concave) hull of the vertices reached and
+    reports the green area it contains. Results are cached per start vertex.
+    """
+    minutes = sorted(set(m for m in minutes if m > 0))
+    if not minutes:
+        raise HTTPException(status_code=422, detail="At least one positive value of minutes is required")
+    metres_per_minute = speed_kmh * 1000 / 60
+
+    # The version is read once, when the request starts, for the cache and the graph
+    version = await dataset_version()
+    await result_cache.advance(version)
+
+    # Connections are only taken around the SQL, not held through the graph search
+    start = await fetch_one(START_VERTEX_QUERY, (lon, lat))
+    if start is None:
+        raise HTTPException(status_code=404, detail="No network vertex found")
+
+    key = ("isochrone", start[0], tuple(minutes), speed_kmh, concavity)
+    cached = result_cache.get(key, version)
+    if cached is not result_cache.MISSING:
+        return encoded_json_response(cached)
+
+    graph, graph_version = await routing_graph.get_versioned()
+    start_position = graph.index.get(start[0])
+    if start_position is None:
+        raise HTTPException(status_code=404, detail="Start vertex is not in the routing graph")
+    with timed("routing"):
+        reached = await asyncio.to_thread(
+            graph.bounded_distances, start_position, minutes[-1] * metres_per_minute
+        )
+
+    vertex_ids = [int(graph.vertex_ids[v]) for v in reached]
+    distances = [float(d) for d in reached.values()]
+    limits = [m * metres_per_minute for m in minutes]
+    rows = await fetch_all(ISOCHRONE_BANDS_QUERY, (vertex_ids, distances, minutes, limits, concavity))
+    bands = {row[0]: row[1:] for row in rows}
+
+    features = []
+    for m, limit in zip(minutes, limits):
+        band = bands.get(m)
+        features.append({
+            "type": "Feature",
+            "geometry": geojson(band[0]) if band else None,
+            "properties": {
+                "minutes": m,
+                "distance_m": round(limit, 2),
+                "vertices_reached": sum(1 for d in distances if d <= limit),
+                "parks_reached": band[1] if band else 0,
+                "green_area_m2": round(band[2], 2) if band else 0.0,
+            },
+        })
+
+    response = {"type": "FeatureCollection", "features": features}
+    body = encode_json(response)
+    # Only cached when computed on the graph of the request's version (not while it reloads)
+    if graph_version == version:
+        result_cache.set(key, version, body)
+    return encoded_json_response(body)
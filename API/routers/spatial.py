@@ -3,40 +3,33 @@
 # such as checking if a point is within a green area or finding nearby green areas.
 
 # importing necessary libraries
-from fastapi import APIRouter
-from API.db import get_connection
+from typing import List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Query
+from API.db import fetch_all, stream_column
+from API.metrics import timed
+from API.responses import stream_feature_collection, stream_ndjson
+from API.spatial_index import green_area_index
+
+# Maximum number of parks returned by one page of the nearest endpoint
+MAX_NEAREST = 100
 
 # Creating the router for spatial endpoints
 router = APIRouter(tags=["Spatial"])
 
 # Endpoint to check if a point is within a green area
 @router.get("/green-area")
-def get_green_area(lat: float, lon: float):
-
-    conn = get_connection()
-    cur = conn.cursor()
-
-    query = """
-    SELECT gid, name
-    FROM green_areas
-    WHERE ST_Contains(
-        geometry,
-        ST_SetSRID(ST_Point(%s, %s), 4326)
-    )
-    LIMIT 1;
+async def get_green_area(lat: float, lon: float):
     """
+    Green area containing the point, answered from the in-memory index.
+    """
+    index = await green_area_index.get()
+    with timed("spatial_index"):
+        position = index.containing([lat], [lon])[0]
 
-    cur.execute(query, (lon, lat))
-
-    result = cur.fetchone()
-
-    cur.close()
-    conn.close()
-
-    if result:
+    if position >= 0:
         return {
-            "gid": result[0],
-            "name": result[1],
+            "gid": int(index.ids[position]),
+            "name": index.names[position],
             "inside_green_area": True
         }
     else:
@@ -44,37 +37,144 @@ def get_green_area(lat: float, lon: float):
             "inside_green_area": False
         }
 
-# Endpoint to get green areas within a buffer around a point
-@router.get("/green-area-buffer")
-def get_green_areas_buffer(lat: float, lon: float, buffer_m: float = 500):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    query = """
-    SELECT gid, name
+# Green areas within a buffer, one GeoJSON Feature (as text) per row, built by PostGIS
+BUFFER_FEATURES_QUERY = """
+    SELECT json_build_object(
+        'type', 'Feature',
+        'geometry', ST_AsGeoJSON(geometry)::json,
+        'properties', json_build_object('gid', id, 'name', name)
+    )::text
     FROM green_areas
-    WHERE ST_Intersects(
-        geometry,
+    WHERE ST_DWithin(
+        geom_3857,
         ST_Transform(
-            ST_Buffer(
-                ST_Transform(
-                    ST_SetSRID(ST_Point(%s, %s), 4326),
-                    3857
-                ),
-                %s
-            ),
-            4326
-        )
+            ST_SetSRID(ST_Point(%s, %s), 4326),
+            3857
+        ),
+        %s
     );
+"""
+
+# Endpoint to get green areas within a buffer around a point
+@router.get("/green-area-buffer")
+async def get_green_areas_buffer(lat: float, lon: float, buffer_m: float = 500,
+                                 format: Literal["json", "geojson", "ndjson"] = "json"):
+    """
+    Green areas within `buffer_m` metres of the point. `json` returns the list
+    of ids and names from the in-memory index; `geojson` and `ndjson` stream
+    the full features straight from a server-side cursor.
     """
+    if format == "json":
+        return await green_areas_buffer(lat=lat, lon=lon, buffer_m=buffer_m)
 
-    cur.execute(query, (lon, lat, buffer_m))
-    results = cur.fetchall()
+    features = stream_column(BUFFER_FEATURES_QUERY, (lon, lat, buffer_m))
+    if format == "geojson":
+        return stream_feature_collection(features)
+    return stream_ndjson(features)
 
-    cur.close()
-    conn.close()
+
+async def green_areas_buffer(lat: float, lon: float, buffer_m: float = 500):
+    """
+    Ids and names of the green areas within `buffer_m`, answered from the
+    in-memory index.
+    """
+    index = await green_area_index.get()
+    with timed("spatial_index"):
+        _, positions = index.within_distance([lat], [lon], buffer_m)
 
     return [
-        {"gid": r[0], "name": r[1]} for r in results
+        {"gid": int(index.ids[p]), "name": index.names[p]} for p in positions
     ]
 
+
+# k nearest green areas. The inner query walks the GIST index in `<->` order (EPSG:3857
+# distance, then id) and the exact geodesic distance is computed for the k rows kept only.
+# The cursor condition can't be pushed into the KNN index scan (it has no lower bound on
+# the distance): the scan still starts at the nearest row and skips every row before the
+# cursor, so page N reads about N * k index entries. Deep pages get slower; narrow them
+# with max_distance_m or types rather than paging far.
+NEAREST_QUERY = """
+    WITH pt AS (
+        SELECT
+            ST_SetSRID(ST_Point(%(lon)s, %(lat)s), 4326) AS geom,
+            ST_Transform(ST_SetSRID(ST_Point(%(lon)s, %(lat)s), 4326), 3857) AS geom_3857
+    ),
+    nearest AS (
+        SELECT
+            g.id,
+            g.name,
+            t.type,
+            g.area_m2,
+            g.geometry,
+            g.geom_3857 <-> pt.geom_3857 AS knn_distance
+        FROM green_areas g
+        LEFT JOIN types t
+            ON g.type_id = t.id
+        CROSS JOIN pt
+        WHERE (%(types)s::text[] IS NULL OR t.type = ANY(%(types)s::text[]))
+          AND (%(max_distance)s::float IS NULL
+               OR ST_DWithin(g.geom_3857, pt.geom_3857, %(max_distance)s / cos(radians(%(lat)s))))
+          AND (%(after_distance)s::float IS NULL
+               OR (g.geom_3857 <-> pt.geom_3857, g.id) > (%(after_distance)s, %(after_id)s))
+        ORDER BY g.geom_3857 <-> pt.geom_3857, g.id
+        LIMIT %(k)s
+    )
+    SELECT
+        n.id,
+        n.name,
+        n.type,
+        n.area_m2,
+        ST_Distance(n.geometry::geography, pt.geom::geography) AS distance_m,
+        n.knn_distance
+    FROM nearest n
+    CROSS JOIN pt
+    ORDER BY n.knn_distance, n.id;
+"""
+
+
+def parse_cursor(after: str):
+    """
+    Splits a `distance:id` cursor returned by the nearest endpoint.
+    """
+    try:
+        distance, park_id = after.split(":")
+        return float(distance), int(park_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor, expected distance:id")
+
+
+# Endpoint to get the k nearest green areas to a point
+@router.get("/green-areas/nearest")
+async def get_nearest_green_areas(
+    lat: float,
+    lon: float,
+    k: int = Query(10, ge=1, le=MAX_NEAREST),
+    types: Optional[List[str]] = Query(None),
+    max_distance_m: Optional[float] = Query(None, gt=0),
+    after: Optional[str] = None,
+):
+    """
+    The `k` green areas nearest to the point, closest first, optionally
+    restricted to some `types` and to `max_distance_m` (metres at the point's
+    latitude). Pass `next_cursor` back as `after` to get the next page; page
+    N costs about N * k index reads, since the search restarts from the nearest
+    green area and skips the rows before the cursor.
+    """
+    after_distance, after_id = parse_cursor(after) if after else (None, None)
+    rows = await fetch_all(NEAREST_QUERY, {
+        "lat": lat,
+        "lon": lon,
+        "types": types,
+        "max_distance": max_distance_m,
+        "after_distance": after_distance,
+        "after_id": after_id,
+        "k": k,
+    })
+
+    parks = [
+        {"id": r[0], "name": r[1], "type": r[2], "area": r[3], "distance_m": round(r[4], 2)}
+        for r in rows
+    ]
+    # The cursor holds the index order key of the last row (repr keeps the float exact)
+    next_cursor = f"{rows[-1][5]!r}:{rows[-1][0]}" if len(rows) == k else None
+    return {"parks": parks, "next_cursor": next_cursor}
@@ -0,0 +1,28 @@
+# Tiles router for the Green Spaces Accessibility API
+# This module serves green areas (and optionally the street network) as Mapbox Vector Tiles
+# so the frontend can render the whole city without downloading full-precision GeoJSON.
+
+# importing necessary libraries
+from fastapi import APIRouter, HTTPException, Response
+from API.tiles import LAYERS, MAX_ZOOM, get_tile
+
+# Creating the router for tile endpoints
+router = APIRouter(prefix="/tiles", tags=["Tiles"])
+
+
+# Endpoint to get one vector tile
+@router.get("/{z}/{x}/{y}.mvt")
+async def vector_tile(z: int, x: int, y: int, layers: str = "green_areas"):
+    """
+    Mapbox Vector Tile for tile z/x/y. `layers` is a comma separated list of
+    `green_areas` and `ways` (ways are only drawn from zoom 14 on).
+    """
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+    requested = tuple(dict.fromkeys(layer.strip() for layer in layers.split(",") if layer.strip()))
+    if not requested or any(layer not in LAYERS for layer in requested):
+        raise HTTPException(status_code=400, detail=f"layers must be a subset of {', '.join(LAYERS)}")
+
+    tile = await get_tile(z, x, y, requested)
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
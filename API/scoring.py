@@ -0,0 +1,122 @@
+# Scoring kernels for the Green Spaces Accessibility API
+# The four sub-scores (proximity, quantity, area, diversity) and the weighted total are computed
+# with NumPy over flat arrays of (point, park) candidates, so one call scores one point or thousands.
+
+# importing necessary libraries
+import numpy as np
+
+# Parks closer than this (in metres) count as "inside" a green area
+INSIDE_THRESHOLD = 10
+
+# Total park area (m2) that gives the maximum area score
+AREA_SATURATION = 50000
+
+# Weights of each component in the final accessibility score
+WEIGHTS = {
+    "proximity": 0.4,
+    "area": 0.3,
+    "quantity": 0.2,
+    "diversity": 0.1,
+}
+
+
+def encode_types(types):
+    """
+    Maps park type names to integer codes, using -1 for missing types.
+    """
+    codes = {}
+    return np.array(
+        [-1 if t is None else codes.setdefault(t, len(codes)) for t in types],
+        dtype=np.int64,
+    )
+
+
+def score_points(n_points, point_idx, distances, areas, type_codes, buffer_m):
+    """
+    Green Accessibility Score for `n_points` points at once.
+
+    Each candidate park is one entry in the flat arrays: `point_idx` says which
+    point it belongs to, `distances` and `areas` are in metres / m2 and
+    `type_codes` comes from `encode_types`. Points without candidates score 0.
+
+    Returns a dict of arrays (one value per point) with the four sub-scores,
+    the weighted total and the number of parks found.
+    """
+    point_idx = np.asarray(point_idx, dtype=np.int64)
+    distances = np.asarray(distances, dtype=np.float64)
+    areas = np.asarray(areas, dtype=np.float64)
+    type_codes = np.asarray(type_codes, dtype=np.int64)
+
+    n_parks = np.bincount(point_idx, minlength=n_points)
+    has_parks = n_parks > 0
+
+    # Proximity score: 10 when inside a park, else the mean linear decay over the buffer
+    nearest = np.full(n_points, np.inf)
+    np.minimum.at(nearest, point_idx, distances)
+    contribution = np.clip(1 - distances / buffer_m, 0, None)
+    proximity_total = np.bincount(point_idx, weights=contribution, minlength=n_points)
+    mean_contribution = np.divide(
+        proximity_total, n_parks, out=np.zeros(n_points), where=has_parks
+    )
+    proximity = np.where(nearest <= INSIDE_THRESHOLD, 10.0, mean_contribution * 10)
+
+    # Quantity score: saturating in the number of parks found
+    quantity = (1 - np.exp(-n_parks / 5)) * 10
+
+    # Area score: based on total area of parks found
+    total_area = np.bincount(point_idx, weights=areas, minlength=n_points)
+    area = np.minimum(1, total_area / AREA_SATURATION) * 10
+
+    # Diversity score: normalised Shannon entropy of park types
+    typed = type_codes >= 0
+    n_types = int(type_codes.max()) + 1 if typed.any() else 1
+    pairs, pair_counts = np.unique(
+        point_idx[typed] * n_types + type_codes[typed], return_counts=True
+    )
+    pair_point = pairs // n_types
+    n_typed = np.bincount(point_idx[typed], minlength=n_points)
+    p = pair_counts / n_typed[pair_point]
+    entropy = np.bincount(pair_point, weights=-p * np.log(p), minlength=n_points)
+    distinct = np.bincount(pair_point, minlength=n_points)
+    # A single type (however many parks) has no diversity
+    diverse = (n_typed > 1) & (distinct > 1)
+    diversity = np.divide(
+        entropy, np.log(np.maximum(distinct, 2)), out=np.zeros(n_points), where=diverse
+    ) * 10
+
+    # Final accessibility score: weighted average of all components
+    total = (
+        WEIGHTS["proximity"] * proximity +
+        WEIGHTS["area"] * area +
+        WEIGHTS["quantity"] * quantity +
+        WEIGHTS["diversity"] * diversity
+    )
+
+    zero = ~has_parks
+    for arr in (proximity, quantity, area, diversity, total):
+        arr[zero] = 0.0
+
+    return {
+        "accessibility_score": total,
+        "proximity": proximity,
+        "quantity": quantity,
+        "area": area,
+        "diversity": diversity,
+        "parks_found": n_parks,
+    }
+
+
+def point_scores(scores, i):
+    """
+    Formats the scores of point `i` the way the API returns them.
+    """
+    return {
+        "accessibility_score": round(float(scores["accessibility_score"][i]), 2),
+        "scores": {
+            "proximity": round(float(scores["proximity"][i]), 2),
+            "quantity": round(float(scores["quantity"][i]), 2),
+            "area": round(float(scores["area"][i]), 2),
+            "diversity": round(float(scores["diversity"][i]), 2),
+        },
+        "parks_found": int(scores["parks_found"][i]),
+    }
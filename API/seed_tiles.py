@@ -0,0 +1,54 @@
+# Tile cache seeding for the Green Spaces Accessibility API
+# Renders every vector tile covering the city bounding box into the disk tile cache, so the
+# first map views after an ETL run are served from the cache too.
+#
+# Usage: python -m API.seed_tiles --min-zoom 10 --max-zoom 16
+
+# importing necessary libraries
+import argparse
+import asyncio
+from API.db import open_pool, close_pool
+from API.tiles import LAYERS, MAX_ZOOM, get_tile, tiles_for_bbox
+
+# Same as CITY_BBOX in ETL/src/pipeline/config.py (south, west, north, east)
+DEFAULT_BBOX = (38.691, -9.229, 38.796, -9.091)
+
+
+async def seed(bbox, min_zoom, max_zoom, layers, concurrency, refresh):
+    await open_pool()
+    try:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def seed_one(z, x, y):
+            async with semaphore:
+                await get_tile(z, x, y, layers, refresh=refresh)
+
+        for z in range(min_zoom, max_zoom + 1):
+            tiles = list(tiles_for_bbox(bbox, z))
+            await asyncio.gather(*(seed_one(z, x, y) for x, y in tiles))
+            print(f"Seeded {len(tiles)} tiles at zoom {z}")
+    finally:
+        await close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render vector tiles into the tile cache")
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("SOUTH", "WEST", "NORTH", "EAST"), default=DEFAULT_BBOX)
+    parser.add_argument("--layers", default="green_areas", help="comma separated: " + ", ".join(LAYERS))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--refresh", action="store_true", help="re-render tiles already in the cache")
+    args = parser.parse_args()
+
+    layers = tuple(layer.strip() for layer in args.layers.split(",") if layer.strip())
+    if any(layer not in LAYERS for layer in layers):
+        parser.error(f"--layers must be a subset of {', '.join(LAYERS)}")
+    if not 0 <= args.min_zoom <= args.max_zoom <= MAX_ZOOM:
+        parser.error(f"zooms must satisfy 0 <= min-zoom <= max-zoom <= {MAX_ZOOM}")
+
+    asyncio.run(seed(tuple(args.bbox), args.min_zoom, args.max_zoom, layers, args.concurrency, args.refresh))
+
+
+if __name__ == "__main__":
+    main()
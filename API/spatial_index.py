@@ -0,0 +1,93 @@
+# In-memory spatial index of the green areas for the Green Spaces Accessibility API
+# `green_areas` only changes once per ETL run, so the polygons are loaded into a Shapely STRtree
+# at startup and point-in-park / radius lookups are answered in-process instead of by PostGIS.
+# The index is rebuilt (and swapped in atomically) when the dataset version changes.
+
+# importing necessary libraries
+import asyncio
+import numpy as np
+import shapely
+from API.dataset import VersionedResource
+from API.db import get_connection
+from API.grid import EARTH_RADIUS_M
+
+GREEN_AREAS_QUERY = """
+    SELECT id, name, ST_AsBinary(geom_3857)
+    FROM green_areas
+    WHERE geom_3857 IS NOT NULL
+    ORDER BY id;
+"""
+
+
+def to_web_mercator(lats, lons):
+    """
+    Vectorized WGS84 -> EPSG:3857 projection of coordinate arrays.
+    """
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return EARTH_RADIUS_M * lons, EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + lats / 2))
+
+
+class GreenAreaIndex:
+    """
+    STRtree over the EPSG:3857 green area polygons (prepared for repeated
+    predicates), with the ids and names needed by the spatial endpoints.
+    Lookups take coordinate arrays and are answered with bulk tree queries.
+    """
+
+    def __init__(self, ids, names, geometries):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.names = list(names)
+        self.geometries = np.asarray(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(
+            [r[0] for r in rows],
+            [r[1] for r in rows],
+            shapely.from_wkb([bytes(r[2]) for r in rows]),
+        )
+
+    def containing(self, lats, lons):
+        """
+        For every point, the position of a green area containing it (the one
+        with the lowest id when several overlap), or -1.
+        """
+        points = shapely.points(*to_web_mercator(lats, lons))
+        # Bounding box candidates first, then the exact test on the prepared polygons
+        point_idx, area_idx = self.tree.query(points)
+        inside = shapely.contains(self.geometries[area_idx], points[point_idx])
+        point_idx, area_idx = point_idx[inside], area_idx[inside]
+
+        # Positions follow id order, so the lowest position is the lowest id
+        result = np.full(len(points), len(self.geometries), dtype=np.int64)
+        np.minimum.at(result, point_idx, area_idx)
+        result[result == len(self.geometries)] = -1
+        return result
+
+    def within_distance(self, lats, lons, distance_m: float):
+        """
+        (point position, green area position) pairs for every green area
+        within `distance_m` (EPSG:3857 metres, like ST_DWithin on geom_3857).
+        """
+        points = shapely.points(*to_web_mercator(lats, lons))
+        point_idx, area_idx = self.tree.query(points, predicate="dwithin", distance=distance_m)
+        order = np.lexsort((area_idx, point_idx))
+        return point_idx[order], area_idx[order]
+
+
+async def load_green_area_index():
+    """
+    Reads the green area polygons and builds the index off the event loop.
+    """
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(GREEN_AREAS_QUERY)
+            rows = await cur.fetchall()
+    return await asyncio.to_thread(GreenAreaIndex.from_rows, rows)
+
+
+# Shared index, loaded at startup and rebuilt when the dataset version changes
+green_area_index = VersionedResource(load_green_area_index)
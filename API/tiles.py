@@ -0,0 +1,265 @@
+# Vector tile rendering and caching for the Green Spaces Accessibility API
+# Tiles are rendered by PostGIS (ST_AsMVT) from the precomputed EPSG:3857 geometries and
+# cached in memory and on disk under the dataset version, so a map pan is mostly cache reads.
+# After an incremental ETL run only the tiles over the changed areas are dropped.
+
+# importing necessary libraries
+import asyncio
+import math
+import os
+import shutil
+from API.cache import ResultCache
+from API.dataset import dataset_changes, dataset_version
+from API.db import get_connection
+
+# Tile cache settings, overridable from the environment
+TILE_CACHE_DIR = os.environ.get("GSA_TILE_CACHE_DIR", "tile_cache")  # empty to disable the disk cache
+TILE_CACHE_MAX_BYTES = int(os.environ.get("GSA_TILE_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# MVT settings
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+WAYS_MIN_ZOOM = 14  # the street network is only drawn from this zoom on
+LAYERS = ("green_areas", "ways")
+
+# Width of the EPSG:3857 world in metres
+WORLD_SIZE_M = 2 * math.pi * 6378137.0
+
+GREEN_AREAS_LAYER_QUERY = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+    ),
+    features AS (
+        SELECT
+            g.id,
+            g.name,
+            t.type,
+            g.area_m2,
+            ST_AsMVTGeom(
+                ST_SimplifyPreserveTopology(g.geom_3857, %(tolerance)s),
+                b.geom, %(extent)s, %(buffer)s, true
+            ) AS geom
+        FROM green_areas g
+        JOIN types t
+            ON g.type_id = t.id
+        CROSS JOIN bounds b
+        WHERE g.geom_3857 && b.geom
+    )
+    SELECT ST_AsMVT(features.*, 'green_areas', %(extent)s, 'geom')
+    FROM features
+    WHERE geom IS NOT NULL;
+"""
+
+WAYS_LAYER_QUERY = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+    ),
+    features AS (
+        SELECT
+            w.id,
+            w.length_m,
+            ST_AsMVTGeom(
+                ST_Simplify(ST_Transform(w.geometry, 3857), %(tolerance)s),
+                b.geom, %(extent)s, %(buffer)s, true
+            ) AS geom
+        FROM ways w
+        CROSS JOIN bounds b
+        WHERE w.geometry && ST_Transform(b.geom, 4326)
+    )
+    SELECT ST_AsMVT(features.*, 'ways', %(extent)s, 'geom')
+    FROM features
+    WHERE geom IS NOT NULL;
+"""
+
+LAYER_QUERIES = {
+    "green_areas": GREEN_AREAS_LAYER_QUERY,
+    "ways": WAYS_LAYER_QUERY,
+}
+
+# Rendered tiles kept in memory, bounded by their byte size
+tile_cache = ResultCache(max_bytes=TILE_CACHE_MAX_BYTES, ttl=math.inf)
+
+_disk_version = None
+# Held while the disk cache moves to a new version, so no tile is read or written meanwhile
+_disk_lock = asyncio.Lock()
+
+
+def simplify_tolerance(z: int) -> float:
+    """
+    Half a screen pixel (256 px tiles) at zoom `z`, in EPSG:3857 metres.
+    """
+    return WORLD_SIZE_M / (256 * 2 ** z) / 2
+
+
+def tile_range(bbox, z: int):
+    """
+    (x_min, x_max, y_min, y_max) of the tiles covering a (south, west, north, east) bbox at zoom `z`.
+    """
+    south, west, north, east = bbox
+    n = 2 ** z
+
+    def tile_x(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def tile_y(lat):
+        lat = math.radians(lat)
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return tile_x(west), tile_x(east), tile_y(north), tile_y(south)
+
+
+def tiles_for_bbox(bbox, z: int):
+    """
+    Yields the (x, y) tiles covering a (south, west, north, east) bbox at zoom `z`.
+    """
+    x_min, x_max, y_min, y_max = tile_range(bbox, z)
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            yield x, y
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """
+    (west, south, east, north) of a tile in degrees, grown by the MVT buffer
+    since features that close are drawn in it too.
+    """
+    n = 2 ** z
+    pad = TILE_BUFFER / TILE_EXTENT
+
+    def lon(tx):
+        return (tx / n) * 360 - 180
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return (lon(x - pad), lat(y + 1 + pad), lon(x + 1 + pad), lat(y - pad))
+
+
+def _tile_path(version, layers, z, x, y):
+    return os.path.join(TILE_CACHE_DIR, version or "unversioned", "+".join(layers), str(z), str(x), f"{y}.mvt")
+
+
+def _read_tile(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_tile(path, tile):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(tile)
+    os.replace(tmp, path)
+
+
+def _disk_cache_version():
+    # Version directory most recently written to by a previous process, if any
+    if not os.path.isdir(TILE_CACHE_DIR):
+        return None
+    entries = [e for e in os.scandir(TILE_CACHE_DIR) if e.is_dir() and e.name != "unversioned"]
+    return max(entries, key=lambda e: e.stat().st_mtime).name if entries else None
+
+
+def _drop_changed_tiles(directory, changes):
+    # Removes the tiles of `directory` ({layers}/{z}/{x}/{y}.mvt) drawn over a changed area
+    for layers in os.listdir(directory):
+        boxes = [box for layer, box in changes if layer in layers.split("+")]
+        for z in os.listdir(os.path.join(directory, layers)) if boxes else []:
+            # Grown by one tile for the MVT buffer
+            ranges = [tile_range((south, west, north, east), int(z)) for west, south, east, north in boxes]
+            for x in os.listdir(os.path.join(directory, layers, z)):
+                x_dir = os.path.join(directory, layers, z, x)
+                for name in os.listdir(x_dir):
+                    if not name.endswith(".mvt"):
+                        continue
+                    y = int(name[:-4])
+                    if any(x0 - 1 <= int(x) <= x1 + 1 and y0 - 1 <= y <= y1 + 1 for x0, x1, y0, y1 in ranges):
+                        os.remove(os.path.join(x_dir, name))
+
+
+def _prune_disk_cache(version, previous=None, changes=None):
+    # Tiles of older dataset versions can never be served again, except the ones
+    # an incremental update did not touch: those move to the new version
+    if not os.path.isdir(TILE_CACHE_DIR):
+        return
+    current = os.path.join(TILE_CACHE_DIR, version or "unversioned")
+    if previous and changes is not None and not os.path.exists(current):
+        old = os.path.join(TILE_CACHE_DIR, previous)
+        if os.path.isdir(old):
+            _drop_changed_tiles(old, changes)
+            os.replace(old, current)
+    for name in os.listdir(TILE_CACHE_DIR):
+        if name != (version or "unversioned"):
+            shutil.rmtree(os.path.join(TILE_CACHE_DIR, name), ignore_errors=True)
+
+
+async def _switch_disk_version(version):
+    """
+    Moves the disk cache to `version` (carrying over the tiles an incremental
+    update did not touch) once, whatever the number of concurrent requests.
+    """
+    global _disk_version
+    async with _disk_lock:
+        if version == _disk_version:
+            return
+        previous = _disk_version or await asyncio.to_thread(_disk_cache_version)
+        changes = await dataset_changes(previous, version) if previous != version else None
+        await asyncio.to_thread(_prune_disk_cache, version, previous, changes)
+        _disk_version = version
+
+
+async def render_tile(z: int, x: int, y: int, layers=("green_areas",)) -> bytes:
+    """
+    Renders one Mapbox Vector Tile with the requested layers.
+    """
+    params = {
+        "z": z,
+        "x": x,
+        "y": y,
+        "tolerance": simplify_tolerance(z),
+        "extent": TILE_EXTENT,
+        "buffer": TILE_BUFFER,
+    }
+    tile = b""
+    async with get_connection() as conn:
+        async with conn.cursor() as cur:
+            for layer in layers:
+                if layer == "ways" and z < WAYS_MIN_ZOOM:
+                    continue
+                await cur.execute(LAYER_QUERIES[layer], params)
+                row = await cur.fetchone()
+                # MVT layers are protobuf messages, so tiles concatenate
+                tile += bytes(row[0]) if row and row[0] else b""
+    return tile
+
+
+async def get_tile(z: int, x: int, y: int, layers=("green_areas",), refresh: bool = False) -> bytes:
+    """
+    Returns a tile from the memory cache, then the disk cache, rendering (and
+    caching) it only when neither has it for the current dataset version.
+    """
+    version = await dataset_version()
+    await tile_cache.advance(version)
+    key = (tuple(layers), z, x, y)
+
+    if not refresh:
+        tile = tile_cache.get(key, version)
+        if tile is not tile_cache.MISSING:
+            return tile
+
+    path = _tile_path(version, layers, z, x, y) if TILE_CACHE_DIR else None
+    if path and version != _disk_version:
+        await _switch_disk_version(version)
+
+    tile = None if refresh or not path else await asyncio.to_thread(_read_tile, path)
+    if tile is None:
+        tile = await render_tile(z, x, y, layers)
+        if path:
+            await asyncio.to_thread(_write_tile, path, tile)
+
+    tile_cache.set(key, version, tile, (tile_bounds(z, x, y), tuple(layers)))
+    return tile
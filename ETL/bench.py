@@ -0,0 +1,164 @@
+"""
+Transform benchmark on synthetic cities of growing size (see synthetic.py).
+Records wall time, peak traced memory and output rows of every transform
+stage at each scale, so super-linear stages show up before they hit a real
+extraction.
+
+Usage: python bench.py --scales 1 2 4 8 --output bench_transform.json
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import synthetic
+import src.pipeline as p
+import src.helpers as h
+
+# A stage whose time grows by more than this power of the input growth is flagged
+SUPERLINEAR_EXPONENT = 1.3
+
+
+def measure(stage, func, trace_memory, *args, **kwargs):
+    """
+    Runs one stage and returns (result, metrics). A failing stage is recorded
+    with its error instead of stopping the benchmark.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result, error = func(*args, **kwargs), None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+    metrics = {"seconds": round(time.perf_counter() - t0, 3)}
+    if trace_memory:
+        # Python and NumPy allocations; GEOS memory is only visible in the process RSS
+        metrics["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    # ru_maxrss is in KiB on Linux
+    metrics["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    if error:
+        metrics["error"] = error
+        h.info(f"BENCH: {stage} failed: {error}")
+    return result, metrics
+
+
+def rows(result):
+    # Total rows of a dataframe or tuple of dataframes
+    if result is None:
+        return None
+    frames = result if isinstance(result, tuple) else (result,)
+    return sum(len(df) for df in frames)
+
+
+def spool(data, name):
+    """
+    Writes `data` to a temporary file and returns it as the streamed
+    elements the extract hands to the transform.
+    """
+    directory = tempfile.mkdtemp(prefix=f"gsa_bench_{name}_")
+    path = os.path.join(directory, "tile_0.json")
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return p.OverpassElements(directory, [path])
+
+
+def run_scale(scale, areas_per_km2, spacing_m, seed, grid, trace_memory, stream=False):
+    bbox, green_areas_data, routing_data = synthetic.generate_scaled_city(scale, areas_per_km2, spacing_m, seed)
+    run = {
+        "scale": scale,
+        "bbox": bbox,
+        "green_area_elements": len(green_areas_data["elements"]),
+        "routing_elements": len(routing_data["elements"]),
+        "stream": stream,
+        "stages": {},
+    }
+    if stream:
+        # Parse from disk like a real run, without the decoded payload in memory
+        green_areas_data, routing_data = spool(green_areas_data, "green_areas"), spool(routing_data, "routing")
+    stages = run["stages"]
+
+    green, stages["transform_green_areas_data"] = measure(
+        "transform_green_areas_data", p.transform_green_areas_data, trace_memory, green_areas_data
+    )
+    routing, stages["transform_routing_data"] = measure(
+        "transform_routing_data", p.transform_routing_data, trace_memory, routing_data
+    )
+    nearest = None
+    if green is not None and routing is not None:
+        nearest, stages["transform_nearest_park_data"] = measure(
+            "transform_nearest_park_data", p.transform_nearest_park_data, trace_memory, green[1], *routing
+        )
+        if grid:
+            # Single worker so the traced memory covers the scoring
+            grid_result, stages["build_score_grid"] = measure(
+                "build_score_grid", p.build_score_grid, trace_memory,
+                types_df=green[0], ga_gdf=green[1], bbox=bbox, workers=1,
+            )
+            stages["build_score_grid"]["rows"] = rows(grid_result)
+
+    for name, result in (("transform_green_areas_data", green), ("transform_routing_data", routing),
+                         ("transform_nearest_park_data", nearest)):
+        if name in stages:
+            stages[name]["rows"] = rows(result)
+    if stream:
+        green_areas_data.close()
+        routing_data.close()
+    return run
+
+
+def flag_superlinear(runs):
+    """
+    Compares consecutive scales: a stage whose time grows faster than
+    input_growth ** SUPERLINEAR_EXPONENT is a scaling cliff candidate.
+    """
+    flags = []
+    for prev, curr in zip(runs, runs[1:]):
+        growth = curr["scale"] / prev["scale"]
+        for name, metrics in curr["stages"].items():
+            before = prev["stages"].get(name, {})
+            if before.get("seconds", 0) < 0.05 or "error" in metrics or "error" in before:
+                continue
+            ratio = metrics["seconds"] / before["seconds"]
+            if ratio > growth ** SUPERLINEAR_EXPONENT:
+                flags.append(f"{name}: x{ratio:.1f} time for x{growth:g} input ({prev['scale']:g} -> {curr['scale']:g})")
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL transform on synthetic cities")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--areas-per-km2", type=float, default=40)
+    parser.add_argument("--spacing", type=float, default=100, help="street grid spacing in metres")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid", action="store_true", help="also benchmark build_score_grid")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (it slows the stages down)")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse the input from files like the extract does, instead of decoded dicts")
+    parser.add_argument("--output", default="bench_transform.json")
+    args = parser.parse_args()
+
+    runs = []
+    for scale in sorted(args.scales):
+        h.info(f"BENCH: Scale {scale:g}...")
+        run = run_scale(scale, args.areas_per_km2, args.spacing, args.seed, args.grid, not args.no_memory, args.stream)
+        runs.append(run)
+        for name, m in run["stages"].items():
+            h.info(f"BENCH: scale {scale:g} {name}: {m['seconds']:.3f} s, "
+                   f"peak {m.get('peak_mb', '-')} MB, rows {m.get('rows')}{' ERROR' if 'error' in m else ''}")
+
+    flags = flag_superlinear(runs)
+    for line in flags:
+        h.info(f"BENCH: SUPERLINEAR {line}")
+
+    with open(args.output, "w") as f:
+        json.dump({"runs": runs, "superlinear": flags}, f, indent=2)
+    h.done(f"BENCH: Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,17 @@
+import argparse
+
 import src.pipeline as p
 import src.helpers as h
 
-def extract()-> list:
+def extract(cache=None)-> list:
     h.info("EXTRACT: Data from Overpass API...")
     try:
-        green_areas_data = p.extract_green_areas_data()
-        if green_areas_data is None:
+        # Both datasets share one pool of tile downloads
+        datasets = p.extract_datasets(["green_areas", "routing"], cache=cache)
+        green_areas_data, routing_data = datasets["green_areas"], datasets["routing"]
+        if next(iter(green_areas_data), None) is None:
             h.die("No data extracted for green areas. Exiting")
             return
-        routing_data = p.extract_routing_data()
     except Exception as e:
         h.die(f"Extraction failed:  {e}")
     raw_data = [green_areas_data, routing_data]
@@ -17,10 +20,23 @@ def extract()-> list:
 def transform(raw_data)-> list:
     h.info("TRANSFORM: Raw data...")
     try:
-        dfs = p.transform_green_areas_data(raw_data[0])
-        routing_dfs = p.transform_routing_data(raw_data[1])
+        with h.step("green_areas"):
+            parsed_gdf = p.parse_green_areas(raw_data[0])
+            dfs = p.transform_green_areas_data(parsed_gdf)
+        with h.step("routing"):
+            routing_dfs = p.transform_routing_data(raw_data[1])
         dfs = list(dfs)
         dfs.extend(list(routing_dfs))
+        # Per-vertex network distance to the nearest park needs both green areas and ways
+        with h.step("nearest_park"):
+            dfs[3], park_vertices_df = p.transform_nearest_park_data(*dfs[1:4])
+        dfs.append(park_vertices_df)
+        # Elements as extracted, the baseline of the next incremental run
+        with h.step("element_state"):
+            dfs.append(p.osm_element_state(parsed_gdf, raw_data[1]))
+        # The spooled Overpass responses are not needed anymore
+        for data in raw_data:
+            data.close()
         for df in dfs:
             if df is None or df.empty:
                 h.die(f'{df} is empty or None. Exiting.')
@@ -33,7 +49,7 @@ def load(dfs: list)-> None:
     engine = p.get_engine()
     
     # Define order carefully: 'types' must be loaded before 'green_areas'
-    target_tables = ['types', 'green_areas', 'ways', 'vertices']
+    target_tables = ['types', 'green_areas', 'ways', 'vertices', 'park_vertices', 'osm_elements']
     
     h.info("LOAD: Data into database...")
     h.info(f"LOAD: Cleaning existing data from target tables: {', '.join(target_tables[:-1])} and {target_tables[-1]}")
@@ -47,17 +63,101 @@ def load(dfs: list)-> None:
             p.load_data(engine, dfs[i], target_tables[i])
     except Exception as e:
         h.die(f"Error loading data into '{target_tables[i]}' table: {e}")
+
+    # Ids were rewritten: the API must drop what it cached from the previous tables right away,
+    # not only once the grid is built (the grid stage publishes again for its own table)
+    try:
+        p.publish_dataset_version(engine)
+    except Exception as e:
+        h.die(f"Failed to publish the dataset version: {e}")
+    engine.dispose()
+
+def grid(dfs: list)-> None:
+    h.info("GRID: Precomputing accessibility scores...")
+    try:
+        with h.step("build"):
+            meta_df, grid_gdf = p.build_score_grid(types_df=dfs[0], ga_gdf=dfs[1])
+    except Exception as e:
+        h.die(f"Grid scoring failed: {e}")
+
+    engine = p.get_engine()
+    grid_tables = ['accessibility_grid_meta', 'accessibility_grid']
+    try:
+        p.truncate_tables(engine, grid_tables)
+        p.load_data(engine, meta_df, grid_tables[0])
+        p.load_data(engine, grid_gdf, grid_tables[1])
+        p.publish_dataset_version(engine)
+    except Exception as e:
+        h.die(f"Error loading the accessibility grid: {e}")
+    engine.dispose()
+
+def incremental(raw_data)-> bool:
+    h.info("INCREMENTAL: Applying the changes since the last run...")
+    engine = p.get_engine()
+    try:
+        changes = p.run_incremental(engine, raw_data)
+    except Exception as e:
+        h.die(f"Incremental update failed: {e}")
     engine.dispose()
+    if changes is None:
+        h.info("INCREMENTAL: No recorded state from a previous run, running a full ETL instead")
+        return False
+    for data in raw_data:
+        data.close()
+    return True
     
 def main():
+    parser = argparse.ArgumentParser(description="Green spaces ETL")
+    parser.add_argument("--cprofile", metavar="STEP",
+                        help="capture a cProfile of one step, by name or path (e.g. cookie_cutter, transform/routing)")
+    parser.add_argument("--no-trace-memory", action="store_true",
+                        help="skip tracemalloc, which slows allocation-heavy steps down")
+    parser.add_argument("--report-dir", default=p.PROFILE_REPORT_DIR,
+                        help="directory of the JSON run report (empty to skip it)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only recompute and upsert what changed since the last run")
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument("--refresh-cache", action="store_true",
+                            help="download everything again and overwrite the cached responses")
+    cache_mode.add_argument("--no-cache", action="store_true", help="neither read nor write the response cache")
+    cache_mode.add_argument("--offline", action="store_true",
+                            help="replay the cached responses whatever their age, fail if one is missing")
+    parser.add_argument("--cache-max-age", type=float, default=p.OVERPASS_CACHE_MAX_AGE_H, metavar="HOURS",
+                        help="cached responses older than this are downloaded again")
+    args = parser.parse_args()
+    h.profiler.configure(
+        trace_memory=not args.no_trace_memory, cprofile_step=args.cprofile, report_dir=args.report_dir or None
+    )
+
+    cache = None
+    if not args.no_cache:
+        mode = "refresh" if args.refresh_cache else "offline" if args.offline else "use"
+        cache = p.OverpassCache(p.OVERPASS_CACHE_DIR, max_age_h=args.cache_max_age, mode=mode)
+
     h.info("START: ETL Process...")
-    raw_data, t1, m1 = h.time_this_function(extract)
-    h.info(m1)
-    dfs, t2, m2 = h.time_this_function(transform, raw_data=raw_data)
-    h.info(m2)
-    r3 = h.time_this_function(load, dfs=dfs)
-    h.info(r3[-1])
-    h.done(f"ETL COMPLETED IN {t1+t2+r3[-2]:.3f} SECONDS")
+    try:
+        with h.step("extract"):
+            raw_data, t1, m1 = h.time_this_function(extract, cache=cache)
+        h.info(m1)
+        if args.incremental:
+            with h.step("incremental"):
+                applied, t2, m2 = h.time_this_function(incremental, raw_data=raw_data)
+            h.info(m2)
+            if applied:
+                h.done(f"INCREMENTAL ETL COMPLETED IN {t1+t2:.3f} SECONDS")
+        with h.step("transform"):
+            dfs, t2, m2 = h.time_this_function(transform, raw_data=raw_data)
+        h.info(m2)
+        with h.step("load"):
+            r3 = h.time_this_function(load, dfs=dfs)
+        h.info(r3[-1])
+        with h.step("grid"):
+            r4 = h.time_this_function(grid, dfs=dfs)
+        h.info(r4[-1])
+    finally:
+        # Failed runs get a report too, with the error on the step that stopped them
+        h.profiler.write_report()
+    h.done(f"ETL COMPLETED IN {t1+t2+r3[-2]+r4[-2]:.3f} SECONDS")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -5,6 +5,11 @@ DROP TABLE IF EXISTS types CASCADE;
 DROP TABLE IF EXISTS green_areas CASCADE;
 DROP TABLE IF EXISTS vertices CASCADE;
 DROP TABLE IF EXISTS ways CASCADE;
+DROP TABLE IF EXISTS park_vertices CASCADE;
+DROP TABLE IF EXISTS accessibility_grid CASCADE;
+DROP TABLE IF EXISTS accessibility_grid_meta CASCADE;
+DROP TABLE IF EXISTS osm_elements CASCADE;
+DROP TABLE IF EXISTS dataset_changes CASCADE;
 
 -- 1. Reference table
 CREATE TABLE IF NOT EXISTS types (
@@ -18,14 +23,25 @@ CREATE TABLE IF NOT EXISTS green_areas (
     osm_id BIGINT,
     name TEXT,
     type_id INTEGER,
+    area_m2 FLOAT, -- Precomputed area in EPSG:3857
     geometry GEOMETRY(MultiPolygon, 4326),
+    geom_3857 GEOMETRY(MultiPolygon, 3857), -- Precomputed metric geometry for distance/buffer queries
+    geometry_medium GEOMETRY(MultiPolygon, 4326), -- Simplified (5 m) for lighter responses
+    geometry_low GEOMETRY(MultiPolygon, 4326),    -- Simplified (25 m) for zoomed-out views
     CONSTRAINT fk_type FOREIGN KEY (type_id) REFERENCES types(id)
 );
 
 -- 3. The vertices (Nodes)
 -- We use 'id' to match the 'source' and 'target' in the ways table.
+-- park_* / pred_* hold the precomputed walk to the nearest green area:
+-- follow pred_edge to pred_vertex until reaching a vertex with no predecessor.
 CREATE TABLE IF NOT EXISTS vertices (
     id INTEGER PRIMARY KEY,
+    osm_id BIGINT,         -- OSM node, keeps the id stable across incremental ETL runs
+    park_distance_m FLOAT, -- Network distance to the nearest green area
+    park_id INTEGER,       -- Refers to green_areas.id
+    pred_vertex INTEGER,   -- Next vertex towards the park (refers to vertices.id)
+    pred_edge INTEGER,     -- Way leading to pred_vertex (refers to ways.id)
     geometry GEOMETRY(Point, 4326)
 );
 
@@ -41,9 +57,18 @@ CREATE TABLE IF NOT EXISTS ways (
     geometry GEOMETRY(LineString, 4326)
 );
 
+-- 4b. Park access points: vertices on or next to each green area
+CREATE TABLE IF NOT EXISTS park_vertices (
+    park_id INTEGER,   -- Refers to green_areas.id
+    vertex_id INTEGER, -- Refers to vertices.id
+    offset_m FLOAT,    -- Straight-line distance from the vertex to the park
+    PRIMARY KEY (park_id, vertex_id)
+);
+
 -- 5. feedback Table
 CREATE TABLE IF NOT EXISTS feedback (
     id SERIAL PRIMARY KEY,
+    uuid UUID UNIQUE, -- Id returned to the client (client-supplied or generated by the API)
     lat FLOAT,
     lon FLOAT,
     liked BOOLEAN,
@@ -54,8 +79,73 @@ CREATE TABLE IF NOT EXISTS feedback (
     diversity_score FLOAT,
     timestamp TIMESTAMP
 );
+-- feedback is kept across ETL runs, so older databases get the column here
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS uuid UUID UNIQUE;
+
+-- 6. Precomputed accessibility score grid
+-- Cell (row_idx, col_idx) is centred at origin + (col_idx + 0.5, row_idx + 0.5) * cell_m in EPSG:3857
+CREATE TABLE IF NOT EXISTS accessibility_grid_meta (
+    id INTEGER PRIMARY KEY,
+    origin_x FLOAT,
+    origin_y FLOAT,
+    cell_m FLOAT,
+    n_rows INTEGER,
+    n_cols INTEGER,
+    buffer_m FLOAT
+);
+
+CREATE TABLE IF NOT EXISTS accessibility_grid (
+    row_idx INTEGER,
+    col_idx INTEGER,
+    accessibility_score FLOAT,
+    proximity_score FLOAT,
+    quantity_score FLOAT,
+    area_score FLOAT,
+    diversity_score FLOAT,
+    parks_found INTEGER,
+    geometry GEOMETRY(Point, 4326),
+    PRIMARY KEY (row_idx, col_idx)
+);
+
+-- 7. Dataset version, written at the end of every ETL run so API caches can tell when data changed
+CREATE TABLE IF NOT EXISTS dataset_version (
+    id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL,
+    loaded_at TIMESTAMP NOT NULL
+);
+
+-- 8. OSM elements of the last extraction, compared by incremental ETL runs to find what changed
+CREATE TABLE IF NOT EXISTS osm_elements (
+    dataset TEXT,         -- 'green_areas' or 'routing'
+    osm_type TEXT,
+    osm_id BIGINT,
+    version INTEGER,      -- OSM version
+    content_hash BIGINT,  -- Tags, nodes and coordinates (a moved node keeps the way version)
+    geometry GEOMETRY(Geometry, 3857), -- Parsed green area, before overlap resolution (NULL for ways)
+    PRIMARY KEY (dataset, osm_type, osm_id)
+);
+
+-- 9. Areas touched by each incremental ETL run, so API caches only drop what is inside them
+-- (a version without rows here was a full reload)
+CREATE TABLE IF NOT EXISTS dataset_changes (
+    id SERIAL PRIMARY KEY,
+    version TEXT NOT NULL,
+    previous_version TEXT NOT NULL,
+    layer TEXT NOT NULL,  -- 'green_areas' or 'ways'
+    bbox GEOMETRY(Polygon, 4326),
+    changed_at TIMESTAMP NOT NULL
+);
 
--- 5. Critical Indices for Performance
+-- 10. Critical Indices for Performance
 CREATE INDEX IF NOT EXISTS idx_green_areas_geom ON green_areas USING GIST (geometry);
+CREATE INDEX IF NOT EXISTS idx_green_areas_geom_3857 ON green_areas USING GIST (geom_3857);
+CREATE INDEX IF NOT EXISTS idx_green_areas_area ON green_areas (area_m2);
 CREATE INDEX IF NOT EXISTS idx_ways_geom ON ways USING GIST (geometry);
-CREATE INDEX IF NOT EXISTS idx_vertices_geom ON vertices USING GIST (geometry);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_ways_osm_id ON ways (osm_id);
+CREATE INDEX IF NOT EXISTS idx_ways_source ON ways (source);
+CREATE INDEX IF NOT EXISTS idx_ways_target ON ways (target);
+CREATE INDEX IF NOT EXISTS idx_vertices_osm_id ON vertices (osm_id);
+CREATE INDEX IF NOT EXISTS idx_dataset_changes_version ON dataset_changes (version);
+CREATE INDEX IF NOT EXISTS idx_vertices_geom ON vertices USING GIST (geometry);
+CREATE INDEX IF NOT EXISTS idx_park_vertices_vertex ON park_vertices (vertex_id);
+CREATE INDEX IF NOT EXISTS idx_accessibility_grid_geom ON accessibility_grid USING GIST (geometry);
\ No newline at end of file
@@ -1,5 +1,7 @@
 from .geometry import parse_way, parse_relation, ensure_multipolygon
-from .utils import get_super_type, build_overpass_query, build_routing_query, time_this_function
+from .utils import get_super_type, build_overpass_query, build_routing_query, time_this_function, element_hash
 from .logs import init_logger, die, info, done
+from .scoring import score_points, encode_types
+from .profiler import profiler, step
 
 init_logger()
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Stage-level profiler for the ETL: nested steps with wall time, memory
+(tracemalloc peak and process RSS) and row counts, an optional cProfile
+capture of one step, and a JSON report per run.
+
+    with step("transform") as s:
+        with step("cookie_cutter"):
+            ...
+        s.rows = len(gdf)
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from .logs import info
+
+
+def _rss_mb():
+    # Current resident set size (Linux /proc), None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def _max_rss_mb():
+    # Process high-water mark; ru_maxrss is KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+class Step:
+    """One timed step; `rows` can be set by the code inside it."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.rows = None
+        self.seconds = None
+        self.peak_traced_mb = None
+        self.rss_mb = None
+        self.max_rss_mb = None
+        self.cprofile = None
+        self.error = None
+        self.children = []
+        self._peak = 0  # highest traced bytes seen so far, children included
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "seconds": self.seconds,
+            "rows": self.rows,
+            "peak_traced_mb": self.peak_traced_mb,
+            "rss_mb": self.rss_mb,
+            "max_rss_mb": self.max_rss_mb,
+        }
+        if self.error:
+            d["error"] = self.error
+        if self.cprofile:
+            d["cprofile"] = self.cprofile
+        if self.children:
+            d["children"] = [c.to_dict() for c in self.children]
+        return d
+
+
+class Profiler:
+    """
+    Collects the step tree of one ETL run. Memory tracing (tracemalloc) makes
+    allocation-heavy steps noticeably slower, so it can be turned off.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, trace_memory=True, cprofile_step=None, report_dir=None):
+        self.trace_memory = trace_memory
+        self.cprofile_step = cprofile_step  # step name or path (e.g. "transform/cookie_cutter")
+        self.report_dir = report_dir
+        self.started_at = datetime.now(timezone.utc)
+        self.steps = []
+        self._stack = []
+        self._thread = threading.get_ident()
+
+    @contextmanager
+    def step(self, name, rows=None):
+        if threading.get_ident() != self._thread:
+            # The step tree belongs to the main thread; workers report through record()
+            yield Step(name, name)
+            return
+
+        parent = self._stack[-1] if self._stack else None
+        record = Step(name, f"{parent.path}/{name}" if parent else name)
+        record.rows = rows
+        (parent.children if parent else self.steps).append(record)
+        self._stack.append(record)
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if parent:
+                parent._peak = max(parent._peak, peak)
+            tracemalloc.reset_peak()
+            record._peak = current
+
+        profile = None
+        if self.cprofile_step in (name, record.path):
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.seconds = round(time.perf_counter() - start, 3)
+            if profile:
+                profile.disable()
+                record.cprofile = self._save_profile(profile, record)
+            if self.trace_memory:
+                record._peak = max(record._peak, tracemalloc.get_traced_memory()[1])
+                record.peak_traced_mb = round(record._peak / 2 ** 20, 1)
+                if parent:
+                    parent._peak = max(parent._peak, record._peak)
+                tracemalloc.reset_peak()
+            record.rss_mb = _rss_mb()
+            record.max_rss_mb = _max_rss_mb()
+            self._stack.pop()
+
+    def record(self, name, seconds, rows=None):
+        """
+        Adds an already measured child to the current step, e.g. the summed
+        time of work spread over threads (no memory figures).
+        """
+        parent = self._stack[-1] if self._stack else None
+        record = Step(name, f"{parent.path}/{name}" if parent else name)
+        record.seconds = round(seconds, 3)
+        record.rows = rows
+        (parent.children if parent else self.steps).append(record)
+        return record
+
+    def _save_profile(self, profile, record):
+        # Top functions in the report, full profile next to it for snakeviz/pstats
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(25)
+        summary = {"top": out.getvalue().splitlines()}
+        if self.report_dir:
+            os.makedirs(self.report_dir, exist_ok=True)
+            path = os.path.join(self.report_dir, f"{self._run_id()}_{record.path.replace('/', '.')}.prof")
+            profile.dump_stats(path)
+            summary["file"] = path
+        return summary
+
+    def _run_id(self):
+        return self.started_at.strftime("%Y%m%dT%H%M%SZ")
+
+    def report(self):
+        return {
+            "run_id": self._run_id(),
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "argv": sys.argv,
+            "trace_memory": self.trace_memory,
+            "total_seconds": round(sum(s.seconds or 0 for s in self.steps), 3),
+            "max_rss_mb": _max_rss_mb(),
+            "steps": [s.to_dict() for s in self.steps],
+        }
+
+    def write_report(self):
+        """Writes the JSON report of the run into `report_dir` and returns its path."""
+        if not self.report_dir:
+            return None
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"etl_{self._run_id()}.json")
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        info(f"PROFILE: Run report written to {path}")
+        return path
+
+
+# Shared profiler of the current ETL run
+profiler = Profiler()
+
+
+def step(name, rows=None):
+    """Times a nested step of the current ETL run (see Profiler.step)."""
+    return profiler.step(name, rows)
@@ -0,0 +1,13 @@
+# Scoring kernels used by the ETL to precompute the accessibility grid.
+# They are the ones of API/scoring.py, which scores points live, imported from there so the
+# precomputed grid and the live scores share a single implementation.
+
+import os
+import sys
+
+# The ETL runs from its own folder (python ETL/main.py): make the repository root importable
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from API.scoring import INSIDE_THRESHOLD, AREA_SATURATION, WEIGHTS, encode_types, score_points  # noqa: E402
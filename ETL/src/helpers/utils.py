@@ -1,3 +1,5 @@
+import hashlib
+import json
 from time import time
 
 
@@ -11,20 +13,20 @@ def get_super_type(tags):
     }
     return mapping.get(osm_type, osm_type)
 
-def build_routing_query(bbox):
+def build_routing_query(bbox, timeout=180):
     south, west, north, east = bbox
-    query = f"""[out:json][timeout:180];
+    query = f"""[out:json][timeout:{timeout}];
     (
       way["highway"~"^(motorway|motorway_link|trunk|trunk_link|primary|primary_link|secondary|secondary_link|tertiary|tertiary_link|unclassified|residential|living_street|service|road|track|bus_guideway|escape|raceway|footway|bridleway|steps|corridor|path|cycleway|pedestrian)$"]({south},{west},{north},{east});
     );
-    out geom;
+    out meta geom;
     """
     return query
 
-def build_overpass_query(bbox):
+def build_overpass_query(bbox, timeout=180):
     south, west, north, east = bbox
     
-    query = f"""[out:json][timeout:180];
+    query = f"""[out:json][timeout:{timeout}];
     (
     /* Leisure green spaces */
     way["leisure"~"^(park|garden|playground|nature_reserve|recreation_ground|dog_park)$"]({south},{west},{north},{east});
@@ -38,7 +40,7 @@ def build_overpass_query(bbox):
     way["natural"~"^(wood|grassland|scrub|heath|fell)$"]({south},{west},{north},{east});
     relation["natural"~"^(wood|grassland|scrub|heath|fell)$"]({south},{west},{north},{east});
     );
-    out geom;
+    out meta geom;
     """
 
     return query
@@ -57,4 +59,16 @@ def time_this_function(func, **kwargs) -> str:
     t1 = time()
     t = t1 - t0
     msg = f"DONE: '{func.__name__}' EXECUTED IN {t:.3f} SECONDS"
-    return result, t, msg
\ No newline at end of file
+    return result, t, msg
+
+
+def element_hash(element) -> int:
+    """ Content hash of an Overpass element, as a signed 64-bit integer
+
+        Covers the tags, node list and coordinates (members included), so it
+        also changes when a node of a way is moved, which does not bump the
+        way's OSM version.
+    """
+    content = {key: element.get(key) for key in ("tags", "nodes", "geometry", "members")}
+    digest = hashlib.blake2b(json.dumps(content, sort_keys=True).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
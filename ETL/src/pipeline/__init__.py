@@ -1,4 +1,6 @@
-from .config import DB_CONFIG, OVERPASS_URL, CITY_BBOX
-from .extract import extract_green_areas_data, extract_routing_data
-from .transform import transform_green_areas_data, transform_routing_data
-from .load import load_data, get_engine, truncate_tables  
+from .config import DB_CONFIG, OVERPASS_URL, OVERPASS_ENDPOINTS, OVERPASS_TIMEOUT_S, EXTRACT_TILE_DEG, EXTRACT_MAX_DEPTH, EXTRACT_MAX_TILE_MB, EXTRACT_WORKERS, EXTRACT_SPOOL_DIR, OVERPASS_CACHE_DIR, OVERPASS_CACHE_MAX_AGE_H, CITY_BBOX, SIMPLIFY_TOLERANCES_M, PARK_SEED_DISTANCE_M, GRID_CELL_M, GRID_BUFFER_M, GRID_CHUNK_SIZE, GRID_WORKERS, PROFILE_REPORT_DIR, MERGE_GAP_M, DATASET_CHANGES_KEEP_DAYS
+from .extract import OverpassElements, OverpassCache, extract_datasets, extract_green_areas_data, extract_routing_data
+from .transform import cut_overlaps, parse_green_areas, transform_green_areas_data, transform_routing_data, transform_nearest_park_data
+from .load import load_data, upsert_data, delete_rows, get_engine, truncate_tables, publish_dataset_version, record_dataset_version
+from .grid import build_score_grid
+from .incremental import osm_element_state, run_incremental
@@ -15,7 +15,47 @@ DB_CONFIG = {
 
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 
+# Overpass servers used by the extraction and their rate limits: requests in flight (slots)
+# and minimum seconds between request starts. Mirrors can be added to spread the tiles.
+OVERPASS_ENDPOINTS = {
+    OVERPASS_URL: {"slots": 2, "min_interval_s": 1.0},
+}
+OVERPASS_TIMEOUT_S = 180   # server-side query timeout ([timeout:N]) of the extraction queries, the client waits 30 s more
+
+# Tiled extraction: the bbox is cut into tiles of at most EXTRACT_TILE_DEG degrees, and a tile that
+# times out or returns more than EXTRACT_MAX_TILE_MB is split in four, up to EXTRACT_MAX_DEPTH times
+EXTRACT_TILE_DEG = 0.5
+EXTRACT_MAX_DEPTH = 4
+EXTRACT_MAX_TILE_MB = 128
+EXTRACT_WORKERS = 4        # tiles downloaded at once (still bounded by the endpoint slots)
+EXTRACT_SPOOL_DIR = None   # where the responses are streamed to before parsing, None = system temp dir
+
+# Gzipped cache of the Overpass responses, keyed by query (see `python main.py --help` for the modes)
+OVERPASS_CACHE_DIR = "overpass_cache"
+OVERPASS_CACHE_MAX_AGE_H = 24   # older responses are downloaded again
+
 # bounding box format: south, west, north, east
 CITY_BBOX = (38.691, -9.229, 38.796, -9.091) # Lisbon bounding box for main extraction
 # CITY_BBOX = (38.72, -9.16, 38.74, -9.14) #small area in Lisbon to test
-# CITY_BBOX = (36.95, -9.50, 42.16, -6.18) # Portugal bounding box for future use
\ No newline at end of file
+# CITY_BBOX = (36.95, -9.50, 42.16, -6.18) # Portugal bounding box for future use
+
+# Simplification tolerances (metres) of the extra green area geometry columns (geometry_<detail>)
+SIMPLIFY_TOLERANCES_M = {"medium": 5, "low": 25}
+
+# Parts of the same park (name and type) closer than twice this (in metres) are merged
+MERGE_GAP_M = 3.0
+
+# Vertices closer than this (in metres) to a green area are its network access points
+PARK_SEED_DISTANCE_M = 20
+
+# Precomputed accessibility score grid (built after load)
+GRID_CELL_M = 100        # grid cell size in metres (EPSG:3857)
+GRID_BUFFER_M = 500      # buffer used to score each cell, same meaning as the API `buffer_m`
+GRID_CHUNK_SIZE = 5000   # cells scored per worker task
+GRID_WORKERS = None      # worker processes, None = number of CPUs
+
+# Directory of the per-run profiling reports (etl_<run id>.json)
+PROFILE_REPORT_DIR = "reports"
+
+# Incremental runs (main.py --incremental) record the areas they touched in dataset_changes for this many days
+DATASET_CHANGES_KEEP_DAYS = 30
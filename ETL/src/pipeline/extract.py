@@ -1,46 +1,405 @@
 """
-Module responsible for extracting green area data from Overpass API.
+Module responsible for extracting green area and routing data from Overpass API.
+
+Large bounding boxes are split into tiles fetched concurrently over a pooled
+HTTP session. A tile that times out, runs the server out of memory or returns
+more than EXTRACT_MAX_TILE_MB is split in four and fetched again. Elements of
+all tiles are merged with duplicates (ways and relations crossing tile edges)
+removed by OSM type and id.
+
+Responses are streamed to disk and their elements parsed incrementally
+(ijson) while the transform consumes them, so the payload is never held in
+memory as a whole.
+
+Responses can be kept in a gzip cache keyed by the sha256 of their query
+(OverpassCache), so transform and load iterations replay the extraction
+from disk instead of downloading it again.
 """
-from src.helpers import build_overpass_query, build_routing_query, die, info
-from src.pipeline import OVERPASS_URL, CITY_BBOX
+from src.helpers import build_overpass_query, build_routing_query, info, profiler
+from src.pipeline import (
+    CITY_BBOX, OVERPASS_ENDPOINTS, OVERPASS_TIMEOUT_S, EXTRACT_TILE_DEG, EXTRACT_MAX_DEPTH,
+    EXTRACT_MAX_TILE_MB, EXTRACT_WORKERS, EXTRACT_SPOOL_DIR,
+)
 
-import requests
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
 import time
-from requests.exceptions import HTTPError, Timeout, ConnectionError
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import ijson
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, ReadTimeout, ConnectionError
+
+# Query builders of the datasets, by name
+DATASETS = {
+    "green_areas": build_overpass_query,
+    "routing": build_routing_query,
+}
+
+
+class TileTooLarge(Exception):
+    """The tile has to be split: the query timed out, ran out of memory or returned too much data."""
+
+
+def open_response(path, mode="rb", suffix=""):
+    # Cached responses (.gz) are gzipped, spooled ones are not; `suffix` is added to the file name only
+    return gzip.open(path + suffix, mode, compresslevel=6) if path.endswith(".gz") else open(path + suffix, mode)
+
+
+class OverpassElements:
+    """
+    Elements of the downloaded tiles of one dataset, parsed lazily from
+    their files (in the spool `directory` or in the cache). It can be
+    iterated several times (each pass re-reads the files), and duplicates
+    across tiles are skipped. The spool directory is removed by close(), or
+    when the object is collected.
+    """
+
+    def __init__(self, directory, paths):
+        self.directory = directory
+        self.paths = paths
+        self._cleanup = weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+
+    def __iter__(self):
+        seen = set() if len(self.paths) > 1 else None
+        for path in self.paths:
+            with open_response(path) as f:
+                for el in ijson.items(f, "elements.item", use_float=True):
+                    if seen is not None:
+                        uid = (el["type"], el["id"])
+                        if uid in seen:
+                            continue
+                        seen.add(uid)
+                    yield el
+
+    def size_mb(self):
+        return round(sum(os.path.getsize(path) for path in self.paths) / 2 ** 20, 1)
+
+    def close(self):
+        self._cleanup()
+
+
+# Overpass reports queries stopped by its limits in a "remark" written after the elements
+REMARK = re.compile(rb'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def read_remark(tail):
+    match = REMARK.search(tail)
+    return json.loads(b'"' + match.group(1) + b'"') if match else ""
+
+
+def retry_after(value, default):
+    """Seconds to wait from a Retry-After header (delay in seconds or HTTP date), `default` if unusable"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class CacheMiss(Exception):
+    """An offline extraction needs a response that is not in the cache."""
+
+
+class OverpassCache:
+    """
+    Gzipped Overpass responses keyed by the sha256 of their query. Entries
+    older than `max_age_h` hours are downloaded again. Tiles that had to be
+    split leave a marker, so a replay goes straight to their quarters.
+
+    Modes: "use" reads fresh entries and stores new downloads, "refresh"
+    ignores the entries and overwrites them, "offline" reads entries of any
+    age and fails on a miss instead of calling Overpass.
+    """
+
+    def __init__(self, directory, max_age_h=None, mode="use"):
+        self.directory = directory
+        self.max_age_h = max_age_h
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, query, suffix=".json.gz"):
+        key = hashlib.sha256(query.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def _usable(self, path):
+        if not os.path.exists(path):
+            return False
+        if self.mode == "offline" or self.max_age_h is None:
+            return True
+        return time.time() - os.path.getmtime(path) < self.max_age_h * 3600
 
-def extract_green_areas_data(max_retries=3):
+    def lookup(self, query):
+        """
+        Cached response file of `query`, or None when it has to be
+        downloaded. Raises TileTooLarge for a tile known to need a split.
+        """
+        if self.mode != "refresh":
+            if self._usable(self.path(query, ".split")):
+                raise TileTooLarge("split on a previous run")
+            path = self.path(query)
+            if self._usable(path):
+                with self._lock:
+                    self.hits += 1
+                return path
+        with self._lock:
+            self.misses += 1
+        if self.mode == "offline":
+            raise CacheMiss(f"offline run, but no cached response in {self.path(query)}")
+        return None
 
-    query = build_overpass_query(CITY_BBOX)
-    info("EXTRACT: Built Overpass query for green areas data")
-    
-    for attempt in range(1, max_retries + 1):
-        info(f"EXTRACT: Attempt {attempt} to extract green areas data...")
+    def mark_split(self, query):
+        path = self.path(query, ".split")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+
+class Endpoint:
+    """
+    One Overpass server with its rate limit: at most `slots` requests in
+    flight and `min_interval_s` seconds between request starts.
+    """
+
+    def __init__(self, url, slots=2, min_interval_s=1.0):
+        self.url = url
+        self.min_interval_s = min_interval_s
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            self.in_flight += 1
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.min_interval_s
+        if delay > 0:
+            time.sleep(delay)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def back_off(self, seconds):
+        # Server asked us to slow down (429): delay every later request on this endpoint
+        with self._lock:
+            self._next_start = max(self._next_start, time.monotonic() + seconds)
+
+
+class OverpassClient:
+    """Pooled session over the configured endpoints, shared by the tile workers."""
+
+    def __init__(self, endpoints=OVERPASS_ENDPOINTS, workers=EXTRACT_WORKERS):
+        self.endpoints = [Endpoint(url, **limits) for url, limits in endpoints.items()]
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        # Summed over all tiles (they overlap in time)
+        self.download_seconds = 0.0
+        self.requests = 0
+
+    def _endpoint(self):
+        # Least busy endpoint
+        return min(self.endpoints, key=lambda e: e.in_flight)
+
+    def fetch(self, query, path, max_retries=3):
+        """
+        Runs one query and writes the response to `path` (gzipped if it ends
+        in .gz). Raises TileTooLarge when the tile should be split, and the
+        last error once the retries of a transient failure (connection
+        errors, 429, 5xx) are used up.
+        """
         try:
-            response = requests.post(OVERPASS_URL, data={"data": query}, timeout=180)
-            response.raise_for_status()
-            
-            info("EXTRACT: Green areas data extracted successfully")
-            return response.json()
+            return self._fetch(query, path, max_retries)
+        finally:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
 
-        except (HTTPError, Timeout, ConnectionError) as e:
-            if attempt == max_retries:
-                die(f"Extraction failed after {max_retries} attempts: {e}")
+    def _fetch(self, query, path, max_retries):
+        for attempt in range(1, max_retries + 1):
+            endpoint = self._endpoint()
+            try:
+                with endpoint:
+                    t0 = time.perf_counter()
+                    tail = self._download(endpoint.url, query, path)
+                    t1 = time.perf_counter()
+                with self._lock:
+                    self.download_seconds += t1 - t0
+                    self.requests += 1
+            except ReadTimeout as e:
+                raise TileTooLarge(f"request timed out: {e}")
+            except HTTPError as e:
+                status = e.response.status_code
+                if status == 504:
+                    raise TileTooLarge("gateway timeout")
+                if status == 429:
+                    endpoint.back_off(retry_after(e.response.headers.get("Retry-After"), attempt * 10))
+                elif status < 500:
+                    raise
+                if attempt == max_retries:
+                    raise
+            except ConnectionError:
+                if attempt == max_retries:
+                    raise
+            else:
+                remark = read_remark(tail)
+                if "timed out" in remark or "out of memory" in remark:
+                    raise TileTooLarge(remark)
+                if remark:
+                    info(f"EXTRACT: Overpass remark: {remark}")
+                # Only complete responses get the final name (which may be a cache entry)
+                os.replace(path + ".part", path)
+                return path
             time.sleep(attempt * 5)
-            
-def extract_routing_data(max_retries=3):
-    query = build_routing_query(CITY_BBOX)
-    info("EXTRACT: Built Overpass query for green areas data")
-    
-    for attempt in range(1, max_retries + 1):
-        info(f"EXTRACT: Attempt {attempt} to extract routing data...")
-        try:
-            response = requests.post(OVERPASS_URL, data={"data": query}, timeout=180)
 
-            info("EXTRACT: Routing data extracted successfully")
+    def _download(self, url, query, path):
+        """
+        Streams the body to `path`.part, abandoning an oversized tile early,
+        and returns the last few KB of it (where Overpass puts its remark).
+        """
+        limit = EXTRACT_MAX_TILE_MB * 2 ** 20
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.session.post(
+            url, data={"data": query}, timeout=(30, OVERPASS_TIMEOUT_S + 30), stream=True
+        ) as response, open_response(path, "wb", suffix=".part") as f:
             response.raise_for_status()
-            return response.json()
+            size, tail = 0, b""
+            for chunk in response.iter_content(chunk_size=2 ** 20):
+                size += len(chunk)
+                if size > limit:
+                    break
+                f.write(chunk)
+                tail = (tail + chunk)[-4096:]
+        if size > limit:
+            raise TileTooLarge(f"response over {EXTRACT_MAX_TILE_MB} MB")
+        return tail
 
-        except (HTTPError, Timeout, ConnectionError) as e:
-            if attempt == max_retries:
-                die(f"Extraction failed after {max_retries} attempts: {e}")
-            time.sleep(attempt * 5)
+
+def split_bbox(bbox, tile_deg=EXTRACT_TILE_DEG):
+    """Splits (south, west, north, east) into a grid of tiles at most `tile_deg` degrees wide."""
+    south, west, north, east = bbox
+    n_rows = max(1, math.ceil((north - south) / tile_deg - 1e-9))
+    n_cols = max(1, math.ceil((east - west) / tile_deg - 1e-9))
+    d_lat, d_lon = (north - south) / n_rows, (east - west) / n_cols
+    return [
+        (south + r * d_lat, west + c * d_lon, south + (r + 1) * d_lat, west + (c + 1) * d_lon)
+        for r in range(n_rows)
+        for c in range(n_cols)
+    ]
+
+
+def quarter_bbox(bbox):
+    south, west, north, east = bbox
+    lat, lon = (south + north) / 2, (west + east) / 2
+    return [(south, west, lat, lon), (south, lon, lat, east), (lat, west, north, lon), (lat, lon, north, east)]
+
+
+def fetch_tile(client, cache, query, spool_path):
+    """
+    Response file of one tile: from the cache when it has it, else
+    downloaded into the cache (or the spool when there is no cache).
+    """
+    if cache is None:
+        return client.fetch(query, spool_path)
+    path = cache.lookup(query)
+    if path:
+        return path
+    try:
+        return client.fetch(query, cache.path(query))
+    except TileTooLarge:
+        cache.mark_split(query)
+        raise
+
+
+def extract_datasets(names=tuple(DATASETS), bbox=CITY_BBOX, cache=None):
+    """
+    Downloads the named datasets over `bbox` with all their tiles in one
+    worker pool, so the datasets overlap instead of running back to back.
+    Tiles found in `cache` (an OverpassCache) are not downloaded.
+    Returns {name: OverpassElements}, streaming the elements in tile order
+    and without duplicates.
+    """
+    client = OverpassClient()
+    tiles = split_bbox(bbox)
+    info(f"EXTRACT: Fetching {', '.join(names)} over {len(tiles)} tile(s) from {len(client.endpoints)} endpoint(s)"
+         + (f", cache in {cache.directory} ({cache.mode})" if cache else ""))
+
+    datasets = {
+        name: OverpassElements(tempfile.mkdtemp(prefix=f"gsa_{name}_", dir=EXTRACT_SPOOL_DIR), [])
+        for name in names
+    }
+    # (name, tile key) -> response file; a tile key is its position, extended by the quarter index on each split
+    results = {}
+    with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+        def submit(name, key, tile, depth):
+            path = os.path.join(datasets[name].directory, "tile_" + "_".join(map(str, key)) + ".json")
+            future = pool.submit(fetch_tile, client, cache, DATASETS[name](tile, timeout=OVERPASS_TIMEOUT_S), path)
+            pending[future] = (name, key, tile, depth)
+
+        pending = {}
+        for name in names:
+            for i, tile in enumerate(tiles):
+                submit(name, (i,), tile, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key, tile, depth = pending.pop(future)
+                try:
+                    results[(name, key)] = future.result()
+                except TileTooLarge as e:
+                    if depth >= EXTRACT_MAX_DEPTH:
+                        for f in pending:
+                            f.cancel()
+                        raise RuntimeError(f"{name} tile {tile} still too large after {depth} splits: {e}")
+                    info(f"EXTRACT: Splitting {name} tile {tuple(round(c, 4) for c in tile)} ({e})")
+                    for q, quarter in enumerate(quarter_bbox(tile)):
+                        submit(name, key + (q,), quarter, depth + 1)
+                except BaseException:
+                    for f in pending:
+                        f.cancel()
+                    raise
+
+    profiler.record("download", client.download_seconds, rows=client.requests)
+    if cache:
+        info(f"EXTRACT: Cache hits: {cache.hits}, downloaded: {client.requests}")
+
+    for name, data in datasets.items():
+        data.paths = [results[(n, key)] for n, key in sorted(results) if n == name]
+        info(f"EXTRACT: {name} data extracted successfully: {len(data.paths)} tile(s), {data.size_mb()} MB on disk")
+    return datasets
+
+
+def extract_green_areas_data(cache=None):
+    return extract_datasets(["green_areas"], cache=cache)["green_areas"]
+
+
+def extract_routing_data(cache=None):
+    return extract_datasets(["routing"], cache=cache)["routing"]
@@ -0,0 +1,119 @@
+"""
+Module responsible for precomputing the accessibility score on a regular grid over the city.
+"""
+from src.helpers import score_points, encode_types, info, step
+from src.pipeline import CITY_BBOX, GRID_CELL_M, GRID_BUFFER_M, GRID_CHUNK_SIZE, GRID_WORKERS
+
+import math
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+
+# Same minimum park size as the live accessibility query
+MIN_PARK_AREA_M2 = 300
+
+# Candidate parks shared by the worker processes (set by _init_worker)
+_parks = {}
+
+
+def _init_worker(geoms, areas, type_codes, buffer_m):
+    _parks["tree"] = shapely.STRtree(geoms)
+    _parks["geoms"] = geoms
+    _parks["areas"] = areas
+    _parks["type_codes"] = type_codes
+    _parks["buffer_m"] = buffer_m
+
+
+def _score_chunk(xy):
+    """Scores one chunk of cell centres (EPSG:3857 coordinates)."""
+    points = shapely.points(xy)
+    buffer_m = _parks["buffer_m"]
+    point_idx, park_idx = _parks["tree"].query(points, predicate="dwithin", distance=buffer_m)
+    distances = shapely.distance(points[point_idx], _parks["geoms"][park_idx])
+    return score_points(
+        len(points),
+        point_idx,
+        distances,
+        _parks["areas"][park_idx],
+        _parks["type_codes"][park_idx],
+        buffer_m,
+    )
+
+
+def build_score_grid(types_df, ga_gdf, bbox=CITY_BBOX, cell_m=GRID_CELL_M, buffer_m=GRID_BUFFER_M,
+                     chunk_size=GRID_CHUNK_SIZE, workers=GRID_WORKERS, near=None):
+    """
+    Scores the centre of every `cell_m` grid cell over `bbox` against the transformed
+    green areas, in parallel chunks. Returns the grid metadata dataframe and the
+    grid cells as a GeoDataFrame (cell centres in EPSG:4326).
+    With `near` (EPSG:3857 geometries, e.g. the areas an incremental run changed)
+    only the cells whose score can depend on them are scored and returned
+    (None when there are none).
+    """
+    south, west, north, east = bbox
+    corners = gpd.GeoSeries(
+        [shapely.Point(west, south), shapely.Point(east, north)], crs="EPSG:4326"
+    ).to_crs("EPSG:3857")
+    x0, y0 = corners.iloc[0].x, corners.iloc[0].y
+    n_cols = math.ceil((corners.iloc[1].x - x0) / cell_m)
+    n_rows = math.ceil((corners.iloc[1].y - y0) / cell_m)
+    info(f"GRID: Scoring {n_rows} x {n_cols} cells of {cell_m} m with a {buffer_m} m buffer")
+
+    meta_df = pd.DataFrame(
+        [{
+            "id": 1,
+            "origin_x": x0,
+            "origin_y": y0,
+            "cell_m": cell_m,
+            "n_rows": n_rows,
+            "n_cols": n_cols,
+            "buffer_m": buffer_m,
+        }]
+    )
+
+    parks = ga_gdf.merge(types_df, left_on="type_id", right_on="id", suffixes=("", "_type"))
+    parks = parks[parks["area_m2"] > MIN_PARK_AREA_M2]
+    geoms = np.asarray(gpd.GeoSeries(parks["geom_3857"]))
+    areas = parks["area_m2"].to_numpy(dtype=np.float64)
+    type_codes = encode_types(parks["type"].tolist())
+
+    rows, cols = np.divmod(np.arange(n_rows * n_cols), n_cols)
+    xy = np.column_stack([x0 + (cols + 0.5) * cell_m, y0 + (rows + 0.5) * cell_m])
+    if near is not None:
+        changed = shapely.union_all(near)
+        shapely.prepare(changed)
+        keep = shapely.dwithin(shapely.points(xy), changed, buffer_m)
+        rows, cols, xy = rows[keep], cols[keep], xy[keep]
+        info(f"GRID: Rescoring the {len(xy)} cells within {buffer_m} m of the changed areas")
+        if not len(xy):
+            return meta_df, None
+    chunks = [xy[i:i + chunk_size] for i in range(0, len(xy), chunk_size)]
+
+    # Traced memory only covers this process, the workers show up in nothing but the wall time
+    with step("score_cells", rows=len(xy)), ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(geoms, areas, type_codes, buffer_m),
+    ) as executor:
+        results = list(executor.map(_score_chunk, chunks))
+    info(f"GRID: Scored {len(xy)} cells in {len(chunks)} chunks")
+
+    scores = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    grid_gdf = gpd.GeoDataFrame(
+        {
+            "row_idx": rows,
+            "col_idx": cols,
+            "accessibility_score": scores["accessibility_score"],
+            "proximity_score": scores["proximity"],
+            "quantity_score": scores["quantity"],
+            "area_score": scores["area"],
+            "diversity_score": scores["diversity"],
+            "parks_found": scores["parks_found"],
+        },
+        geometry=shapely.points(xy),
+        crs="EPSG:3857",
+    ).to_crs("EPSG:4326")
+
+    return meta_df, grid_gdf
@@ -0,0 +1,451 @@
+"""
+Module responsible for incremental ETL runs: the elements of a new extraction are
+compared (OSM version and content hash) with the ones recorded in `osm_elements`
+by the previous run, and only the green areas, ways, vertices and grid cells
+that can depend on the changed elements are recomputed and upserted.
+"""
+from src.helpers import element_hash, info, step
+from src.pipeline import MERGE_GAP_M
+from src.pipeline.transform import (
+    iter_elements,
+    parse_green_areas,
+    transform_green_areas_data,
+    transform_routing_data,
+    transform_nearest_park_data,
+)
+from src.pipeline.load import upsert_data, delete_rows, record_dataset_version
+from src.pipeline.grid import build_score_grid
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from sqlalchemy import text
+
+# Green area elements closer than this (in metres) can end up in the same output rows:
+# overlaps are cut out of each other and parts closer than 2 * MERGE_GAP_M are merged
+INTERACTION_M = 2 * MERGE_GAP_M + 1
+
+NEAREST_PARK_COLUMNS = ["park_distance_m", "park_id", "pred_vertex", "pred_edge"]
+
+
+def osm_element_state(ga_gdf, routing_data):
+    """
+    Rows of the `osm_elements` table for a full run: the parsed green areas
+    (output of parse_green_areas, geometry kept to find their neighbours later)
+    and the ways of the routing data (no geometry).
+    """
+    green_areas = gpd.GeoDataFrame(
+        {
+            "dataset": "green_areas",
+            "osm_type": ga_gdf["osm_type"].to_numpy(),
+            "osm_id": ga_gdf["osm_id"].to_numpy(dtype=np.int64),
+            "version": ga_gdf["version"].to_numpy(),
+            "content_hash": ga_gdf["content_hash"].to_numpy(dtype=np.int64),
+        },
+        geometry=ga_gdf.geometry.to_numpy(),
+        crs="EPSG:3857",
+    )
+    ways = routing_state(routing_data)
+    ways = gpd.GeoDataFrame(
+        {"dataset": "routing", **{col: ways[col].to_numpy() for col in ways.columns}},
+        geometry=np.full(len(ways), None, dtype=object),
+        crs="EPSG:3857",
+    )
+    return pd.concat([green_areas, ways], ignore_index=True)
+
+
+def routing_state(data):
+    """(osm_type, osm_id, version, content_hash) of every way of the routing data"""
+    records = [
+        (el["type"], el["id"], el.get("version"), element_hash(el))
+        for el in iter_elements(data)
+        if el["type"] == "way"
+    ]
+    return pd.DataFrame(records, columns=["osm_type", "osm_id", "version", "content_hash"])
+
+
+def has_state(con):
+    """True when a previous run recorded its elements, so an incremental run can diff against them"""
+    return con.execute(text("SELECT EXISTS (SELECT 1 FROM osm_elements);")).scalar()
+
+
+def load_state(con, dataset):
+    return pd.read_sql(
+        text("SELECT osm_type, osm_id, version, content_hash FROM osm_elements WHERE dataset = :dataset;"),
+        con,
+        params={"dataset": dataset},
+    )
+
+
+def diff_state(old, new):
+    """
+    Compares two element states. Returns the keys (osm_type, osm_id) of the
+    new or modified elements and of the deleted ones.
+    """
+    merged = old.merge(new, on=["osm_type", "osm_id"], how="outer", suffixes=("_old", "_new"), indicator=True)
+    # A missing version (e.g. a response without meta) only compares the content
+    same_version = (
+        (merged["version_old"] == merged["version_new"])
+        | merged["version_old"].isna()
+        | merged["version_new"].isna()
+    )
+    modified = (merged["_merge"] == "both") & ~(same_version & (merged["content_hash_old"] == merged["content_hash_new"]))
+    changed = merged[(merged["_merge"] == "right_only") | modified]
+    deleted = merged[merged["_merge"] == "left_only"]
+    return _keys(changed), _keys(deleted)
+
+
+def _keys(df):
+    return set(zip(df["osm_type"], df["osm_id"].astype("int64")))
+
+
+def save_state(con, dataset, state, changed, deleted):
+    """Replaces the recorded state of the changed and deleted elements"""
+    if deleted:
+        con.execute(
+            text("""
+                DELETE FROM osm_elements
+                WHERE dataset = :dataset AND (osm_type, osm_id) IN (
+                    SELECT * FROM unnest(CAST(:types AS text[]), CAST(:ids AS bigint[]))
+                );
+            """),
+            {"dataset": dataset, "types": [t for t, _ in deleted], "ids": [int(i) for _, i in deleted]},
+        )
+    keys = list(zip(state["osm_type"], state["osm_id"]))
+    rows = state[[key in changed for key in keys]].copy()
+    rows.insert(0, "dataset", dataset)
+    upsert_data(con, rows, "osm_elements", ["dataset", "osm_type", "osm_id"])
+
+
+def merge_boxes(geoms):
+    """
+    Envelopes of `geoms`, overlapping envelopes merged into one, so a change
+    set stays a handful of boxes.
+    """
+    boxes = shapely.envelope(np.asarray(geoms, dtype=object))
+    boxes = boxes[~shapely.is_empty(boxes) & ~shapely.is_missing(boxes)]
+    while len(boxes) > 1:
+        merged = shapely.get_parts(shapely.union_all(boxes))
+        merged = shapely.envelope(merged)
+        if len(merged) == len(boxes):
+            break
+        boxes = merged
+    return list(boxes)
+
+
+def to_4326(boxes):
+    return list(gpd.GeoSeries(boxes, crs="EPSG:3857").to_crs("EPSG:4326").envelope)
+
+
+def reuse_ids(previous, rows, first_id):
+    """
+    Ids for the recomputed green area `rows`: a row keeps the id of the
+    `previous` row (id, osm_id, geom_3857) it overlaps most, so unchanged parks
+    keep their id. The osm_id of the rows is the first element of their
+    dissolve group, which depends on the subset transformed, so it only breaks
+    ties between equal overlaps. Rows without a match get new ids from
+    `first_id` on.
+    """
+    ids = np.zeros(len(rows), dtype=np.int64)
+    new_geoms = np.asarray(rows["geom_3857"])
+    old_geoms = np.asarray(previous.geometry)
+    if len(rows) and len(previous):
+        old_idx, new_idx = previous.sindex.query(new_geoms, predicate="intersects")[::-1]
+        overlap = shapely.area(shapely.intersection(new_geoms[new_idx], old_geoms[old_idx]))
+        same_osm = rows["osm_id"].to_numpy()[new_idx] == previous["osm_id"].to_numpy()[old_idx]
+        # Greedy pairing, largest overlaps first (same osm_id first among equal ones)
+        taken_old, taken_new = set(), set()
+        for k in np.lexsort((~same_osm, -overlap)):
+            n, o = new_idx[k], old_idx[k]
+            if overlap[k] <= 0 or n in taken_new or o in taken_old:
+                continue
+            ids[n] = previous["id"].iloc[o]
+            taken_new.add(n)
+            taken_old.add(o)
+    new = ids == 0
+    ids[new] = np.arange(first_id, first_id + new.sum())
+    return ids
+
+
+def reuse_way_ids(previous, ways, first_id):
+    """
+    Ids for the re-segmented `ways`: a segment keeps the id of the `previous`
+    segment (id, osm_id, source, target) of the same way between the same
+    vertices (vertices keep their id through their OSM node id), so routes and
+    isochrones referencing unchanged segments stay valid. Other segments get new
+    ids from `first_id` on.
+    """
+    key = ["osm_id", "source", "target"]
+    # Numbered within equal keys, in case a way runs twice between the same vertices
+    old = previous[["id"] + key].assign(n=previous.groupby(key).cumcount())
+    new = ways[key].assign(n=ways.groupby(key).cumcount())
+    ids = new.merge(old, on=key + ["n"], how="left")["id"].to_numpy(dtype="float64", na_value=np.nan, copy=True)
+    missing = np.isnan(ids)
+    ids[missing] = np.arange(first_id, first_id + missing.sum())
+    return ids.astype(np.int64)
+
+
+def update_green_areas(con, data):
+    """
+    Recomputes the green areas that can depend on a changed element: the
+    changed elements and everything within INTERACTION_M of them, transitively
+    (the cookie-cutter and the merge only combine elements that close).
+    Recomputed rows keep the id of the previous row they overlap most (see
+    reuse_ids). Returns the EPSG:3857 geometries of the removed and inserted rows.
+    """
+    parsed = parse_green_areas(data)
+    old = load_state(con, "green_areas")
+    changed, deleted = diff_state(old, parsed[["osm_type", "osm_id", "version", "content_hash"]])
+    info(f"INCREMENTAL: {len(changed)} new or modified and {len(deleted)} deleted green area elements")
+    if not changed and not deleted:
+        return []
+
+    with step("closure") as s:
+        # Previous geometries of the modified and deleted elements, their old neighbours count too
+        touched = list(changed | deleted)
+        previous = gpd.read_postgis(
+            text("""
+                SELECT e.osm_type, e.osm_id, e.geometry
+                FROM osm_elements e
+                JOIN unnest(CAST(:types AS text[]), CAST(:ids AS bigint[])) AS t(osm_type, osm_id)
+                  ON e.osm_type = t.osm_type AND e.osm_id = t.osm_id
+                WHERE e.dataset = 'green_areas';
+            """),
+            con,
+            geom_col="geometry",
+            params={"types": [t for t, _ in touched], "ids": [int(i) for _, i in touched]},
+        )
+        keys = list(zip(parsed["osm_type"], parsed["osm_id"]))
+        candidates = gpd.GeoSeries(
+            np.concatenate([parsed.geometry.to_numpy(), previous.geometry.to_numpy()]), crs="EPSG:3857"
+        )
+        geoms = np.asarray(candidates)
+        seeds = [i for i, key in enumerate(keys) if key in changed] + list(range(len(keys), len(candidates)))
+
+        reached = np.zeros(len(candidates), dtype=bool)
+        reached[seeds] = True
+        frontier = np.asarray(seeds, dtype=np.int64)
+        sindex = candidates.sindex
+        while len(frontier):
+            _, neighbours = sindex.query(
+                geoms[frontier], predicate="dwithin", distance=INTERACTION_M
+            )
+            neighbours = np.unique(neighbours)
+            frontier = neighbours[~reached[neighbours]]
+            reached[frontier] = True
+        closure = candidates[reached]
+        subset = parsed[reached[:len(keys)]]
+        s.rows = len(subset)
+    info(f"INCREMENTAL: Recomputing {len(subset)} green area elements around the changes")
+
+    # Output rows made of elements in the closure (their parts lie within MERGE_GAP_M of them)
+    xmin, ymin, xmax, ymax = closure.total_bounds
+    rows = gpd.read_postgis(
+        text("""
+            SELECT id, osm_id, geom_3857 FROM green_areas
+            WHERE geom_3857 && ST_Expand(ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 3857), :gap);
+        """),
+        con,
+        geom_col="geom_3857",
+        params={"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax, "gap": MERGE_GAP_M},
+    )
+    row_idx = np.unique(rows.sindex.query(np.asarray(closure), predicate="dwithin", distance=MERGE_GAP_M)[1])
+    removed = rows.iloc[row_idx]
+
+    inserted = None
+    if not subset.empty:
+        types_df = pd.read_sql(text("SELECT id, type FROM types;"), con)
+        result = transform_green_areas_data(subset, types_df=types_df)
+        if len(result):
+            types_df, inserted = result
+            first_id = con.execute(text("SELECT COALESCE(MAX(id), 0) + 1 FROM green_areas;")).scalar()
+            inserted["id"] = reuse_ids(removed, inserted, first_id)
+            upsert_data(con, types_df, "types", ["id"])
+
+    # Previous rows not taken over by a recomputed one
+    kept = inserted["id"].to_numpy() if inserted is not None else []
+    delete_rows(con, "green_areas", "id", np.setdiff1d(removed["id"].to_numpy(), kept))
+    if inserted is not None:
+        upsert_data(con, inserted, "green_areas", ["id"])
+    save_state(con, "green_areas", parsed[["osm_type", "osm_id", "version", "content_hash", "geometry"]], changed, deleted)
+
+    geoms = list(removed.geometry)
+    if inserted is not None:
+        geoms += list(inserted["geom_3857"])
+    return geoms
+
+
+def update_routing(con, data):
+    """
+    Re-segments the changed and deleted ways and the ways sharing a node with
+    them, before or after the change (their intersections may have moved).
+    Vertices keep their id through their OSM node id and segments the id of the
+    segment they replace (see reuse_way_ids). Returns the EPSG:3857 geometries
+    of the removed and inserted segments.
+    """
+    with step("diff") as s:
+        state = routing_state(data)
+        changed, deleted = diff_state(load_state(con, "routing"), state)
+        s.rows = len(state)
+    info(f"INCREMENTAL: {len(changed)} new or modified and {len(deleted)} deleted ways")
+    if not changed and not deleted:
+        return []
+    changed_ids = {osm_id for _, osm_id in changed}
+    deleted_ids = {osm_id for _, osm_id in deleted}
+
+    with step("neighbours") as s:
+        # Ways crossing a node of a changed way now...
+        changed_nodes = set()
+        for el in iter_elements(data):
+            if el["type"] == "way" and el["id"] in changed_ids:
+                changed_nodes.update(el.get("nodes", []))
+        affected = set(changed_ids)
+        for el in iter_elements(data):
+            if el["type"] == "way" and el["id"] not in affected and not changed_nodes.isdisjoint(el.get("nodes", [])):
+                affected.add(el["id"])
+        # ...and ways that shared a vertex with their previous segments
+        previous = con.execute(
+            text("""
+                WITH touched AS (
+                    SELECT source AS id FROM ways WHERE osm_id = ANY(:ids)
+                    UNION
+                    SELECT target FROM ways WHERE osm_id = ANY(:ids)
+                )
+                SELECT DISTINCT osm_id FROM ways
+                WHERE source IN (SELECT id FROM touched) OR target IN (SELECT id FROM touched);
+            """),
+            {"ids": [int(i) for i in changed_ids | deleted_ids]},
+        ).scalars()
+        affected.update(previous)
+        s.rows = len(affected)
+    info(f"INCREMENTAL: Re-segmenting {len(affected - deleted_ids)} ways")
+
+    removed = gpd.read_postgis(
+        text("SELECT id, osm_id, source, target, ST_Transform(geometry, 3857) AS geometry FROM ways WHERE osm_id = ANY(:ids);"),
+        con,
+        geom_col="geometry",
+        params={"ids": [int(i) for i in affected]},
+    )
+    vertex_ids = dict(con.execute(text("SELECT osm_id, id FROM vertices WHERE osm_id IS NOT NULL;")).all())
+    first_way_id = con.execute(text("SELECT COALESCE(MAX(id), 0) + 1 FROM ways;")).scalar()
+    ways_gdf = vertices_gdf = None
+    if affected - deleted_ids:
+        ways_gdf, vertices_gdf = transform_routing_data(
+            data, only_ways=affected - deleted_ids, vertex_ids=vertex_ids, first_way_id=first_way_id
+        )
+        ways_gdf["id"] = reuse_way_ids(removed, ways_gdf, first_way_id)
+
+    # Previous segments not taken over by a re-segmented one
+    kept = ways_gdf["id"].to_numpy() if ways_gdf is not None else []
+    delete_rows(con, "ways", "id", np.setdiff1d(removed["id"].to_numpy(), kept))
+    upsert_data(con, vertices_gdf, "vertices", ["id"])
+    upsert_data(con, ways_gdf, "ways", ["id"])
+    # Vertices only the removed segments used
+    orphans = con.execute(
+        text("""
+            DELETE FROM vertices v
+            WHERE v.id = ANY(:ids)
+              AND NOT EXISTS (SELECT 1 FROM ways w WHERE w.source = v.id)
+              AND NOT EXISTS (SELECT 1 FROM ways w WHERE w.target = v.id);
+        """),
+        {"ids": [int(i) for i in np.union1d(removed["source"], removed["target"])]},
+    ).rowcount
+    info(f"INCREMENTAL: Removed {orphans} vertices no way uses anymore")
+    save_state(con, "routing", state, changed, deleted)
+
+    geoms = list(removed.geometry)
+    if ways_gdf is not None:
+        geoms += list(ways_gdf.to_crs("EPSG:3857").geometry)
+    return geoms
+
+
+def update_nearest_park(con):
+    """
+    Recomputes the network distance to the nearest park over the whole graph
+    (a single Dijkstra, cheap next to the extraction) and writes only the
+    vertices and park access points that changed.
+    """
+    ga_gdf = gpd.read_postgis(text("SELECT id, geom_3857 FROM green_areas;"), con, geom_col="geom_3857")
+    ways_df = pd.read_sql(text("SELECT id, source, target, cost FROM ways;"), con)
+    vertices_gdf = gpd.read_postgis(
+        text(f"SELECT id, geometry, {', '.join(NEAREST_PARK_COLUMNS)} FROM vertices ORDER BY id;"),
+        con,
+        geom_col="geometry",
+    )
+    updated, park_vertices_df = transform_nearest_park_data(ga_gdf, ways_df, vertices_gdf[["id", "geometry"]])
+
+    differs = np.zeros(len(updated), dtype=bool)
+    for col in NEAREST_PARK_COLUMNS:
+        before = vertices_gdf[col].to_numpy(dtype="float64", na_value=np.nan)
+        after = updated[col].to_numpy(dtype="float64", na_value=np.nan)
+        differs |= ~((before == after) | (np.isnan(before) & np.isnan(after)))
+    upsert_data(con, pd.DataFrame(updated.loc[differs, ["id"] + NEAREST_PARK_COLUMNS]), "vertices", ["id"])
+
+    previous = pd.read_sql(text("SELECT park_id, vertex_id, offset_m FROM park_vertices;"), con)
+    merged = previous.merge(park_vertices_df, on=["park_id", "vertex_id"], how="outer", suffixes=("_old", ""), indicator=True)
+    gone = merged[merged["_merge"] == "left_only"]
+    if len(gone):
+        con.execute(
+            text("""
+                DELETE FROM park_vertices
+                WHERE (park_id, vertex_id) IN (
+                    SELECT * FROM unnest(CAST(:parks AS integer[]), CAST(:vertices AS integer[]))
+                );
+            """),
+            {"parks": gone["park_id"].astype(int).tolist(), "vertices": gone["vertex_id"].astype(int).tolist()},
+        )
+    new = merged[(merged["_merge"] == "right_only") | ((merged["_merge"] == "both") & (merged["offset_m_old"] != merged["offset_m"]))]
+    upsert_data(con, new[["park_id", "vertex_id", "offset_m"]].astype({"park_id": int, "vertex_id": int}), "park_vertices", ["park_id", "vertex_id"])
+    info(f"INCREMENTAL: Updated {int(differs.sum())} vertices and {len(gone) + len(new)} park access points")
+
+
+def update_grid(con, near):
+    """
+    Rescores the grid cells within the scoring buffer of the changed green
+    areas. A grid built with other settings (bbox, cell size, buffer) is
+    rebuilt entirely.
+    """
+    types_df = pd.read_sql(text("SELECT id, type FROM types;"), con)
+    ga_gdf = gpd.read_postgis(text("SELECT id, type_id, area_m2, geom_3857 FROM green_areas;"), con, geom_col="geom_3857")
+    meta_df, grid_gdf = build_score_grid(types_df=types_df, ga_gdf=ga_gdf, near=near)
+
+    current = pd.read_sql(text("SELECT * FROM accessibility_grid_meta WHERE id = 1;"), con)
+    if current.empty or not np.allclose(current[meta_df.columns].to_numpy(dtype=float), meta_df.to_numpy(dtype=float)):
+        info("INCREMENTAL: Grid settings changed, rebuilding the whole grid")
+        meta_df, grid_gdf = build_score_grid(types_df=types_df, ga_gdf=ga_gdf)
+        con.execute(text("TRUNCATE TABLE accessibility_grid_meta, accessibility_grid;"))
+        upsert_data(con, meta_df, "accessibility_grid_meta", ["id"])
+    upsert_data(con, grid_gdf, "accessibility_grid", ["row_idx", "col_idx"])
+
+
+def run_incremental(engine, raw_data):
+    """
+    Applies the changes between the recorded state and `raw_data` (green
+    areas and routing data, as extracted) and publishes a new dataset version
+    with the areas it touched, in one transaction. Returns None, without
+    changing anything, when no state was recorded (a full run is needed).
+    """
+    with engine.begin() as con:
+        if not has_state(con):
+            return None
+        with step("green_areas") as s:
+            ga_changes = update_green_areas(con, raw_data[0])
+            s.rows = len(ga_changes)
+        with step("routing") as s:
+            way_changes = update_routing(con, raw_data[1])
+            s.rows = len(way_changes)
+        if ga_changes or way_changes:
+            with step("nearest_park"):
+                update_nearest_park(con)
+        if ga_changes:
+            with step("grid"):
+                update_grid(con, ga_changes)
+
+        changes = {
+            layer: to_4326(merge_boxes(geoms)) if geoms else []
+            for layer, geoms in (("green_areas", ga_changes), ("ways", way_changes))
+        }
+        record_dataset_version(con, changes)
+    info(f"INCREMENTAL: Published {sum(len(boxes) for boxes in changes.values())} changed areas")
+    return changes
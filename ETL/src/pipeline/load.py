@@ -1,13 +1,39 @@
+import uuid
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
+from geoalchemy2 import Geometry
 from sqlalchemy import create_engine, text
-from src.helpers import info, die
-from src.pipeline import DB_CONFIG
+from src.helpers import info, die, step
+from src.pipeline import DB_CONFIG, DATASET_CHANGES_KEEP_DAYS
 
 def get_engine():
     conn_str = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
     return create_engine(conn_str)
 
+def extra_geometry_columns(df):
+    """
+    Converts geometry columns other than the active one to EWKB so they can
+    be written next to it (to_postgis only converts the active column).
+    Returns the converted copy and the dtype mapping for those columns.
+    """
+    extra = [
+        col for col in df.columns
+        if col != df.geometry.name and isinstance(df[col], gpd.GeoSeries)
+    ]
+    if not extra:
+        return df, None
+
+    df = df.copy()
+    dtype = {}
+    for col in extra:
+        srid = df[col].crs.to_epsg() if df[col].crs else 0
+        geoms = shapely.set_srid(np.asarray(df[col]), srid)
+        df[col] = shapely.to_wkb(geoms, hex=True, include_srid=True)
+        dtype[col] = Geometry(srid=srid)
+    return df, dtype
+
 def load_data(engine, df, table_name):
     """
     Generalized loader that detects if a dataframe is spatial or standard.
@@ -16,31 +42,122 @@ def load_data(engine, df, table_name):
         die(f"Dataframe for '{table_name}' is empty or None. Skipping load")
         return
 
-    # Check if it's a GeoDataFrame with a valid geometry column
-    if isinstance(df, gpd.GeoDataFrame) and 'geometry' in df.columns:
-        if 'osm_id' in df.columns:
-            df['osm_id'] = pd.to_numeric(df['osm_id'], errors='coerce').fillna(0).astype('int64')
-        
-        df.to_postgis(
-            name=table_name,
-            con=engine,
-            if_exists='append',
-            index=False
-        )
-        info(f"LOAD: GeoDatFrame with {len(df)} records in '{table_name}' table")
-    else:
-        # Load standard tabular data
-        df.to_sql(
-            name=table_name,
-            con=engine,
-            if_exists='append',
-            index=False
-        )
-        info(f"LOAD: DataFrame with {len(df)} records in '{table_name}' table")
+    with step(f"load {table_name}", rows=len(df)):
+        # Check if it's a GeoDataFrame with a valid geometry column
+        if isinstance(df, gpd.GeoDataFrame) and 'geometry' in df.columns:
+            if 'osm_id' in df.columns:
+                df['osm_id'] = pd.to_numeric(df['osm_id'], errors='coerce').fillna(0).astype('int64')
+            df, dtype = extra_geometry_columns(df)
         
+            df.to_postgis(
+                name=table_name,
+                con=engine,
+                if_exists='append',
+                index=False,
+                dtype=dtype
+            )
+            info(f"LOAD: GeoDatFrame with {len(df)} records in '{table_name}' table")
+        else:
+            # Load standard tabular data
+            df.to_sql(
+                name=table_name,
+                con=engine,
+                if_exists='append',
+                index=False
+            )
+            info(f"LOAD: DataFrame with {len(df)} records in '{table_name}' table")
+
+def upsert_data(con, df, table_name, key):
+    """
+    Inserts the rows of `df` into `table_name`, updating the rows that already
+    have the same `key` (list of columns with a unique constraint). Goes
+    through a staging table so it takes one statement whatever the size.
+    """
+    if df is None or df.empty:
+        return
+    stage = f"{table_name}_stage"
+    with step(f"upsert {table_name}", rows=len(df)):
+        if isinstance(df, gpd.GeoDataFrame):
+            staged, dtype = extra_geometry_columns(df)
+            staged.to_postgis(name=stage, con=con, if_exists="replace", index=False, dtype=dtype)
+        else:
+            df.to_sql(name=stage, con=con, if_exists="replace", index=False)
+        columns = ", ".join(df.columns)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in df.columns if c not in key)
+        con.execute(text(f"""
+            INSERT INTO {table_name} ({columns})
+            SELECT {columns} FROM {stage}
+            ON CONFLICT ({", ".join(key)}) DO {"UPDATE SET " + updates if updates else "NOTHING"};
+        """))
+        con.execute(text(f"DROP TABLE {stage};"))
+    info(f"LOAD: Upserted {len(df)} records in '{table_name}' table")
+
+def delete_rows(con, table_name, column, values):
+    """Deletes the rows of `table_name` whose `column` is in `values`"""
+    values = [v.item() if hasattr(v, "item") else v for v in values]
+    if not values:
+        return 0
+    deleted = con.execute(text(f"DELETE FROM {table_name} WHERE {column} = ANY(:values);"), {"values": values}).rowcount
+    info(f"LOAD: Deleted {deleted} records from '{table_name}' table")
+    return deleted
+
 def truncate_tables(engine, table_names):
     """Cleans tables before a fresh load using the text() wrapper"""
     with engine.begin() as conn:
         for table in reversed(table_names):
             conn.execute(text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE;"))
-            info(f"LOAD: '{table}' table truncated successfully")
\ No newline at end of file
+            info(f"LOAD: '{table}' table truncated successfully")
+
+def publish_dataset_version(engine, changes=None):
+    """
+    Records a new dataset version so the API drops results cached for the previous one.
+    `changes` ({layer: [EPSG:4326 bbox polygons]}) lists the areas an incremental run
+    touched, so caches can keep what lies outside them.
+    """
+    with engine.begin() as conn:
+        return record_dataset_version(conn, changes)
+
+def record_dataset_version(conn, changes=None):
+    """
+    publish_dataset_version within the transaction of `conn`, so the version
+    only changes if the data written in it is committed.
+    """
+    version = uuid.uuid4().hex
+    previous = conn.execute(text("SELECT version FROM dataset_version WHERE id = 1;")).scalar()
+    if changes and previous:
+        rows = [
+            {"version": version, "previous": previous, "layer": layer, "bbox": box.wkt}
+            for layer, boxes in changes.items()
+            for box in boxes
+        ]
+        if rows:
+            conn.execute(
+                text("""
+                    INSERT INTO dataset_changes (version, previous_version, layer, bbox, changed_at)
+                    VALUES (:version, :previous, :layer, ST_GeomFromText(:bbox, 4326), now());
+                """),
+                rows,
+            )
+        else:
+            # Nothing changed: an empty change set still chains the versions
+            conn.execute(
+                text("""
+                    INSERT INTO dataset_changes (version, previous_version, layer, bbox, changed_at)
+                    VALUES (:version, :previous, 'none', NULL, now());
+                """),
+                {"version": version, "previous": previous},
+            )
+        conn.execute(
+            text("DELETE FROM dataset_changes WHERE changed_at < now() - make_interval(days => :days);"),
+            {"days": DATASET_CHANGES_KEEP_DAYS},
+        )
+    conn.execute(
+        text("""
+            INSERT INTO dataset_version (id, version, loaded_at)
+            VALUES (1, :version, now())
+            ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, loaded_at = EXCLUDED.loaded_at;
+        """),
+        {"version": version},
+    )
+    info(f"LOAD: Published dataset version {version}")
+    return version
@@ -1,85 +1,151 @@
-from src.helpers import parse_way, parse_relation, ensure_multipolygon, get_super_type, die, info
+from src.helpers import parse_way, parse_relation, ensure_multipolygon, get_super_type, element_hash, info, step
+from src.pipeline import PARK_SEED_DISTANCE_M, SIMPLIFY_TOLERANCES_M, MERGE_GAP_M
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely import LineString, Point
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from array import array
 from collections import Counter
 
 
-def transform_green_areas_data(json):
-    elements = json.get("elements", [])
+def iter_elements(data):
+    """
+    Elements of raw Overpass data: a decoded response ({"elements": [...]}) or
+    an iterable of elements, such as the OverpassElements streamed by the extract.
+    """
+    return data.get("elements", []) if isinstance(data, dict) else data
+
+
+def _union(geoms):
+    # Union of intersecting areas, repairing them first if GEOS rejects the input
+    try:
+        return shapely.union_all(geoms)
+    except shapely.errors.GEOSException:
+        return shapely.union_all(shapely.buffer(geoms, 0))
+
+
+def cut_overlaps(geometries):
+    """
+    Removes from every geometry of the GeoSeries `geometries` what it shares
+    with the geometries before it (higher priority). Returns the cut geometries
+    as an array, in the same order.
+    """
+    # Cutting with the original shapes gives the same result as cutting one after the
+    # other, since the parts already cut from them are covered by areas of even higher priority.
+    geoms = np.asarray(geometries.values)
+    target, cutter = geometries.sindex.query(geoms, predicate="intersects")
+    keep = cutter < target
+    target, cutter = target[keep], cutter[keep]
+    order = np.argsort(target, kind="stable")
+    target, cutter = target[order], cutter[order]
+    targets, starts = np.unique(target, return_index=True)
+    cutters = np.empty(len(targets), dtype=object)
+    cutters[:] = [_union(geoms[group]) for group in np.split(cutter, starts[1:])] if len(targets) else []
+
+    geoms = geoms.copy()
+    try:
+        geoms[targets] = shapely.difference(geoms[targets], cutters)
+    except shapely.errors.GEOSException:
+        for t, c in zip(targets, cutters):
+            try:
+                geoms[t] = geoms[t].difference(c)
+            except shapely.errors.GEOSException:
+                geoms[t] = geoms[t].buffer(0).difference(c.buffer(0))
+    return geoms
+
+
+def parse_green_areas(data):
+    """
+    Green area elements of raw Overpass data as a GeoDataFrame in EPSG:3857,
+    one row per element with a geometry: osm_type, osm_id, version,
+    content_hash, name, type and the parsed (not yet cleaned) geometry.
+    """
     records = []
 
-    for el in elements:
-        geom = parse_way(el) if el["type"] == "way" else parse_relation(el)
-        if geom is None:
-            continue
-
-        tags = el.get("tags", {})
-        name = tags.get("name", "Unnamed")
-        raw_type = (
-            tags.get("leisure")
-            or tags.get("landuse")
-            or tags.get("natural")
-            or "unknown"
-        )
-        final_type = get_super_type(tags) if name == "Unnamed" else raw_type
+    # Elements are parsed one at a time, only the records are kept
+    with step("parse") as s:
+        for el in iter_elements(data):
+            geom = parse_way(el) if el["type"] == "way" else parse_relation(el)
+            if geom is None:
+                continue
 
-        records.append(
-            {
-                "osm_id": el["id"],
-                "name": name,
-                "type": final_type.capitalize().replace("_", " "),
-                "geometry": geom,
-            }
-        )
+            tags = el.get("tags", {})
+            name = tags.get("name", "Unnamed")
+            raw_type = (
+                tags.get("leisure")
+                or tags.get("landuse")
+                or tags.get("natural")
+                or "unknown"
+            )
+            final_type = get_super_type(tags) if name == "Unnamed" else raw_type
+
+            records.append(
+                {
+                    "osm_type": el["type"],
+                    "osm_id": el["id"],
+                    "version": el.get("version"),
+                    "content_hash": element_hash(el),
+                    "name": name,
+                    "type": final_type.capitalize().replace("_", " "),
+                    "geometry": geom,
+                }
+            )
+        s.rows = len(records)
     info(f"TRANSFORM: Parsed {len(records)} green area records from raw data")
-    
+
     if not records:
         return gpd.GeoDataFrame()
-
-    ga_gdf = gpd.GeoDataFrame(records, geometry="geometry", crs="EPSG:4326").to_crs(
+    return gpd.GeoDataFrame(records, geometry="geometry", crs="EPSG:4326").to_crs(
         "EPSG:3857"
     )
+
+
+def transform_green_areas_data(data, types_df=None, first_id=1):
+    """
+    Resolves overlaps and merges close parts of the same park. `data` is raw
+    Overpass data or the output of parse_green_areas (e.g. the subset of an
+    incremental run). Rows get ids from `first_id` on, and types keep their
+    id in `types_df` when given (new types are numbered after them).
+    Returns (types_df, ga_gdf).
+    """
+    ga_gdf = data if isinstance(data, gpd.GeoDataFrame) else parse_green_areas(data)
+    if ga_gdf.empty:
+        return gpd.GeoDataFrame()
+
     ga_gdf = ga_gdf[ga_gdf.is_valid].copy()
 
     # 1. PRIORITY & COOKIE-CUTTER
-    ga_gdf["area"] = ga_gdf.geometry.area
-    ga_gdf["is_named"] = ga_gdf["name"] != "Unnamed"
-    ga_gdf = ga_gdf.sort_values(
-        by=["is_named", "area"], ascending=[False, True]
-    ).reset_index(drop=True)
-
-    geoms = ga_gdf.geometry.values.copy()
-    sindex = ga_gdf.sindex
-    for i in range(len(ga_gdf)):
-        curr = geoms[i]
-        if curr is None or curr.is_empty:
-            continue
-        for j in list(sindex.intersection(curr.bounds)):
-            if j > i and geoms[j] is not None and curr.intersects(geoms[j]):
-                try:
-                    geoms[j] = geoms[j].difference(curr)
-                except:
-                    geoms[j] = geoms[j].buffer(0).difference(curr.buffer(0))
-
-    ga_gdf["geometry"] = geoms
-    ga_gdf = ga_gdf[~ga_gdf.geometry.is_empty].copy()
+    with step("cookie_cutter") as s:
+        ga_gdf["area"] = ga_gdf.geometry.area
+        ga_gdf["is_named"] = ga_gdf["name"] != "Unnamed"
+        ga_gdf = ga_gdf.sort_values(
+            by=["is_named", "area"], ascending=[False, True]
+        ).reset_index(drop=True)
+
+        ga_gdf["geometry"] = cut_overlaps(ga_gdf.geometry)
+        ga_gdf = ga_gdf[~ga_gdf.geometry.is_empty].copy()
+        s.rows = len(ga_gdf)
     info(f"TRANSFORM: Applied cookie-cutter logic to resolve overlaps, resulting in {len(ga_gdf)} non-overlapping green areas")
 
     # 2. LOCALISED SEMANTIC MERGE
-    GAP_TOLERANCE = 3.0
-    original_state = ga_gdf.copy()
-    ga_gdf["geometry"] = ga_gdf.geometry.buffer(GAP_TOLERANCE)
-    ga_gdf = ga_gdf.dissolve(
-        by=["name", "type"], as_index=False, aggfunc={"osm_id": "first"}
-    )
+    with step("semantic_merge") as s:
+        original_state = ga_gdf.copy()
+        ga_gdf["geometry"] = ga_gdf.geometry.buffer(MERGE_GAP_M)
+        with step("dissolve_buffered"):
+            ga_gdf = ga_gdf.dissolve(
+                by=["name", "type"], as_index=False, aggfunc={"osm_id": "first"}
+            )
 
-    ga_gdf["geometry"] = ga_gdf.geometry.buffer(-GAP_TOLERANCE)
-    ga_gdf = pd.concat([ga_gdf, original_state], ignore_index=True)
-    ga_gdf = ga_gdf.dissolve(
-        by=["name", "type"], as_index=False, aggfunc={"osm_id": "first"}
-    )
+        ga_gdf["geometry"] = ga_gdf.geometry.buffer(-MERGE_GAP_M)
+        ga_gdf = pd.concat([ga_gdf, original_state], ignore_index=True)
+        with step("dissolve_original"):
+            ga_gdf = ga_gdf.dissolve(
+                by=["name", "type"], as_index=False, aggfunc={"osm_id": "first"}
+            )
+        s.rows = len(ga_gdf)
     info(f"TRANSFORM: Performed localized semantic merge, resulting in {len(ga_gdf)} green areas after merging close features")
 
     # 3. FINAL CLEANUP
@@ -90,8 +156,14 @@ def transform_green_areas_data(json):
     info(f"TRANSFORM: Cleaned and merged green areas, resulting in {len(ga_gdf)} final records")
 
     # types table df
-    types_df = ga_gdf[["type"]].drop_duplicates().reset_index(drop=True)
-    types_df.insert(0, "id", types_df.index + 1)
+    new_types = ga_gdf[["type"]].drop_duplicates().reset_index(drop=True)
+    if types_df is not None:
+        new_types = new_types[~new_types["type"].isin(types_df["type"])].reset_index(drop=True)
+        first_type_id = int(types_df["id"].max()) + 1 if len(types_df) else 1
+    else:
+        first_type_id = 1
+    new_types.insert(0, "id", new_types.index + first_type_id)
+    types_df = new_types if types_df is None else pd.concat([types_df[["id", "type"]], new_types], ignore_index=True)
     info(f"TRANSFROM: Created `types` dataframe with {len(types_df)} unique types")
 
     ga_gdf = ga_gdf.merge(types_df[["id", "type"]], on=["type"], how="left")
@@ -99,103 +171,234 @@ def transform_green_areas_data(json):
     info("TRANSFORM: Merged `types` dataframe back into green areas dataframe to assign type_id")
     
     ga_gdf = ga_gdf.reset_index(drop=True)
-    ga_gdf.insert(0, "id", ga_gdf.index + 1)
+    ga_gdf.insert(0, "id", ga_gdf.index + first_id)
+
+    # Keep the metric geometry and area so the API doesn't reproject per row
+    ga_gdf["area_m2"] = ga_gdf.geometry.area
+    ga_gdf["geom_3857"] = ga_gdf.geometry.copy()
+    info("TRANSFORM: Precomputed metric geometry and area for green areas")
+
+    # Lighter versions of every geometry for zoomed-out / low-detail API responses
+    with step("simplify", rows=len(ga_gdf)):
+        for detail, tolerance in SIMPLIFY_TOLERANCES_M.items():
+            simplified = ga_gdf.geometry.simplify(tolerance, preserve_topology=True).apply(ensure_multipolygon)
+            ga_gdf[f"geometry_{detail}"] = simplified.to_crs("EPSG:4326")
+    info(f"TRANSFORM: Simplified green areas at {', '.join(f'{t} m' for t in SIMPLIFY_TOLERANCES_M.values())}")
 
     # NOTE: Order of returning is important for loading: types_df must be loaded before ga_gdf due to FK constraint
     return (
         types_df,
-        ga_gdf.to_crs("EPSG:4326")[["id", "osm_id", "name", "type_id", "geometry"]],
+        ga_gdf.to_crs("EPSG:4326")[
+            ["id", "osm_id", "name", "type_id", "area_m2", "geometry", "geom_3857"]
+            + [f"geometry_{detail}" for detail in SIMPLIFY_TOLERANCES_M]
+        ],
     )
 
 
-def transform_routing_data(json):
-    elements = json.get("elements", [])
-    ways_data = [el for el in elements if el["type"] == "way"]
-    info(f"TRANSFORM: Extracted {len(ways_data)} ways from routing data for further processing")
-    
+def transform_routing_data(data, only_ways=None, vertex_ids=None, first_way_id=1):
+    """
+    Splits the ways of the routing data into segments between intersections.
+    `data` is read twice (node counting, then segmentation), so it must be
+    re-iterable: a decoded response or the OverpassElements of the extract.
+
+    Incremental runs pass `only_ways` (OSM ids of the ways to segment; nodes
+    are still counted over all ways), `vertex_ids` ({OSM node id: vertex id}
+    of the vertices already loaded, which keep their id) and `first_way_id`.
+    The vertices returned are the ones the new segments use.
+    """
+    elements = iter_elements(data)
+
     # 1. Fast Node Counting
-    node_counts = Counter()
-    for way in ways_data:
-        node_counts.update(way.get("nodes", []))
-    info(f"TRANSFORM: Counted node occurrences across {len(ways_data)} ways for intersection detection")
+    with step("count_nodes") as s:
+        node_counts = Counter()
+        n_ways = 0
+        for way in elements:
+            if way["type"] == "way":
+                node_counts.update(way.get("nodes", []))
+                n_ways += 1
+        s.rows = n_ways
+    info(f"TRANSFORM: Counted node occurrences across {n_ways} ways for intersection detection")
 
-    vertex_map = {}  # OSM_node_id -> Internal_integer_id
-    next_vertex_id = 1
-    vertices_records = []
-    way_records = []
+    vertex_map = dict(vertex_ids or {})  # OSM_node_id -> Internal_integer_id
+    next_vertex_id = max(vertex_map.values(), default=0) + 1
+    # Columns instead of per-row dicts and shapely objects, the geometries are built at once below
+    vertex_out_ids, vertex_osm_ids, vertex_x, vertex_y = array("q"), array("q"), array("d"), array("d")
+    emitted = set()
+    way_osm_ids, way_sources, way_targets = array("q"), array("q"), array("q")
+    segment_x, segment_y, segment_sizes = array("d"), array("d"), array("q")
 
     # 2. Process Ways
-    for way in ways_data:
-        nodes = way.get("nodes", [])
-        geometry_list = way.get("geometry", [])
-        if not nodes or not geometry_list:
-            continue
-
-        # Pre-convert geometry_list to list of tuples for speed
-        coords = [(pt["lon"], pt["lat"]) for pt in geometry_list]
-
-        segment_coords = []
-        current_start_node_osm = nodes[0]
-        segment_coords.append(coords[0])
-
-        for i in range(1, len(nodes)):
-            node_osm_id = nodes[i]
-            coord = coords[i]
-            segment_coords.append(coord)
-
-            # Intersection logic
-            is_intersection = node_counts[node_osm_id] > 1
-            is_endpoint = i == len(nodes) - 1
-
-            if is_intersection or is_endpoint:
-                # Handle Vertex Mapping without .index()
-                for osm_id, c_idx in [
-                    (
-                        current_start_node_osm,
+    with step("segment_ways") as s:
+        for way in elements:
+            if way["type"] != "way" or (only_ways is not None and way["id"] not in only_ways):
+                continue
+            nodes = way.get("nodes", [])
+            geometry_list = way.get("geometry", [])
+            if not nodes or not geometry_list:
+                continue
+
+            xs = [pt["lon"] for pt in geometry_list]
+            ys = [pt["lat"] for pt in geometry_list]
+            # A segment covers the way coordinates from segment_start to the current node
+            segment_start = 0
+            current_start_node_osm = nodes[0]
+
+            for i in range(1, len(nodes)):
+                node_osm_id = nodes[i]
+
+                # Intersection logic
+                is_intersection = node_counts[node_osm_id] > 1
+                is_endpoint = i == len(nodes) - 1
+
+                if is_intersection or is_endpoint:
+                    # Handle Vertex Mapping without .index()
+                    for osm_id, c_idx in [
                         (
-                            nodes.index(current_start_node_osm)
-                            if is_endpoint and i == 1
-                            else 0
+                            current_start_node_osm,
+                            (
+                                nodes.index(current_start_node_osm)
+                                if is_endpoint and i == 1
+                                else 0
+                            ),
                         ),
-                    ),
-                    (node_osm_id, i),
-                ]:
-                    # Small optimization: we only need the coordinate at index i or the start index
-                    if osm_id not in vertex_map:
-                        vertex_map[osm_id] = next_vertex_id
-                        vertices_records.append(
-                            {"id": next_vertex_id, "geometry": Point(coords[c_idx])}
-                        )
-                        next_vertex_id += 1
-
-                # Add way record (Distance calculated later)
-                way_records.append(
-                    {
-                        "osm_id": way["id"],
-                        "source": vertex_map[current_start_node_osm],
-                        "target": vertex_map[node_osm_id],
-                        "geometry": LineString(segment_coords),
-                    }
-                )
-                # Reset for next segment
-                segment_coords = [coord]
-                current_start_node_osm = node_osm_id
-    info(f"TRANSFORM: Processed ways to identify {len(vertices_records)} vertices and {len(way_records)} way segments")
+                        (node_osm_id, i),
+                    ]:
+                        # Small optimization: we only need the coordinate at index i or the start index
+                        if osm_id not in vertex_map:
+                            vertex_map[osm_id] = next_vertex_id
+                            next_vertex_id += 1
+                        if osm_id not in emitted:
+                            emitted.add(osm_id)
+                            vertex_out_ids.append(vertex_map[osm_id])
+                            vertex_osm_ids.append(osm_id)
+                            vertex_x.append(xs[c_idx])
+                            vertex_y.append(ys[c_idx])
+
+                    # Add way record (Distance calculated later)
+                    way_osm_ids.append(way["id"])
+                    way_sources.append(vertex_map[current_start_node_osm])
+                    way_targets.append(vertex_map[node_osm_id])
+                    segment_x.extend(xs[segment_start:i + 1])
+                    segment_y.extend(ys[segment_start:i + 1])
+                    segment_sizes.append(i + 1 - segment_start)
+                    # Reset for next segment
+                    segment_start = i
+                    current_start_node_osm = node_osm_id
+        s.rows = len(way_osm_ids)
+    info(f"TRANSFORM: Processed {n_ways} ways to identify {len(vertex_x)} vertices and {len(way_osm_ids)} way segments")
 
     # 3. Vectorized GeoPandas Operations (The Speed Boost)
-    ways_gdf = gpd.GeoDataFrame(way_records, geometry="geometry", crs="EPSG:4326")
-    info(f"TRANSFORM: Created GeoDataFrame for ways with {len(ways_gdf)} records")
+    with step("build_geodataframes", rows=len(way_osm_ids) + len(vertex_x)):
+        segment_coords = np.column_stack([np.frombuffer(segment_x), np.frombuffer(segment_y)])
+        ways_gdf = gpd.GeoDataFrame(
+            {
+                "osm_id": np.frombuffer(way_osm_ids, dtype=np.int64),
+                "source": np.frombuffer(way_sources, dtype=np.int64),
+                "target": np.frombuffer(way_targets, dtype=np.int64),
+            },
+            geometry=shapely.linestrings(
+                segment_coords, indices=np.repeat(np.arange(len(segment_sizes)), segment_sizes)
+            ),
+            crs="EPSG:4326",
+        )
+        # Explicit ids so other tables (e.g. vertices.pred_edge) can refer to ways
+        ways_gdf.insert(0, "id", ways_gdf.index + first_way_id)
+        info(f"TRANSFORM: Created GeoDataFrame for ways with {len(ways_gdf)} records")
 
-    # Calculate all lengths at once (much faster than loop)
-    ways_gdf["length_m"] = ways_gdf.to_crs(epsg=3857).geometry.length
-    ways_gdf["cost"] = ways_gdf["length_m"]
-    ways_gdf["reverse_cost"] = ways_gdf["length_m"]
-    info("TRANSFORM: Calculated lengths and costs for all ways in a vectorized manner")
+        # Calculate all lengths at once (much faster than loop)
+        ways_gdf["length_m"] = ways_gdf.to_crs(epsg=3857).geometry.length
+        ways_gdf["cost"] = ways_gdf["length_m"]
+        ways_gdf["reverse_cost"] = ways_gdf["length_m"]
+        info("TRANSFORM: Calculated lengths and costs for all ways in a vectorized manner")
 
-    vertices_gdf = gpd.GeoDataFrame(
-        vertices_records, geometry="geometry", crs="EPSG:4326"
-    )
-    info(f"TRANSFORM: Created GeoDataFrame for vertices with {len(vertices_gdf)} records")
+        vertices_gdf = gpd.GeoDataFrame(
+            {
+                "id": np.frombuffer(vertex_out_ids, dtype=np.int64),
+                "osm_id": np.frombuffer(vertex_osm_ids, dtype=np.int64),
+            },
+            geometry=shapely.points(np.frombuffer(vertex_x), np.frombuffer(vertex_y)),
+            crs="EPSG:4326",
+        )
+        info(f"TRANSFORM: Created GeoDataFrame for vertices with {len(vertices_gdf)} records")
 
     return ways_gdf, vertices_gdf
 
+
+def transform_nearest_park_data(ga_gdf, ways_gdf, vertices_gdf):
+    """
+    Network distance from every vertex to the nearest green area, computed with a
+    single multi-source Dijkstra seeded from the vertices on or next to a park.
+    Adds `park_distance_m`, `park_id`, `pred_vertex` and `pred_edge` (the way
+    to follow towards the park) to the vertices, and returns the seed vertices
+    of every park as a separate dataframe.
+    """
+    n = len(vertices_gdf)
+    vertex_ids = vertices_gdf["id"].to_numpy()
+    position = pd.Series(np.arange(n), index=vertex_ids)
+
+    # 1. Seeds: vertices within PARK_SEED_DISTANCE_M of a park, each tied to its closest park
+    with step("seed_vertices") as s:
+        vertices_3857 = vertices_gdf.to_crs("EPSG:3857").geometry
+        parks_3857 = gpd.GeoSeries(ga_gdf["geom_3857"]).reset_index(drop=True)
+        v_idx, p_idx = parks_3857.sindex.query(
+            vertices_3857.values, predicate="dwithin", distance=PARK_SEED_DISTANCE_M
+        )
+        park_vertices_df = pd.DataFrame(
+            {
+                "park_id": ga_gdf["id"].to_numpy()[p_idx],
+                "vertex_id": vertex_ids[v_idx],
+                "offset_m": shapely.distance(np.asarray(vertices_3857)[v_idx], np.asarray(parks_3857)[p_idx]),
+            }
+        )
+        seeds = park_vertices_df.sort_values("offset_m").drop_duplicates("vertex_id")
+        info(f"TRANSFORM: Found {len(park_vertices_df)} park access points on {len(seeds)} seed vertices")
+        s.rows = len(seeds)
+
+    # 2. Undirected graph keeping the cheapest of any parallel ways
+    with step("graph_build") as s:
+        u = position[ways_gdf["source"].to_numpy()].to_numpy()
+        v = position[ways_gdf["target"].to_numpy()].to_numpy()
+        lo, hi = np.minimum(u, v), np.maximum(u, v)
+        edges = pd.DataFrame({"lo": lo, "hi": hi, "cost": ways_gdf["cost"].to_numpy(), "way_id": ways_gdf["id"].to_numpy()})
+        edges = edges[edges["lo"] != edges["hi"]].sort_values("cost").drop_duplicates(["lo", "hi"])
+        # Zero-cost ways would be dropped by the sparse matrix, so give them a negligible cost
+        graph = csr_matrix(
+            (np.maximum(edges["cost"].to_numpy(), 1e-9), (edges["lo"].to_numpy(), edges["hi"].to_numpy())),
+            shape=(n, n),
+        )
+        s.rows = len(edges)
+
+    # 3. Multi-source Dijkstra: distance to, and id of, the closest seed for every vertex
+    seed_positions = position[seeds["vertex_id"].to_numpy()].to_numpy()
+    with step("dijkstra", rows=n):
+        dist, pred, source = dijkstra(
+            graph, directed=False, indices=seed_positions, min_only=True, return_predecessors=True
+        )
+        reached = np.isfinite(dist)
+    info(f"TRANSFORM: Computed network distance to the nearest park for {int(reached.sum())} of {n} vertices")
+
+    seed_park = pd.Series(seeds["park_id"].to_numpy(), index=seed_positions)
+    has_pred = pred >= 0
+    edge_lookup = pd.Series(
+        edges["way_id"].to_numpy(),
+        index=pd.MultiIndex.from_arrays([edges["lo"].to_numpy(), edges["hi"].to_numpy()]),
+    )
+    pred_edge = np.full(n, -1, dtype=np.int64)
+    pred_edge[has_pred] = edge_lookup.reindex(
+        pd.MultiIndex.from_arrays([
+            np.minimum(np.arange(n)[has_pred], pred[has_pred]),
+            np.maximum(np.arange(n)[has_pred], pred[has_pred]),
+        ])
+    ).to_numpy()
+
+    vertices_gdf = vertices_gdf.copy()
+    vertices_gdf["park_distance_m"] = np.where(reached, dist, np.nan)
+    vertices_gdf["park_id"] = pd.array(
+        np.where(reached, seed_park.reindex(source).to_numpy(), np.nan), dtype="Int64"
+    )
+    vertices_gdf["pred_vertex"] = pd.array(
+        np.where(has_pred, vertex_ids[np.maximum(pred, 0)], np.nan), dtype="Int64"
+    )
+    vertices_gdf["pred_edge"] = pd.array(np.where(has_pred, pred_edge, np.nan), dtype="Int64")
+
+    return vertices_gdf, park_vertices_df
@@ -0,0 +1,248 @@
+"""
+Deterministic synthetic city in the shape of Overpass `out geom` responses.
+Used to seed benchmark databases and to measure how the transform scales
+without calling the public Overpass server: the same arguments always
+produce the same elements.
+
+Usage: python synthetic.py --scale 4 --out synthetic_data
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+
+# Small area in Lisbon (south, west, north, east), same as the test bbox in src/pipeline/config.py
+DEFAULT_BBOX = (38.72, -9.16, 38.74, -9.14)
+
+# Tags of the generated green areas, all matched by build_overpass_query
+GREEN_AREA_TAGS = [
+    {"leisure": "park"},
+    {"leisure": "garden"},
+    {"leisure": "playground"},
+    {"landuse": "grass"},
+    {"landuse": "forest"},
+    {"natural": "wood"},
+]
+
+HIGHWAY_TYPES = ["residential", "residential", "footway", "service", "primary", "path"]
+
+METRES_PER_DEGREE = 111320.0
+
+
+def _degrees(bbox, metres):
+    # (lat, lon) degrees spanned by `metres` in the middle of the bbox
+    south, _, north, _ = bbox
+    lat = math.radians((south + north) / 2)
+    return metres / METRES_PER_DEGREE, metres / (METRES_PER_DEGREE * math.cos(lat))
+
+
+def scaled_bbox(bbox=DEFAULT_BBOX, scale=1.0):
+    """
+    Grows `bbox` around its centre so its area is `scale` times larger.
+    """
+    south, west, north, east = bbox
+    f = math.sqrt(scale)
+    lat, lon = (south + north) / 2, (west + east) / 2
+    half_lat, half_lon = (north - south) / 2 * f, (east - west) / 2 * f
+    return (lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon)
+
+
+def generate_routing_data(bbox=DEFAULT_BBOX, spacing_m=100, blocks_per_way=4, dead_end_share=0.1, seed=0) -> dict:
+    """
+    Street grid over the bbox with jittered intersections. Ways share their
+    node ids at intersections, like OSM, and span a few blocks each, so most
+    intersections are in the middle of a way. Some dead-end spurs hang off
+    the grid.
+    """
+    rng = random.Random(seed)
+    south, west, north, east = bbox
+    dlat, dlon = _degrees(bbox, spacing_m)
+    n_rows = max(2, int((north - south) / dlat) + 1)
+    n_cols = max(2, int((east - west) / dlon) + 1)
+
+    nodes = {}
+    for r in range(n_rows):
+        for c in range(n_cols):
+            nodes[(r, c)] = (
+                r * n_cols + c + 1,
+                south + r * dlat + rng.uniform(-0.15, 0.15) * dlat,
+                west + c * dlon + rng.uniform(-0.15, 0.15) * dlon,
+            )
+
+    lines = [[(r, c) for c in range(n_cols)] for r in range(n_rows)]
+    lines += [[(r, c) for r in range(n_rows)] for c in range(n_cols)]
+
+    elements = []
+    for line in lines:
+        for start in range(0, len(line) - 1, blocks_per_way):
+            cells = line[start:start + blocks_per_way + 1]
+            elements.append({
+                "type": "way",
+                "id": len(elements) + 1,
+                "nodes": [nodes[cell][0] for cell in cells],
+                "geometry": [{"lat": nodes[cell][1], "lon": nodes[cell][2]} for cell in cells],
+                "tags": {"highway": rng.choice(HIGHWAY_TYPES)},
+            })
+
+    # Dead ends: two new nodes (never shared) off a grid node, half a block long
+    next_node = len(nodes) + 1
+    for cell in rng.sample(sorted(nodes), int(len(nodes) * dead_end_share)):
+        node_id, lat, lon = nodes[cell]
+        angle = rng.uniform(0, 2 * math.pi)
+        path = [(node_id, lat, lon)]
+        for step in (1, 2):
+            path.append((next_node, lat + dlat / 4 * step * math.sin(angle), lon + dlon / 4 * step * math.cos(angle)))
+            next_node += 1
+        elements.append({
+            "type": "way",
+            "id": len(elements) + 1,
+            "nodes": [n for n, _, _ in path],
+            "geometry": [{"lat": la, "lon": lo} for _, la, lo in path],
+            "tags": {"highway": "footway"},
+        })
+    return {"elements": elements}
+
+
+def _polygon(rng, lat, lon, radius_lat, radius_lon, n_vertices):
+    # Star-shaped ring around (lat, lon), closed like Overpass way geometries
+    angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(n_vertices))
+    ring = []
+    for angle in angles:
+        scale = rng.uniform(0.6, 1.0)
+        ring.append({
+            "lat": lat + radius_lat * scale * math.sin(angle),
+            "lon": lon + radius_lon * scale * math.cos(angle),
+        })
+    return ring + [ring[0]]
+
+
+def _rectangle(south, west, north, east):
+    ring = [(south, west), (south, east), (north, east), (north, west), (south, west)]
+    return [{"lat": lat, "lon": lon} for lat, lon in ring]
+
+
+def generate_green_areas_data(bbox=DEFAULT_BBOX, n_areas=200, min_radius_m=20, max_radius_m=250,
+                              named_share=0.6, overlap_share=0.15, adjacent_share=0.1,
+                              relation_share=0.1, seed=0) -> dict:
+    """
+    Green areas of mixed types and sizes, covering the cases the transform
+    has to handle:
+    - plain closed ways,
+    - multipolygon relations whose members carry their own `out geom` rings
+      (several outers, sometimes an inner),
+    - areas overlapping another one (e.g. a playground inside a park),
+    - pairs of rectangles a few metres apart, named alike so the semantic
+      merge joins them.
+    The `*_share` arguments are fractions of `n_areas`.
+    """
+    rng = random.Random(seed)
+    south, west, north, east = bbox
+    elements = []
+    ids = itertools.count(1)
+
+    def tags_for(i, named=None):
+        tags = dict(rng.choice(GREEN_AREA_TAGS))
+        if named if named is not None else rng.random() < named_share:
+            tags["name"] = f"Synthetic Park {i}"
+        return tags
+
+    def random_ring(lat=None, lon=None, radius_m=None):
+        radius_lat, radius_lon = _degrees(bbox, radius_m or rng.uniform(min_radius_m, max_radius_m))
+        lat = rng.uniform(south, north) if lat is None else lat
+        lon = rng.uniform(west, east) if lon is None else lon
+        return _polygon(rng, lat, lon, radius_lat, radius_lon, rng.randint(5, 12)), (lat, lon, radius_lat, radius_lon)
+
+    n_relations = int(n_areas * relation_share)
+    n_overlaps = int(n_areas * overlap_share)
+    n_pairs = int(n_areas * adjacent_share) // 2
+    n_plain = max(0, n_areas - n_relations - n_overlaps - 2 * n_pairs)
+
+    plain = []
+    for _ in range(n_plain):
+        ring, shape = random_ring()
+        plain.append(shape)
+        elements.append({"type": "way", "id": next(ids), "geometry": ring, "tags": tags_for(len(elements) + 1)})
+
+    for _ in range(n_overlaps):
+        # Smaller area centred inside (and usually spilling out of) an existing one
+        lat, lon, radius_lat, _ = rng.choice(plain) if plain else random_ring()[1]
+        ring, _ = random_ring(lat + rng.uniform(-0.5, 0.5) * radius_lat, lon,
+                              radius_m=rng.uniform(0.3, 0.8) * radius_lat * METRES_PER_DEGREE)
+        elements.append({"type": "way", "id": next(ids), "geometry": ring, "tags": tags_for(len(elements) + 1)})
+
+    for _ in range(n_pairs):
+        # Two rectangles separated by a gap narrower than the merge tolerance
+        width_lat, width_lon = _degrees(bbox, rng.uniform(min_radius_m, max_radius_m))
+        gap_lon = _degrees(bbox, rng.uniform(0.5, 2.5))[1]
+        s, w = rng.uniform(south, north), rng.uniform(west, east)
+        tags = tags_for(len(elements) + 1, named=True)
+        for left in (w, w + width_lon + gap_lon):
+            elements.append({
+                "type": "way",
+                "id": next(ids),
+                "geometry": _rectangle(s, left, s + width_lat, left + width_lon),
+                "tags": dict(tags),
+            })
+
+    for _ in range(n_relations):
+        members = []
+        lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+        for _ in range(rng.randint(2, 4)):
+            ring, (c_lat, c_lon, r_lat, r_lon) = random_ring(
+                lat + rng.uniform(-1, 1) * _degrees(bbox, max_radius_m)[0],
+                lon + rng.uniform(-1, 1) * _degrees(bbox, max_radius_m)[1],
+            )
+            members.append({"type": "way", "ref": next(ids), "role": "outer", "geometry": ring})
+            if rng.random() < 0.3:
+                hole = _polygon(rng, c_lat, c_lon, r_lat * 0.2, r_lon * 0.2, 5)
+                members.append({"type": "way", "ref": next(ids), "role": "inner", "geometry": hole})
+        tags = tags_for(len(elements) + 1)
+        tags["type"] = "multipolygon"
+        elements.append({"type": "relation", "id": next(ids), "members": members, "tags": tags})
+
+    return {"elements": elements}
+
+
+def generate_city(bbox=DEFAULT_BBOX, n_areas=200, spacing_m=100, seed=0):
+    """
+    Returns (green_areas_data, routing_data), the two raw inputs of the ETL transform.
+    """
+    return (
+        generate_green_areas_data(bbox, n_areas=n_areas, seed=seed),
+        generate_routing_data(bbox, spacing_m=spacing_m, seed=seed),
+    )
+
+
+def generate_scaled_city(scale=1.0, areas_per_km2=40, spacing_m=100, seed=0):
+    """
+    City `scale` times the area of DEFAULT_BBOX, keeping the density of
+    green areas and streets constant. Returns (bbox, green_areas_data, routing_data).
+    """
+    bbox = scaled_bbox(DEFAULT_BBOX, scale)
+    height_lat, width_lon = _degrees(bbox, 1000)
+    area_km2 = (bbox[2] - bbox[0]) / height_lat * (bbox[3] - bbox[1]) / width_lon
+    return (bbox, *generate_city(bbox, n_areas=max(1, round(area_km2 * areas_per_km2)), spacing_m=spacing_m, seed=seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic city as Overpass-shaped JSON")
+    parser.add_argument("--scale", type=float, default=1.0, help="area as a multiple of the default bbox")
+    parser.add_argument("--areas-per-km2", type=float, default=40)
+    parser.add_argument("--spacing", type=float, default=100, help="street grid spacing in metres")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="synthetic_data", help="output directory")
+    args = parser.parse_args()
+
+    bbox, green_areas_data, routing_data = generate_scaled_city(args.scale, args.areas_per_km2, args.spacing, args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    for name, data in (("green_areas.json", green_areas_data), ("routing.json", routing_data)):
+        with open(os.path.join(args.out, name), "w") as f:
+            json.dump(data, f)
+    print(f"bbox {bbox}: {len(green_areas_data['elements'])} green area and "
+          f"{len(routing_data['elements'])} routing elements written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -270,7 +270,7 @@ function getScore() {
 
     // // for testing with local JSON file
     // fetch(API_BASE_URL)
-    fetch(API_BASE_URL + `/api/v1/accessibility/accessibility-score?lat=${lat}&lon=${lon}&buffer_m=500`)
+    fetch(API_BASE_URL + `/api/v1/accessibility/accessibility-score?lat=${lat}&lon=${lon}&buffer_m=500&include_route=true`)
         .then(res => res.json())
         .then(data => {
 
@@ -0,0 +1,9 @@
+# The ETL is run from its own folder (python ETL/main.py) and imports its modules as `src.`,
+# the API as `API.` from the repository root: make both importable for the tests
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, "ETL")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
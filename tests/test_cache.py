@@ -0,0 +1,27 @@
+# Version handling of the API result cache
+import asyncio
+
+from API import cache
+from API.cache import ResultCache
+
+
+def test_late_set_for_previous_version_is_dropped(monkeypatch):
+    async def no_changes(old, new):
+        return None
+    monkeypatch.setattr(cache, "dataset_changes", no_changes)
+
+    async def run():
+        result_cache = ResultCache()
+        await result_cache.advance("v1")
+        result_cache.set("a", "v1", b"1")
+        await result_cache.advance("v2")
+        # A request that started under v1 finishes after the move
+        result_cache.set("b", "v1", b"2")
+        assert result_cache.version == "v2"
+        assert result_cache.get("b", "v2") is ResultCache.MISSING
+        assert result_cache.get("a", "v1") is ResultCache.MISSING
+        result_cache.set("c", "v2", b"3")
+        assert result_cache.get("c", "v2") == b"3"
+        assert result_cache.version == "v2"
+
+    asyncio.run(run())
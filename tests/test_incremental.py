@@ -0,0 +1,38 @@
+# Id reuse of the incremental green area and routing updates
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import box
+
+from src.pipeline.incremental import reuse_ids, reuse_way_ids
+
+
+def green_areas(osm_ids, geometries, ids=None):
+    gdf = gpd.GeoDataFrame({"osm_id": osm_ids}, geometry=geometries, crs="EPSG:3857")
+    if ids is not None:
+        gdf.insert(0, "id", ids)
+    else:
+        gdf["geom_3857"] = gdf.geometry.copy()
+    return gdf
+
+
+def test_reuse_ids_matches_by_overlap_not_osm_id():
+    previous = green_areas([100, 100, 200], [box(0, 0, 1, 1), box(5, 5, 6, 6), box(10, 10, 11, 11)], ids=[5, 6, 7])
+    # osm_id of a recomputed row is the first element of its dissolve group, it can change
+    rows = green_areas(
+        [300, 300, 100, 100],
+        [box(0, 0, 1, 1), box(5, 5, 6.5, 6), box(10, 10, 11, 11), box(30, 30, 31, 31)],
+    )
+    assert reuse_ids(previous, rows, 10).tolist() == [5, 6, 7, 10]
+
+
+def test_reuse_ids_breaks_ties_by_osm_id():
+    previous = green_areas([1, 2], [box(0, 0, 1, 1), box(1, 0, 2, 1)], ids=[5, 6])
+    rows = green_areas([2, 3], [box(0, 0, 2, 1), box(50, 50, 51, 51)])
+    assert reuse_ids(previous, rows, 10).tolist() == [6, 10]
+
+
+def test_reuse_way_ids_keeps_segments_between_the_same_vertices():
+    previous = pd.DataFrame({"id": [1, 2, 3], "osm_id": [10, 10, 11], "source": [1, 2, 5], "target": [2, 3, 6]})
+    # Way 10 split at a new vertex 4 between 2 and 3, way 11 unchanged, way 12 new
+    ways = pd.DataFrame({"osm_id": [10, 10, 10, 11, 12], "source": [1, 2, 4, 5, 6], "target": [2, 4, 3, 6, 7]})
+    assert reuse_way_ids(previous, ways, 20).tolist() == [1, 20, 21, 3, 22]
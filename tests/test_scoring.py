@@ -0,0 +1,78 @@
+# The vectorized kernels of API/scoring.py against the per-park scoring they replaced
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from API.scoring import AREA_SATURATION, INSIDE_THRESHOLD, WEIGHTS, encode_types, score_points
+
+
+def reference_score(parks, buffer_m):
+    # Original per-park loop; parks are (type, area_m2, distance_m)
+    if not parks:
+        return {"accessibility_score": 0.0, "proximity": 0.0, "quantity": 0.0, "area": 0.0, "diversity": 0.0}
+
+    if min(p[2] for p in parks) <= INSIDE_THRESHOLD:
+        proximity = 10
+    else:
+        proximity = sum(max(0, 1 - p[2] / buffer_m) for p in parks) / len(parks) * 10
+    quantity = (1 - math.exp(-len(parks) / 5)) * 10
+    area = min(1, sum(p[1] for p in parks) / AREA_SATURATION) * 10
+
+    types = [p[0] for p in parks if p[0] is not None]
+    counts = Counter(types)
+    # The original divided by log(1) for several parks of a single type: no diversity
+    if len(types) <= 1 or len(counts) == 1:
+        diversity = 0
+    else:
+        total = sum(counts.values())
+        entropy = -sum(c / total * math.log(c / total) for c in counts.values())
+        diversity = entropy / math.log(len(counts)) * 10
+
+    return {
+        "accessibility_score": (
+            WEIGHTS["proximity"] * proximity + WEIGHTS["area"] * area
+            + WEIGHTS["quantity"] * quantity + WEIGHTS["diversity"] * diversity
+        ),
+        "proximity": proximity,
+        "quantity": quantity,
+        "area": area,
+        "diversity": diversity,
+    }
+
+
+POINTS = [
+    [],
+    [("park", 12000.0, 5.0)],
+    [("park", 12000.0, 120.0), ("garden", 800.0, 300.0), (None, 4000.0, 499.0)],
+    [("park", 30000.0, 50.0), ("park", 30000.0, 450.0)],
+    [("playground", 300.0, 600.0), ("garden", 1500.0, 20.0), ("park", 90000.0, 250.0), ("garden", 200.0, 10.0)],
+    [(None, 100.0, 80.0), (None, 200.0, 90.0)],
+]
+
+
+@pytest.mark.parametrize("buffer_m", [300.0, 500.0])
+def test_score_points_matches_per_park_scoring(buffer_m):
+    point_idx = [i for i, parks in enumerate(POINTS) for _ in parks]
+    parks = [p for parks in POINTS for p in parks]
+    scores = score_points(
+        len(POINTS),
+        point_idx,
+        [p[2] for p in parks],
+        [p[1] for p in parks],
+        encode_types([p[0] for p in parks]),
+        buffer_m,
+    )
+
+    for i, point_parks in enumerate(POINTS):
+        expected = reference_score(point_parks, buffer_m)
+        for name, value in expected.items():
+            assert scores[name][i] == pytest.approx(value, abs=1e-9), (i, name)
+        assert scores["parks_found"][i] == len(point_parks)
+
+
+def test_score_points_without_candidates():
+    scores = score_points(3, [], [], [], np.array([], dtype=np.int64), 500.0)
+    assert scores["accessibility_score"].tolist() == [0.0, 0.0, 0.0]
+    assert scores["parks_found"].tolist() == [0, 0, 0]
@@ -0,0 +1,60 @@
+# Bulk cookie-cutter of the green areas transform against the sequential loop it replaced
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box, Point
+
+import synthetic
+from src.pipeline import cut_overlaps, parse_green_areas
+
+# Largest area (m2) two cuts of the same geometry may differ by (GEOS rounding)
+TOLERANCE_M2 = 1e-3
+
+
+def cut_overlaps_loop(geometries):
+    # Original implementation: every area cuts itself out of the lower-priority ones, one by one
+    geoms = geometries.values.copy()
+    sindex = geometries.sindex
+    for i in range(len(geoms)):
+        current = geoms[i]
+        if current is None or current.is_empty:
+            continue
+        for j in sindex.intersection(current.bounds):
+            if j > i and geoms[j] is not None and current.intersects(geoms[j]):
+                geoms[j] = geoms[j].difference(current)
+    return np.asarray(geoms)
+
+
+def assert_same_cut(geometries):
+    expected = cut_overlaps_loop(geometries)
+    result = cut_overlaps(geometries)
+    assert len(result) == len(expected)
+    assert shapely.area(shapely.symmetric_difference(result, expected)).max() < TOLERANCE_M2
+
+
+def test_cut_overlaps_matches_loop_on_nested_areas():
+    geometries = gpd.GeoSeries(
+        [
+            box(0, 0, 100, 100),
+            Point(100, 50).buffer(30),
+            box(50, 50, 150, 150),
+            box(60, 60, 70, 70),   # inside two higher-priority areas
+            box(300, 300, 310, 310),  # overlaps nothing
+        ],
+        crs="EPSG:3857",
+    )
+    assert_same_cut(geometries)
+    assert cut_overlaps(geometries)[3].is_empty
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_cut_overlaps_matches_loop_on_synthetic_city(seed):
+    _, green_areas, _ = synthetic.generate_scaled_city(1, 40, 100, seed)
+    ga_gdf = parse_green_areas(green_areas)
+    ga_gdf = ga_gdf[ga_gdf.is_valid].copy()
+    # Same priority order as transform_green_areas_data
+    ga_gdf["area"] = ga_gdf.geometry.area
+    ga_gdf["is_named"] = ga_gdf["name"] != "Unnamed"
+    ga_gdf = ga_gdf.sort_values(by=["is_named", "area"], ascending=[False, True]).reset_index(drop=True)
+    assert_same_cut(ga_gdf.geometry)